@@ -1,13 +1,18 @@
 from __future__ import annotations
 
-from typing import Optional, Tuple, TYPE_CHECKING
+from enum import auto, IntEnum
+from typing import Any, Callable, Dict, Optional, Tuple, TYPE_CHECKING
 
+import awareness
 import color
+from entity import Actor
+import events
 import exceptions
+import tile_types
 
 if TYPE_CHECKING:
     from engine import Engine
-    from entity import Actor, Entity, Item
+    from entity import Entity, Item
     
 class Action:
     def __init__(self, entity: Actor) -> None:
@@ -32,23 +37,7 @@ class PickupAction(Action):
         super().__init__(entity)
     
     def perform(self) -> None:
-        actor_location_x = self.entity.x
-        actor_location_y = self.entity.y
-        inventory = self.entity.inventory
-        
-        for item in self.engine.game_map.items:
-            if actor_location_x == item.x and actor_location_y == item.y:
-                if len(inventory.items) >= inventory.capacity:
-                    raise exceptions.Impossible("Your inventory is full.")
-                
-                self.engine.game_map.entities.remove(item)
-                item.parent = self.entity.inventory
-                inventory.items.append(item)
-                
-                self.engine.message_log.add_message(f"You picked up the {item.name}!")
-                return
-        
-        raise exceptions.Impossible("There is nothing here to pick up.")
+        pick_up(self.engine, self.entity)
 
 class ItemAction(Action):
     def __init__(
@@ -92,14 +81,11 @@ class WaitAction(Action):
 
 class TakeStairsAction(Action):
     def perform(self) -> None:
-        """Take the stairs, if any exist at the entity's location."""
-        if (self.entity.x, self.entity.y) == self.engine.game_map.downstairs_location:
-            self.engine.game_world.generate_floor()
-            self.engine.message_log.add_message(
-                "You descend the staircase.", color.descend
-            )
-        else:
-            raise exceptions.Impossible("There are no stairs here.")
+        descend(self.engine, self.entity)
+
+class TakeUpStairsAction(Action):
+    def perform(self) -> None:
+        ascend(self.engine, self.entity)
 
 class ActionWithDirection(Action):
     def __init__(self, entity: Actor, dx: int, dy: int):
@@ -126,48 +112,212 @@ class ActionWithDirection(Action):
     def perform(self) -> None:
         raise NotImplementedError()
 
+def melee_damage(power: int, defense: int) -> int:
+    """Return the damage a melee attack deals. Zero or less means the attack does no damage.
+    This also works elementwise on NumPy arrays, which the combat simulator relies on."""
+    return power - defense
+
 class MeleeAction(ActionWithDirection):
     def perform(self) -> None:
-        target = self.target_actor
-        if not target:
-            raise exceptions.Impossible("Nothing to attack.")
-        
-        damage = self.entity.fighter.power - target.fighter.defense
-        
-        attack_desc = f"{self.entity.name.capitalize()} attacks {target.name}"
-        if self.entity is self.engine.player:
-            attack_color = color.player_atk
-        else: attack_color = color.enemy_atk
-        
-        if damage > 0:
-            self.engine.message_log.add_message(
-                f"{attack_desc} for {damage} hit points.", attack_color
-            )
-            target.fighter.hp -= damage
-        else:
-            self.engine.message_log.add_message(
-                f"{attack_desc} but does no damage.", attack_color
-            )
+        melee(self.engine, self.entity, self.dx, self.dy)
 
 class MovementAction(ActionWithDirection):    
     def perform(self) -> None:
-        dest_x, dest_y = self.dest_xy
-        
-        if not self.engine.game_map.in_bounds(dest_x, dest_y):
-            # Destination is out of bounds.
-            raise exceptions.Impossible("That way is blocked.")
-        if not self.engine.game_map.tiles["walkable"][dest_x, dest_y]:
-            # Destination is blocked by a tile.
-            raise exceptions.Impossible("That way is blocked.")
-        if self.engine.game_map.get_blocking_entity_at_location(dest_x, dest_y):
-            # Destination is blocked by an entity.
-            raise exceptions.Impossible("That way is blocked.")
-        
-        self.entity.move(self.dx, self.dy)
+        move(self.engine, self.entity, self.dx, self.dy)
 
 class BumpAction(ActionWithDirection):
     def perform(self) -> None:
-        if self.target_actor:
-            return MeleeAction(self.entity, self.dx, self.dy).perform()
+        bump(self.engine, self.entity, self.dx, self.dy)
+
+# The rules behind the actions above, as plain functions of (engine, entity, dx, dy).
+# The AI and headless simulations call these directly, or through `perform_op`, so that a
+# monster's turn doesn't create Action objects or scan the map's entities more than once.
+
+def melee(engine: Engine, entity: Actor, dx: int, dy: int, target: Optional[Actor] = None) -> None:
+    """Attack the actor at (dx, dy) from `entity`. Pass `target` when it is already known, to skip looking it up."""
+    if target is None:
+        target = engine.game_map.get_actor_at_location(entity.x + dx, entity.y + dy)
+    if not target or not target.is_alive:
+        raise exceptions.Impossible("Nothing to attack.")
+    
+    damage = melee_damage(entity.fighter.power, target.fighter.defense)
+    engine.events.publish(
+        events.Attacked(entity.entity_id, target.entity_id, damage)
+    )
+    
+    attack_desc = f"{entity.name.capitalize()} attacks {target.name}"
+    if entity is engine.player:
+        attack_color = color.player_atk
+        # Fighting is loud, so monsters nearby come to see what is going on.
+        engine.game_map.awareness.make_noise(target.x, target.y, awareness.COMBAT_NOISE)
+    else: attack_color = color.enemy_atk
+    
+    if damage > 0:
+        engine.message_log.add_message(
+            f"{attack_desc} for {damage} hit points.", attack_color
+        )
+        target.fighter.hp -= damage
+    else:
+        engine.message_log.add_message(
+            f"{attack_desc} but does no damage.", attack_color
+        )
+
+def move(engine: Engine, entity: Actor, dx: int, dy: int, check_entities: bool = True) -> None:
+    """Move `entity` by (dx, dy) if the destination is free.
+    `check_entities` can be False when the caller has already found no entity blocks the way."""
+    game_map = engine.game_map
+    dest_x, dest_y = entity.x + dx, entity.y + dy
+    
+    if not game_map.in_bounds(dest_x, dest_y):
+        # Destination is out of bounds.
+        raise exceptions.Impossible("That way is blocked.")
+    if not tile_types.walkable[game_map.tiles[dest_x, dest_y]]:
+        # Destination is blocked by a tile.
+        raise exceptions.Impossible("That way is blocked.")
+    if check_entities and game_map.get_blocking_entity_at_location(dest_x, dest_y):
+        # Destination is blocked by an entity.
+        raise exceptions.Impossible("That way is blocked.")
+    
+    entity.move(dx, dy)
+
+def bump(engine: Engine, entity: Actor, dx: int, dy: int) -> None:
+    """Attack the actor at (dx, dy), or move there if there is none."""
+    # Living actors always block movement, so one scan for a blocking entity finds any target too.
+    blocker = engine.game_map.get_blocking_entity_at_location(entity.x + dx, entity.y + dy)
+    if isinstance(blocker, Actor) and blocker.is_alive:
+        return melee(engine, entity, dx, dy, blocker)
+    if blocker is not None:
+        raise exceptions.Impossible("That way is blocked.")
+    return move(engine, entity, dx, dy, check_entities=False)
+
+def wait(engine: Engine, entity: Actor, dx: int = 0, dy: int = 0) -> None:
+    pass
+
+def pick_up(engine: Engine, entity: Actor, dx: int = 0, dy: int = 0) -> None:
+    """Pick up an item at the entity's location, if there is room for it."""
+    inventory = entity.inventory
+    
+    # Sorted so that which of several items on a tile is picked up doesn't depend on set order.
+    for item in sorted(engine.game_map.items, key=lambda item: (item.name, item.stack)):
+        if entity.x == item.x and entity.y == item.y:
+            if not inventory.can_hold(item):
+                raise exceptions.Impossible("Your inventory is full.")
+            
+            engine.game_map.entities.remove(item)
+            inventory.add(item)
+            engine.events.publish(events.PickedUp(entity.entity_id, item.entity_id))
+            
+            engine.message_log.add_message(f"You picked up the {item.name}!")
+            return
+    
+    raise exceptions.Impossible("There is nothing here to pick up.")
+
+def descend(engine: Engine, entity: Actor, dx: int = 0, dy: int = 0) -> None:
+    """Take the stairs, if any exist at the entity's location."""
+    if (entity.x, entity.y) == engine.game_map.downstairs_location:
+        engine.game_world.descend()
+        engine.message_log.add_message(
+            "You descend the staircase.", color.descend
+        )
+    else:
+        raise exceptions.Impossible("There are no stairs here.")
+
+def ascend(engine: Engine, entity: Actor, dx: int = 0, dy: int = 0) -> None:
+    """Take the up stairs, if any exist at the entity's location."""
+    if (entity.x, entity.y) == engine.game_map.upstairs_location:
+        engine.game_world.ascend()
+        engine.message_log.add_message(
+            "You ascend the staircase.", color.descend
+        )
+    else:
+        raise exceptions.Impossible("There are no up stairs here.")
+
+class Op(IntEnum):
+    """Opcodes for the actions which need no item or target.
+    An action is then the tuple (op, dx, dy), which simulations can keep as constants and reuse."""
+    WAIT = auto()
+    MOVE = auto()
+    MELEE = auto()
+    BUMP = auto()
+    PICKUP = auto()
+    DESCEND = auto()
+    ASCEND = auto()
+
+OPERATIONS: Dict[Op, Callable[[Engine, Actor, int, int], None]] = {
+    Op.WAIT: wait,
+    Op.MOVE: move,
+    Op.MELEE: melee,
+    Op.BUMP: bump,
+    Op.PICKUP: pick_up,
+    Op.DESCEND: descend,
+    Op.ASCEND: ascend,
+}
+
+def perform_op(engine: Engine, entity: Actor, op: Op, dx: int = 0, dy: int = 0) -> None:
+    """Carry out the action `op` for `entity`, raising exceptions.Impossible like Action.perform."""
+    OPERATIONS[op](engine, entity, dx, dy)
+
+def action_to_spec(action: Action) -> Dict[str, Any]:
+    """Describe one of the player's actions as a JSON-compatible dict, for recordings and the server.
+    Items are referred to by their index in the player's inventory."""
+    if isinstance(action, BumpAction):
+        return {"type": "move", "dx": action.dx, "dy": action.dy}
+    if isinstance(action, MeleeAction):
+        return {"type": "melee", "dx": action.dx, "dy": action.dy}
+    if isinstance(action, MovementAction):
+        return {"type": "step", "dx": action.dx, "dy": action.dy}
+    if isinstance(action, WaitAction):
+        return {"type": "wait"}
+    if isinstance(action, PickupAction):
+        return {"type": "pickup"}
+    if isinstance(action, TakeStairsAction):
+        return {"type": "descend"}
+    if isinstance(action, TakeUpStairsAction):
+        return {"type": "ascend"}
+    if isinstance(action, (DropItem, EquipAction, ItemAction)):
+        spec: Dict[str, Any] = {"item": action.entity.inventory.items.index(action.item)}
+        if isinstance(action, DropItem):
+            spec["type"] = "drop"
+        elif isinstance(action, EquipAction):
+            spec["type"] = "equip"
         else:
-            return MovementAction(self.entity, self.dx, self.dy).perform()
\ No newline at end of file
+            spec["type"] = "use"
+            spec["target"] = list(action.target_xy)
+        return spec
+    raise ValueError(f"{type(action).__name__} can't be described.")
+
+def action_from_spec(entity: Actor, spec: Dict[str, Any]) -> Action:
+    """Build an action from a description made by `action_to_spec`.
+    A "use" without a target equips equippable items, and raises ValueError for items that need a target."""
+    kind = spec.get("type")
+    if kind == "move":
+        return BumpAction(entity, int(spec["dx"]), int(spec["dy"]))
+    if kind == "melee":
+        return MeleeAction(entity, int(spec["dx"]), int(spec["dy"]))
+    if kind == "step":
+        return MovementAction(entity, int(spec["dx"]), int(spec["dy"]))
+    if kind == "wait":
+        return WaitAction(entity)
+    if kind == "pickup":
+        return PickupAction(entity)
+    if kind == "descend":
+        return TakeStairsAction(entity)
+    if kind == "ascend":
+        return TakeUpStairsAction(entity)
+    if kind in ("use", "equip", "drop"):
+        try:
+            item = entity.inventory.items[int(spec["item"])]
+        except (IndexError, KeyError, ValueError):
+            raise ValueError("No such inventory item.")
+        if kind == "drop":
+            return DropItem(entity, item)
+        if kind == "equip" or item.equippable:
+            return EquipAction(entity, item)
+        if "target" in spec:
+            x, y = spec["target"]
+            return ItemAction(entity, item, (int(x), int(y)))
+        action = item.consumable.get_action(entity) if item.consumable else None
+        if not isinstance(action, Action):
+            raise ValueError("This item needs a target.")
+        return action
+    raise ValueError(f"Unknown action type: {kind!r}")
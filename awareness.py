@@ -0,0 +1,232 @@
+"""Monster perception of the player by sight, sound and scent, computed for every monster at once.
+
+Before the monsters act, Awareness.update builds three maps for the floor:
+- sight: a symmetric shadowcast FOV from the player. With a symmetric FOV, a monster standing on a
+  cell the player can see can also see the player, so one FOV answers the question for every monster.
+- noise: how far the player's footsteps and fights carry, spread by walking distance around walls.
+- scent: a trail the player leaves behind, which fades by one every turn.
+Each monster then looks up its own cell in these maps. That is an array lookup per monster rather than an FOV.
+
+Usage: python awareness.py --monsters 400 --turns 200
+"""
+from __future__ import annotations
+
+import argparse
+from enum import auto, Enum
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+import numpy as np # type: ignore
+import tcod
+
+from chunked_grid import ChunkedGrid, Window
+
+if TYPE_CHECKING:
+    from entity import Actor
+    from game_map import GameMap
+    from line_of_sight import FieldOfView
+
+SIGHT_RADIUS = 8
+FOOTSTEP_NOISE = 3 # Footsteps carry this many steps.
+COMBAT_NOISE = 8
+SCENT_STRENGTH = 20 # The number of turns a trail lasts.
+
+# The eight directions a monster can step in, as parallel arrays.
+STEP_DX = np.array([-1, 0, 1, -1, 1, -1, 0, 1])
+STEP_DY = np.array([-1, -1, -1, 0, 0, 1, 1, 1])
+
+class Sense(Enum):
+    NONE = auto()
+    SIGHT = auto()
+    SOUND = auto()
+    SCENT = auto()
+
+class Awareness:
+    """What the monsters on one floor know about the player this turn."""
+    def __init__(self, game_map: GameMap):
+        self.game_map = game_map
+        self.turn = 0
+        # The turn the player last stood on each cell. Cells never visited read as long enough ago to have no scent.
+        self.last_visit = ChunkedGrid((game_map.width, game_map.height), np.int32, fill=-SCENT_STRENGTH)
+        self.noise_sources: List[Tuple[int, int, int]] = []
+        self._clear()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # The scent trail builds up over many turns, so it is saved. Everything else is rebuilt next turn.
+        return {
+            "game_map": self.game_map,
+            "turn": self.turn,
+            "last_visit": self.last_visit,
+            "noise_sources": self.noise_sources,
+        }
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        if "last_visit" not in state:
+            # Saves from before maps were chunked kept a dense scent array, which is dropped.
+            self.__dict__.pop("scent", None)
+            self.turn = 0
+            self.last_visit = ChunkedGrid(
+                (self.game_map.width, self.game_map.height), np.int32, fill=-SCENT_STRENGTH
+            )
+        self._clear()
+
+    def _clear(self) -> None:
+        self.sight: Optional[FieldOfView] = None
+        self.noise_window = Window(0, 0, 0, 0)
+        self.noise = np.zeros((0, 0), dtype=np.int32)
+        self._noise_key: Optional[Tuple[Tuple[int, int, int], ...]] = None
+        self.senses: Dict[Actor, Tuple[Sense, Optional[Tuple[int, int]]]] = {}
+
+    def make_noise(self, x: int, y: int, loudness: int) -> None:
+        """Make a noise at (x, y) which monsters within `loudness` steps will hear next turn."""
+        self.noise_sources.append((x, y, loudness))
+
+    def update(self, player: Actor) -> None:
+        """Rebuild the sight, noise and scent maps around the player's current position."""
+        origin = (player.x, player.y)
+        self.sight = self.game_map.line_of_sight.visible_from(
+            origin, SIGHT_RADIUS, algorithm=tcod.constants.FOV_SYMMETRIC_SHADOWCAST
+        )
+
+        sources = tuple(self.noise_sources) + ((player.x, player.y, FOOTSTEP_NOISE),)
+        self.noise_sources = []
+        if sources != self._noise_key:
+            # Standing still with nothing else going on makes the same noise as last turn.
+            self.noise_window, self.noise = self._spread_noise(sources)
+            self._noise_key = sources
+
+        self.turn += 1
+        self.last_visit[origin] = self.turn
+        self.senses = {}
+
+    def _spread_noise(self, sources: Sequence[Tuple[int, int, int]]) -> Tuple[Window, np.ndarray]:
+        """Return how many more steps the loudest noise reaching each cell would carry, 0 where it isn't heard.
+        Only the window the noises can reach is computed, so this costs the same on any size of map."""
+        loudest = max(loudness for _, _, loudness in sources)
+        window = Window.bounding(
+            min(x for x, _, _ in sources) - loudest,
+            min(y for _, y, _ in sources) - loudest,
+            max(x for x, _, _ in sources) + loudest,
+            max(y for _, y, _ in sources) + loudest,
+            self.game_map.width,
+            self.game_map.height,
+        )
+        distance = tcod.path.maxarray((window.width, window.height), order="F")
+        for x, y, loudness in sources:
+            distance[x - window.x, y - window.y] = min(distance[x - window.x, y - window.y], loudest - loudness)
+        tcod.path.dijkstra2d(
+            distance, self.game_map.walkable_in(window).astype(np.int8), cardinal=1, diagonal=1, out=distance
+        )
+        return window, np.clip(loudest - distance, 0, None).astype(np.int32)
+
+    def noise_at(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        return self.noise_window.lookup(self.noise, xs, ys)
+
+    def scent_at(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Return how strong the player's scent is at each (x, y), which fades by one every turn."""
+        age = self.turn - self.last_visit[xs, ys].astype(np.int64)
+        return np.clip(SCENT_STRENGTH - age, 0, None)
+
+    def perceive(self, actors: Sequence[Actor]) -> None:
+        """Work out how each of `actors` perceives the player, in one pass over all of them.
+        A monster that hears or smells the player, but can't see them, is also given a step toward the sound or along the trail."""
+        if not actors:
+            return
+        assert self.sight is not None
+        xs = np.fromiter((actor.x for actor in actors), dtype=np.intp, count=len(actors))
+        ys = np.fromiter((actor.y for actor in actors), dtype=np.intp, count=len(actors))
+
+        sees = self.sight.visible(xs, ys)
+        hears = ~sees & (self.noise_at(xs, ys) > 0)
+        smells = ~sees & ~hears & (self.scent_at(xs, ys) > 0)
+        sound_steps = self._uphill_steps(self.noise_at, xs[hears], ys[hears])
+        scent_steps = self._uphill_steps(self.scent_at, xs[smells], ys[smells])
+
+        for i, actor in enumerate(actors):
+            self.senses[actor] = (Sense.SIGHT, None) if sees[i] else (Sense.NONE, None)
+        for i, step in zip(np.flatnonzero(hears), sound_steps):
+            self.senses[actors[i]] = (Sense.SOUND, step)
+        for i, step in zip(np.flatnonzero(smells), scent_steps):
+            self.senses[actors[i]] = (Sense.SCENT, step)
+
+    def _uphill_steps(
+        self, field: Callable[[np.ndarray, np.ndarray], np.ndarray], xs: np.ndarray, ys: np.ndarray
+    ) -> List[Optional[Tuple[int, int]]]:
+        """Return, for each (x, y), the step to the neighbor with the highest `field`, or None if no neighbor is higher."""
+        if not len(xs):
+            return []
+        nxs, nys = xs[:, None] + STEP_DX, ys[:, None] + STEP_DY
+        inside = (0 <= nxs) & (nxs < self.game_map.width) & (0 <= nys) & (nys < self.game_map.height)
+        neighbors = np.full(nxs.shape, -1, dtype=np.int64)
+        neighbors[inside] = field(nxs[inside], nys[inside])
+        best = neighbors.argmax(axis=1)
+        rises = neighbors[np.arange(len(xs)), best] > field(xs, ys)
+        return [
+            (int(STEP_DX[b]), int(STEP_DY[b])) if rise else None for b, rise in zip(best, rises)
+        ]
+
+    def sense_of(self, actor: Actor) -> Tuple[Sense, Optional[Tuple[int, int]]]:
+        """Return how `actor` perceives the player this turn, and the step to take if following a sound or scent."""
+        return self.senses.get(actor, (Sense.NONE, None))
+
+    def active(self, actors: Sequence[Actor]) -> List[Actor]:
+        """Return the actors with something to do this turn, and perceive the player for them.
+        An actor whose AI has nothing to react to and no plan to follow is skipped, which is most of a large floor."""
+        self.perceive(actors)
+        return [
+            actor for actor in actors
+            if actor.ai is not None and actor.ai.is_active(self.sense_of(actor)[0])
+        ]
+
+def benchmark(monsters: int, turns: int, seed: str) -> None:
+    """Compare the batched perception with computing an FOV for every monster, on a floor packed with orcs."""
+    import entity_factories
+    from settings import Config
+    import setup_game
+
+    engine = setup_game.new_game(Config(player_name="Bench", seed=seed))
+    game_map = engine.game_map
+    free = [
+        (int(x), int(y)) for x, y in np.argwhere(game_map.walkable)
+        if not game_map.get_blocking_entity_at_location(x, y)
+    ]
+    for x, y in random.sample(free, min(monsters, len(free))):
+        entity_factories.orc.spawn(game_map, x, y)
+    enemies = [actor for actor in game_map.actors if actor is not engine.player]
+
+    batched = naive = 0.0
+    active = 0
+    floor = np.argwhere(game_map.walkable)
+    for _ in range(turns):
+        x, y = floor[random.randrange(len(floor))]
+        engine.player.x, engine.player.y = int(x), int(y)
+        game_map.line_of_sight.invalidate() # Don't let the FOV cache flatter the batched numbers.
+
+        start = time.perf_counter()
+        game_map.awareness.update(engine.player)
+        active += len(game_map.awareness.active(enemies))
+        batched += time.perf_counter() - start
+
+        start = time.perf_counter()
+        transparent = game_map.transparent
+        for enemy in enemies:
+            tcod.map.compute_fov(transparent, (enemy.x, enemy.y), SIGHT_RADIUS)[x, y]
+        naive += time.perf_counter() - start
+
+    print(f"monsters:                {len(enemies)}")
+    print(f"batched perception:      {batched / turns * 1000:.2f} ms per turn")
+    print(f"one FOV per monster:     {naive / turns * 1000:.2f} ms per turn")
+    print(f"active monsters:         {active / turns:.1f} per turn")
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--monsters", type=int, default=400)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--seed", default="awareness")
+    args = parser.parse_args(argv)
+    benchmark(args.monsters, args.turns, args.seed)
+
+if __name__ == "__main__":
+    main()
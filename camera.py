@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from typing import Tuple, TYPE_CHECKING
+
+from chunked_grid import Window
+
+if TYPE_CHECKING:
+    from game_map import GameMap
+
+class Camera:
+    """The part of the map shown on screen. It follows the player around maps larger than the screen.
+    Map coordinates are converted to screen coordinates by subtracting the camera's position."""
+    def __init__(self, width: int = 80, height: int = 43):
+        self.width, self.height = width, height # The size of the map area of the screen.
+        self.x, self.y = 0, 0 # The map cell shown in the top left corner.
+
+    def follow(self, x: int, y: int, game_map: GameMap) -> Window:
+        """Center the camera on (x, y), without scrolling past the edges of the map, and return what it shows."""
+        self.x = max(0, min(x - self.width // 2, game_map.width - self.width))
+        self.y = max(0, min(y - self.height // 2, game_map.height - self.height))
+        return self.window(game_map)
+
+    def window(self, game_map: GameMap) -> Window:
+        """Return the map cells the camera shows."""
+        return Window(
+            self.x, self.y, min(self.width, game_map.width - self.x), min(self.height, game_map.height - self.y)
+        )
+
+    def to_screen(self, x: int, y: int) -> Tuple[int, int]:
+        return x - self.x, y - self.y
+
+    def to_map(self, x: int, y: int) -> Tuple[int, int]:
+        return x + self.x, y + self.y
+
+    def on_screen(self, x: int, y: int) -> bool:
+        """Return True if the map cell (x, y) is shown."""
+        return 0 <= x - self.x < self.width and 0 <= y - self.y < self.height
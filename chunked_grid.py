@@ -0,0 +1,354 @@
+"""Map-sized arrays stored as fixed-size square chunks, so maps far larger than the screen stay cheap.
+
+A chunk is only allocated once something other than the fill value is written to it, so solid rock
+and unexplored space cost nothing. Chunks can also be paged out to memory-mapped files, which
+leaves it to the OS to keep the parts of the map in use in memory.
+"""
+from __future__ import annotations
+
+import copy
+import os
+from typing import Any, Dict, Iterator, NamedTuple, Optional, Tuple, Union
+
+import numpy as np # type: ignore
+
+CHUNK_SIZE = 64
+
+class Window(NamedTuple):
+    """A rectangle of map cells, covering x to x + width - 1 and y to y + height - 1."""
+    x: int
+    y: int
+    width: int
+    height: int
+
+    @classmethod
+    def around(cls, x: int, y: int, radius: int, map_width: int, map_height: int) -> Window:
+        """Return the cells within `radius` of (x, y) on both axes, clipped to the map."""
+        return cls.bounding(x - radius, y - radius, x + radius, y + radius, map_width, map_height)
+
+    @classmethod
+    def bounding(
+        cls, x0: int, y0: int, x1: int, y1: int, map_width: int, map_height: int
+    ) -> Window:
+        """Return the cells from (x0, y0) to (x1, y1) inclusive, clipped to the map."""
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1 + 1, map_width), min(y1 + 1, map_height)
+        return cls(x0, y0, max(x1 - x0, 0), max(y1 - y0, 0))
+
+    @property
+    def slices(self) -> Tuple[slice, slice]:
+        return slice(self.x, self.x + self.width), slice(self.y, self.y + self.height)
+
+    def contains(self, xs: Any, ys: Any) -> Any:
+        """Return True where (xs, ys) is inside this window. Works on ints and on arrays."""
+        return (
+            (self.x <= xs) & (xs < self.x + self.width)
+            & (self.y <= ys) & (ys < self.y + self.height)
+        )
+
+    def lookup(self, array: np.ndarray, xs: Any, ys: Any, default: Any = 0) -> np.ndarray:
+        """Index `array`, which covers this window, with map coordinates.
+        Returns `default` for the coordinates outside of this window."""
+        xs, ys = np.asarray(xs), np.asarray(ys)
+        inside = self.contains(xs, ys)
+        out = np.full(xs.shape, default, dtype=array.dtype)
+        out[inside] = array[xs[inside] - self.x, ys[inside] - self.y]
+        return out
+
+class ChunkedGrid:
+    """A 2D array indexed [x, y] like the map arrays, stored in lazily allocated chunks.
+
+    Indexing supports what the game uses on its map arrays: `grid[x, y]` for one cell,
+    `grid[x0:x1, y0:y1]` for a dense copy of a rectangle, `grid[xs, ys]` with index arrays,
+    `grid[mask]` with a boolean mask of the grid's shape, and assignment to all four. `np.asarray(grid)` returns the whole grid as a dense array."""
+    # The keys of chunks shared with a fork, which are copied before they are first written to.
+    _shared: Union[set, frozenset] = frozenset()
+
+    def __init__(
+        self,
+        shape: Tuple[int, int],
+        dtype: Any,
+        fill: Any = 0,
+        chunk_size: int = CHUNK_SIZE,
+    ):
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.dtype = np.dtype(dtype)
+        self.fill = self.dtype.type(fill)
+        self.chunk_size = chunk_size
+        self.chunks: Dict[Tuple[int, int], np.ndarray] = {}
+
+    @classmethod
+    def from_array(cls, array: np.ndarray, fill: Any = 0, chunk_size: int = CHUNK_SIZE) -> ChunkedGrid:
+        grid = cls(array.shape, array.dtype, fill, chunk_size)
+        grid[:] = array
+        return grid
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Paged out chunks are read back in, so that a save doesn't depend on the page files.
+        state = self.__dict__.copy()
+        state["chunks"] = {key: np.array(chunk) for key, chunk in self.chunks.items()}
+        state.pop("_shared", None)
+        return state
+
+    @property
+    def width(self) -> int:
+        return self.shape[0]
+
+    @property
+    def height(self) -> int:
+        return self.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        """The number of bytes taken by allocated chunks, whether in memory or paged out."""
+        return sum(chunk.nbytes for chunk in self.chunks.values())
+
+    def copy(self) -> ChunkedGrid:
+        grid = copy.copy(self)
+        grid.chunks = {key: np.array(chunk) for key, chunk in self.chunks.items()}
+        grid._shared = frozenset()
+        return grid
+
+    def fork(self) -> ChunkedGrid:
+        """Return a copy which shares its chunks with this grid, copy-on-write.
+        Forking costs the same however large the grid is. A chunk is copied by whichever grid
+        writes to it first, so the other never sees the change."""
+        grid = copy.copy(self)
+        grid.chunks = dict(self.chunks)
+        self._shared = set(self._shared) | set(self.chunks)
+        grid._shared = set(self.chunks)
+        return grid
+
+    def __array__(self, dtype: Any = None, copy: Any = None) -> np.ndarray:
+        array = self.read(Window(0, 0, self.width, self.height))
+        return array if dtype is None else array.astype(dtype)
+
+    def _new_chunk(self) -> np.ndarray:
+        return np.full((self.chunk_size, self.chunk_size), self.fill, dtype=self.dtype, order="F")
+
+    # Every access to the chunks goes through the three methods below, so that subclasses can store them differently.
+
+    def _load(self, key: Tuple[int, int]) -> Optional[np.ndarray]:
+        """Return the chunk at `key` as a (chunk_size, chunk_size) array, or None if it isn't allocated.
+        Changes to the returned array must be passed to _save."""
+        return self.chunks.get(key)
+
+    def _save(self, key: Tuple[int, int], chunk: np.ndarray) -> None:
+        self.chunks[key] = chunk
+
+    def _load_for_write(self, key: Tuple[int, int]) -> Optional[np.ndarray]:
+        """Like _load, for a chunk which is about to be changed. A chunk shared with a fork is copied first."""
+        if key in self._shared:
+            self.chunks[key] = np.array(self.chunks[key]) # Also detaches a page file, which the fork may use.
+            self._shared.discard(key)
+        return self._load(key)
+
+    def _cells(self, stored: np.ndarray, xs: Any, ys: Any) -> Any:
+        """Return the cells at (xs, ys), relative to the chunk, straight from a stored chunk."""
+        return stored[xs, ys]
+
+    def _overlaps(self, window: Window) -> Iterator[Tuple[Tuple[int, int], Tuple[slice, slice], Tuple[slice, slice]]]:
+        """Yield each chunk key touching `window`, with the overlap as slices into the chunk and into the window."""
+        size = self.chunk_size
+        for cx in range(window.x // size, (window.x + window.width - 1) // size + 1):
+            x0 = max(window.x, cx * size)
+            x1 = min(window.x + window.width, (cx + 1) * size)
+            for cy in range(window.y // size, (window.y + window.height - 1) // size + 1):
+                y0 = max(window.y, cy * size)
+                y1 = min(window.y + window.height, (cy + 1) * size)
+                yield (
+                    (cx, cy),
+                    (slice(x0 - cx * size, x1 - cx * size), slice(y0 - cy * size, y1 - cy * size)),
+                    (slice(x0 - window.x, x1 - window.x), slice(y0 - window.y, y1 - window.y)),
+                )
+
+    def read(self, window: Window, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Return a dense copy of the cells in `window`.
+        If given, `out` must be a (width, height) array which is filled in place and returned."""
+        if out is None:
+            out = np.full((window.width, window.height), self.fill, dtype=self.dtype, order="F")
+        else:
+            out[...] = self.fill
+        if window.width and window.height:
+            for key, in_chunk, in_window in self._overlaps(window):
+                chunk = self._load(key)
+                if chunk is not None:
+                    out[in_window] = chunk[in_chunk]
+        return out
+
+    def write(self, window: Window, value: Any) -> None:
+        """Write a scalar or a (width, height) array to the cells in `window`."""
+        if not (window.width and window.height):
+            return
+        value = np.asarray(value, dtype=self.dtype)
+        for key, in_chunk, in_window in self._overlaps(window):
+            block = value if value.ndim == 0 else value[in_window]
+            chunk = self._load_for_write(key)
+            if chunk is None:
+                if not (block != self.fill).any():
+                    continue # Writing the fill value to an unallocated chunk changes nothing.
+                chunk = self._new_chunk()
+            chunk[in_chunk] = block
+            self._save(key, chunk)
+
+    def _check_bounds(self, xs: np.ndarray, ys: np.ndarray) -> None:
+        if (xs < 0).any() or (ys < 0).any() or (xs >= self.width).any() or (ys >= self.height).any():
+            raise IndexError(f"Index out of bounds for a grid of shape {self.shape}.")
+
+    def gather(self, xs: Any, ys: Any) -> np.ndarray:
+        """Return the cells at the index arrays `xs` and `ys`."""
+        xs, ys = np.broadcast_arrays(np.asarray(xs, dtype=np.intp), np.asarray(ys, dtype=np.intp))
+        self._check_bounds(xs, ys)
+        out = np.full(xs.shape, self.fill, dtype=self.dtype)
+        size = self.chunk_size
+        for key, where in self._group_by_chunk(xs, ys):
+            stored = self.chunks.get(key)
+            if stored is not None:
+                out[where] = self._cells(stored, xs[where] % size, ys[where] % size)
+        return out
+
+    def scatter(self, xs: Any, ys: Any, values: Any) -> None:
+        """Write `values` to the cells at the index arrays `xs` and `ys`."""
+        xs, ys = np.broadcast_arrays(np.asarray(xs, dtype=np.intp), np.asarray(ys, dtype=np.intp))
+        self._check_bounds(xs, ys)
+        values = np.broadcast_to(np.asarray(values, dtype=self.dtype), xs.shape)
+        size = self.chunk_size
+        for key, where in self._group_by_chunk(xs, ys):
+            chunk = self._load_for_write(key)
+            if chunk is None:
+                if not (values[where] != self.fill).any():
+                    continue
+                chunk = self._new_chunk()
+            chunk[xs[where] % size, ys[where] % size] = values[where]
+            self._save(key, chunk)
+
+    def _group_by_chunk(self, xs: np.ndarray, ys: np.ndarray) -> Iterator[Tuple[Tuple[int, int], np.ndarray]]:
+        """Yield each chunk key with a boolean mask of the indices which fall in that chunk."""
+        size = self.chunk_size
+        cxs, cys = xs // size, ys // size
+        if cxs.size and (cxs == cxs.flat[0]).all() and (cys == cys.flat[0]).all():
+            # The common case: every index is in the same chunk.
+            yield (int(cxs.flat[0]), int(cys.flat[0])), np.ones(xs.shape, dtype=bool)
+            return
+        keys = cxs * ((self.height + size - 1) // size) + cys
+        for key in np.unique(keys):
+            where = keys == key
+            yield (int(cxs[where].flat[0]), int(cys[where].flat[0])), where
+
+    def _window_from_slices(self, x: slice, y: slice) -> Window:
+        x0, x1, x_step = x.indices(self.width)
+        y0, y1, y_step = y.indices(self.height)
+        if x_step != 1 or y_step != 1:
+            raise IndexError("ChunkedGrid slices don't support steps.")
+        return Window(x0, y0, max(x1 - x0, 0), max(y1 - y0, 0))
+
+    def _normalize(self, key: Any) -> Tuple[str, Any]:
+        if isinstance(key, np.ndarray) and key.dtype == bool:
+            # A mask selects its True cells, in the same order as numpy's boolean indexing.
+            if key.shape != self.shape:
+                raise IndexError(f"A boolean mask of shape {key.shape} doesn't match a grid of shape {self.shape}.")
+            return "arrays", np.nonzero(key)
+        if key is Ellipsis or (isinstance(key, slice) and key == slice(None)):
+            return "window", Window(0, 0, self.width, self.height)
+        if not (isinstance(key, tuple) and len(key) == 2):
+            raise TypeError(
+                f"ChunkedGrid is indexed with [x, y], [...], [:] or a boolean mask, not {type(key).__name__}."
+            )
+        x, y = key
+        if isinstance(x, slice) and isinstance(y, slice):
+            return "window", self._window_from_slices(x, y)
+        if isinstance(x, slice) or isinstance(y, slice):
+            raise IndexError("ChunkedGrid can't mix slices with index arrays.")
+        if np.ndim(x) == 0 and np.ndim(y) == 0:
+            return "cell", (int(x), int(y))
+        return "arrays", (x, y)
+
+    def _cell_key(self, x: int, y: int) -> Tuple[int, int]:
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            raise IndexError(f"Index {(x, y)} out of bounds for a grid of shape {self.shape}.")
+        return x // self.chunk_size, y // self.chunk_size
+
+    def __getitem__(self, key: Any) -> Any:
+        kind, index = self._normalize(key)
+        if kind == "cell":
+            x, y = index
+            stored = self.chunks.get(self._cell_key(x, y))
+            if stored is None:
+                return self.fill
+            return self._cells(stored, x % self.chunk_size, y % self.chunk_size)
+        if kind == "window":
+            return self.read(index)
+        return self.gather(*index)
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        kind, index = self._normalize(key)
+        if kind == "cell":
+            x, y = index
+            chunk_key = self._cell_key(x, y)
+            chunk = self._load_for_write(chunk_key)
+            if chunk is None:
+                if value == self.fill:
+                    return
+                chunk = self._new_chunk()
+            chunk[x % self.chunk_size, y % self.chunk_size] = value
+            self._save(chunk_key, chunk)
+        elif kind == "window":
+            self.write(index, value)
+        else:
+            self.scatter(index[0], index[1], value)
+
+    def page_out(self, directory: str, keep: Optional[Union[set, frozenset]] = None) -> int:
+        """Move chunks to memory-mapped files in `directory`, except those whose keys are in `keep`.
+        Paged out chunks are still read and written as usual, through the mapping.
+        Returns the number of chunks paged out."""
+        os.makedirs(directory, exist_ok=True)
+        count = 0
+        for (cx, cy), chunk in list(self.chunks.items()):
+            if isinstance(chunk, np.memmap) or (keep is not None and (cx, cy) in keep):
+                continue
+            path = os.path.join(directory, f"chunk_{cx}_{cy}.npy")
+            np.save(path, chunk)
+            self.chunks[cx, cy] = np.load(path, mmap_mode="r+")
+            count += 1
+        return count
+
+    def chunk_keys_near(self, window: Window) -> frozenset:
+        """Return the keys of the chunks touching `window`, for use as `keep` in page_out."""
+        if not (window.width and window.height):
+            return frozenset()
+        return frozenset(key for key, _, _ in self._overlaps(window))
+
+class PackedBoolGrid(ChunkedGrid):
+    """A ChunkedGrid of booleans stored one bit per cell with np.packbits, an eighth of the memory of bool arrays.
+    Reading or writing a rectangle unpacks the chunks it touches. Single cells and index arrays
+    are read straight from the packed bits."""
+    def __init__(
+        self,
+        shape: Tuple[int, int],
+        dtype: Any = bool,
+        fill: Any = False,
+        chunk_size: int = CHUNK_SIZE,
+    ):
+        if np.dtype(dtype) != np.bool_:
+            raise TypeError("PackedBoolGrid only holds booleans.")
+        if chunk_size % 8:
+            raise ValueError("The chunk size of a PackedBoolGrid must be a multiple of 8.")
+        super().__init__(shape, bool, fill, chunk_size)
+
+    def _load(self, key: Tuple[int, int]) -> Optional[np.ndarray]:
+        packed = self.chunks.get(key)
+        if packed is None:
+            return None
+        return np.unpackbits(packed, axis=1, count=self.chunk_size).view(bool)
+
+    def _save(self, key: Tuple[int, int], chunk: np.ndarray) -> None:
+        packed = np.packbits(chunk, axis=1)
+        stored = self.chunks.get(key)
+        if isinstance(stored, np.memmap):
+            stored[:] = packed # Write through to the page file.
+        else:
+            self.chunks[key] = packed
+
+    def _cells(self, stored: np.ndarray, xs: Any, ys: Any) -> Any:
+        # np.packbits puts the first cell in the highest bit of each byte.
+        return ((stored[xs, ys >> 3] >> (7 - (ys & 7))) & 1).astype(bool)
@@ -0,0 +1,567 @@
+"""A headless Monte Carlo combat simulator, for balancing the numbers in entity_factories.
+
+Every trial clears one floor: rooms are filled using the same spawn tables as procgen, and the
+player fights each room's monsters together. The numbers are read from copies of the real templates,
+with any `--set` values written into them, and items do what their consumable classes do with the
+values they hold: a potion heals its `amount` up to max hp, lightning hits the nearest monster within
+its `maximum_range` for its `damage`, a fireball hits every monster around its target for its `damage`
+(and would hit the player within its `radius`), and confusion stops a monster for its `number_of_turns`.
+
+Every room is fought to the same script:
+- The monsters start in a group APPROACH_TURNS + 1 steps away. While they close in, the player reads
+  a scroll each turn if two or more are alive: a fireball if it won't reach the player, otherwise
+  lightning if a monster is in range, otherwise confusion on a monster which isn't confused.
+- Then every monster which isn't confused attacks each turn. The player drinks a potion when those
+  attacks could be fatal, and otherwise attacks the monster with the least hp.
+- Once the room is clear its items are picked up, and better weapons and armor are worn.
+
+The simulator is a vectorized model of those fights which only shares the damage formula,
+actions.melee_damage, with the game. `--calibrate N` checks the model: it also plays N clears of each
+floor in an arena, an open room where the script is played by the game itself, with its Fighter,
+actions.melee, item activations and monster AI, and prints both results side by side.
+
+For each monster, the report gives the turns from the start of a room's fight until it died (ttk) and
+the turns it would take to kill the player on its own from the player's hp when the room starts (ttd).
+
+Usage: python combat_sim.py --floors 1-8 --trials 100000 --set orc_hp=8,10,12 --set health_potion_amount=4,6
+       python combat_sim.py --floors 1-8 --calibrate 200
+"""
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import copy
+import itertools
+import random
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Type, TYPE_CHECKING
+
+import numpy as np # type: ignore
+
+import actions
+from actions import melee_damage
+from components.ai import ConfusedEnemy
+from components.consumable import (
+    ConfusionConsumable,
+    Consumable,
+    FireballDamageConsumable,
+    HealingConsumable,
+    LightningDamageConsumable,
+)
+import entity_factories
+from entity import Actor, Item
+from equipment_types import EquipmentType
+import procgen
+
+if TYPE_CHECKING:
+    from engine import Engine
+
+# The turns a room's monsters take to reach the player, who gets that many turns to read scrolls.
+APPROACH_TURNS = 4
+
+# The arena is an open room, with the player in the middle and each room's monsters starting east of them.
+ARENA_SIZE = 31
+ARENA_OFFSETS = [
+    (APPROACH_TURNS + 1 + dx, dy) for dx, dy in ((0, 0), (0, -1), (0, 1), (1, 0), (1, -1), (1, 1))
+]
+# An arena room is abandoned after this many turns, in case its monsters never reach the player.
+MAX_ARENA_TURNS = 200
+
+def parameter_key(name: str) -> str:
+    """Return the parameter prefix for an entity name, such as "health_potion" for "Health Potion"."""
+    return name.lower().replace(" ", "_")
+
+def spawned(chances: Dict[int, List[Tuple[Any, int]]]) -> List[Any]:
+    """Return every entity in a spawn table, in the order they are first listed."""
+    entities: Dict[str, Any] = {}
+    for floor in sorted(chances):
+        for entity, _ in chances[floor]:
+            entities.setdefault(entity.name, entity)
+    return list(entities.values())
+
+def item_components(item: Item) -> List[Any]:
+    return [component for component in (item.consumable, item.equippable) if component is not None]
+
+def starting_player() -> Actor:
+    """Return a copy of the player template wearing a dagger and leather armor, the same way setup_game.new_game does."""
+    player = copy.deepcopy(entity_factories.player)
+    for item in (entity_factories.dagger, entity_factories.leather_armor):
+        player.equipment.toggle_equip(copy.deepcopy(item), add_message=False)
+    return player
+
+def default_parameters() -> Dict[str, int]:
+    """Read the tunable numbers from the real entity templates.
+    Items have a parameter for every number their components hold, such as "lightning_scroll_maximum_range"."""
+    player = starting_player()
+    parameters = {
+        "player_hp": player.fighter.max_hp,
+        "player_power": player.fighter.power,
+        "player_defense": player.fighter.defense,
+        "rooms_per_floor": 9,
+    }
+    for monster in spawned(procgen.spawn_tables.enemy_chances):
+        key = parameter_key(monster.name)
+        parameters[f"{key}_hp"] = monster.fighter.max_hp
+        parameters[f"{key}_power"] = monster.fighter.power
+        parameters[f"{key}_defense"] = monster.fighter.defense
+    for item in spawned(procgen.spawn_tables.item_chances):
+        key = parameter_key(item.name)
+        for component in item_components(item):
+            for attribute, value in vars(component).items():
+                if type(value) is int:
+                    parameters[f"{key}_{attribute}"] = value
+    return parameters
+
+class Templates(NamedTuple):
+    """Copies of the player, monster and item templates with a set of parameters written into them.
+    Monsters and items are keyed by parameter_key."""
+    player: Actor
+    monsters: Dict[str, Actor]
+    items: Dict[str, Item]
+
+def build_templates(parameters: Dict[str, int]) -> Templates:
+    # Fighters are changed through their private hp, as the hp setter publishes events to a game these copies aren't in.
+    player = starting_player()
+    player.fighter.max_hp = player.fighter._hp = parameters["player_hp"]
+    player.fighter.base_power += parameters["player_power"] - player.fighter.power
+    player.fighter.base_defense += parameters["player_defense"] - player.fighter.defense
+
+    monsters = {}
+    for template in spawned(procgen.spawn_tables.enemy_chances):
+        key = parameter_key(template.name)
+        monster = monsters[key] = copy.deepcopy(template)
+        monster.fighter.max_hp = monster.fighter._hp = parameters[f"{key}_hp"]
+        monster.fighter.base_power += parameters[f"{key}_power"] - monster.fighter.power
+        monster.fighter.base_defense += parameters[f"{key}_defense"] - monster.fighter.defense
+
+    items = {}
+    for template in spawned(procgen.spawn_tables.item_chances):
+        key = parameter_key(template.name)
+        item = items[key] = copy.deepcopy(template)
+        for component in item_components(item):
+            for attribute in vars(component):
+                if f"{key}_{attribute}" in parameters:
+                    setattr(component, attribute, parameters[f"{key}_{attribute}"])
+    return Templates(player, monsters, items)
+
+class FloorResult:
+    """The outcome of many clears of one floor."""
+    def __init__(self, floor: int, survived: np.ndarray, hp_lost: np.ndarray, turns: np.ndarray):
+        self.floor = floor
+        self.survived = survived
+        self.hp_lost = hp_lost
+        self.turns = turns
+        # Turns from the start of a room's fight until each monster died, by monster name.
+        self.turns_to_kill: Dict[str, List[np.ndarray]] = {}
+        # Turns each monster would need to kill the player, by monster name.
+        self.turns_to_die: Dict[str, List[np.ndarray]] = {}
+
+    @property
+    def win_rate(self) -> float:
+        return float(self.survived.mean())
+
+    def summary(self) -> Dict[str, float]:
+        summary = {
+            "floor": self.floor,
+            "win_rate": self.win_rate,
+            "hp_lost_mean": float(self.hp_lost.mean()),
+            "hp_lost_p90": float(np.percentile(self.hp_lost, 90)),
+            "turns_mean": float(self.turns.mean()),
+        }
+        for suffix, samples_by_name in (("ttk", self.turns_to_kill), ("ttd", self.turns_to_die)):
+            for name, samples in samples_by_name.items():
+                turns = np.concatenate(samples) if samples else np.zeros(0)
+                if len(turns):
+                    key = parameter_key(name)
+                    summary[f"{key}_{suffix}_mean"] = float(turns.mean())
+                    summary[f"{key}_{suffix}_p90"] = float(np.percentile(turns, 90))
+        return summary
+
+class Trials:
+    """The player in every trial, as arrays with one entry per trial."""
+    def __init__(self, count: int, player: Actor, items: List[Item]):
+        self.max_hp = player.fighter.max_hp
+        self.hp = np.full(count, self.max_hp, dtype=np.int64)
+        self.power = np.full(count, player.fighter.power, dtype=np.int64)
+        self.defense = np.full(count, player.fighter.defense, dtype=np.int64)
+        self.items = items
+        # How many of each of `items` the player holds.
+        self.inventory = np.zeros((count, len(items)), dtype=np.int64)
+        self.turns = np.zeros(count, dtype=np.int64)
+
+    def use(
+        self,
+        consumable_type: Type[Consumable],
+        wanted: np.ndarray,
+        usable: Callable[[Any], bool] = lambda consumable: True,
+    ) -> Iterator[Tuple[Any, np.ndarray]]:
+        """Use up one item of `consumable_type` in each trial where `wanted` is True and the player holds one.
+        Items whose consumable fails `usable` are skipped. Yields each consumable with the trials it was used in."""
+        wanted = wanted.copy()
+        for column, item in enumerate(self.items):
+            if isinstance(item.consumable, consumable_type) and usable(item.consumable):
+                used = wanted & (self.inventory[:, column] > 0)
+                if used.any():
+                    self.inventory[used, column] -= 1
+                    wanted &= ~used
+                    yield item.consumable, used
+
+def simulate_floor(
+    floor: int,
+    trials: int,
+    parameters: Optional[Dict[str, int]] = None,
+    seed: Optional[int] = None,
+) -> FloorResult:
+    """Simulate `trials` independent clears of `floor`, each starting at full HP with no items.
+    Rooms are cleared one after another, following the script in the module docstring."""
+    params = default_parameters()
+    params.update(parameters or {})
+    templates = build_templates(params)
+    rng = np.random.default_rng(seed)
+
+    spawns = procgen.spawn_tables.for_floor(floor)
+    monster_names = [monster.name for monster in spawns.monsters.entities]
+    monsters = [templates.monsters[parameter_key(name)] for name in monster_names]
+    monster_hp = np.array([monster.fighter.max_hp for monster in monsters])
+    monster_power = np.array([monster.fighter.power for monster in monsters])
+    monster_defense = np.array([monster.fighter.defense for monster in monsters])
+    items = [templates.items[parameter_key(item.name)] for item in spawns.items.entities]
+    max_monsters = spawns.max_monsters
+
+    player = Trials(trials, templates.player, items)
+    result = FloorResult(floor, np.zeros(0, dtype=bool), np.zeros(0), np.zeros(0))
+    result.turns_to_kill = {name: [] for name in monster_names}
+    result.turns_to_die = {name: [] for name in monster_names}
+
+    for _room in range(params["rooms_per_floor"]):
+        monster_counts = rng.integers(0, max_monsters, size=trials, endpoint=True)
+        present = (np.arange(max_monsters) < monster_counts[:, None]) & (player.hp > 0)[:, None]
+        kind = spawns.monsters.sample_indices(rng, trials * max_monsters).reshape(trials, max_monsters)
+
+        # Monsters that can't hurt the player never kill them, so they have no turns to die.
+        enemy_damage = melee_damage(monster_power[kind], player.defense[:, None])
+        dangerous = present & (enemy_damage > 0)
+        turns_to_die = -(-player.hp[:, None] // np.maximum(enemy_damage, 1))
+        for index, name in enumerate(monster_names):
+            result.turns_to_die[name].append(turns_to_die[dangerous & (kind == index)])
+
+        died_on = fight_room(
+            player, np.where(present, monster_hp[kind], 0), monster_power[kind], monster_defense[kind]
+        )
+        for index, name in enumerate(monster_names):
+            result.turns_to_kill[name].append(died_on[present & (kind == index) & (died_on > 0)])
+
+        item_counts = rng.integers(0, spawns.max_items, size=trials, endpoint=True)
+        for slot in range(spawns.max_items):
+            found = (item_counts > slot) & (player.hp > 0)
+            kind = spawns.items.sample_indices(rng, trials)
+            for column, item in enumerate(items):
+                pick_up(player, templates.player, column, item, found & (kind == column))
+
+    result.survived = player.hp > 0
+    result.hp_lost = player.max_hp - np.maximum(player.hp, 0)
+    result.turns = player.turns
+    return result
+
+def fight_room(
+    player: Trials,
+    enemy_hp: np.ndarray,
+    enemy_power: np.ndarray,
+    enemy_defense: np.ndarray,
+) -> np.ndarray:
+    """Fight a room in every trial, updating `player` in place.
+    The enemy arrays have a row per trial and a column per monster, with 0 hp where there is no monster.
+    Returns the turn each monster died on, counted from the start of the room, or 0 if it didn't."""
+    enemy_hp = enemy_hp.copy()
+    alive = enemy_hp > 0
+    confused = np.zeros_like(enemy_hp) # Monster turns left without attacking.
+    died_on = np.zeros_like(enemy_hp)
+    rows = np.arange(len(enemy_hp))
+    player_damage = np.maximum(melee_damage(player.power[:, None], enemy_defense), 0)
+    enemy_damage = np.maximum(melee_damage(enemy_power, player.defense[:, None]), 0)
+
+    def count_kills(turn: int) -> None:
+        killed = alive & (enemy_hp <= 0)
+        died_on[killed] = turn
+        alive[killed] = False
+
+    fighting = alive.any(axis=1) & (player.hp > 0)
+    for turn in range(APPROACH_TURNS):
+        distance = APPROACH_TURNS + 1 - turn
+        wanted = fighting & (alive.sum(axis=1) >= 2)
+        for fireball, used in player.use(FireballDamageConsumable, wanted, lambda c: distance > c.radius):
+            enemy_hp[used] -= fireball.damage * alive[used]
+            wanted &= ~used
+        nearest = np.argmax(alive, axis=1)
+        for lightning, used in player.use(LightningDamageConsumable, wanted, lambda c: distance < c.maximum_range + 1):
+            enemy_hp[rows[used], nearest[used]] -= lightning.damage
+            wanted &= ~used
+        calm = alive & (confused == 0)
+        wanted &= calm.any(axis=1)
+        first_calm = np.argmax(calm, axis=1)
+        for confusion, used in player.use(ConfusionConsumable, wanted):
+            # ConfusedEnemy spends one more turn coming back to its senses.
+            confused[rows[used], first_calm[used]] = confusion.number_of_turns + 1
+        count_kills(turn + 1)
+        confused[fighting[:, None] & alive & (confused > 0)] -= 1
+    player.turns[fighting] += APPROACH_TURNS
+
+    # A monster the player can't hurt is walked away from, unless it can hurt them, which they can't survive.
+    unbeatable = alive & (player_damage == 0)
+    player.hp[(unbeatable & (enemy_damage > 0)).any(axis=1)] = 0
+    alive &= ~unbeatable
+
+    turn = APPROACH_TURNS
+    while True:
+        fighting &= alive.any(axis=1) & (player.hp > 0)
+        if not fighting.any():
+            return died_on
+        turn += 1
+        attackers = alive & (confused == 0)
+        drink = fighting & (player.hp <= (enemy_damage * attackers).sum(axis=1)) & (player.hp < player.max_hp)
+        drank = np.zeros_like(drink)
+        for potion, used in player.use(HealingConsumable, drink):
+            player.hp[used] = np.minimum(player.hp[used] + potion.amount, player.max_hp)
+            drank |= used
+        attack = fighting & ~drank
+        target = np.argmin(np.where(alive, enemy_hp, np.iinfo(enemy_hp.dtype).max), axis=1)
+        hits = rows[attack], target[attack]
+        enemy_hp[hits] -= player_damage[hits]
+        count_kills(turn)
+        player.hp -= (enemy_damage * (attackers & alive & fighting[:, None])).sum(axis=1)
+        confused[fighting[:, None] & alive & (confused > 0)] -= 1
+        player.turns[fighting] += 1
+
+def pick_up(player: Trials, starting_player: Actor, column: int, item: Item, found: np.ndarray) -> None:
+    """Add `item`, column `column` of the player's inventory, in every trial where `found` is True.
+    Equipment is worn if it is better than what the player has on."""
+    if item.consumable is not None:
+        player.inventory[found, column] += 1
+    elif item.equippable is not None:
+        fighter = starting_player.fighter
+        if item.equippable.equipment_type == EquipmentType.WEAPON:
+            player.power[found] = np.maximum(player.power[found], fighter.base_power + item.equippable.power_bonus)
+        else:
+            player.defense[found] = np.maximum(player.defense[found], fighter.base_defense + item.equippable.defense_bonus)
+
+def first_item(
+    player: Actor, consumable_type: Type[Consumable], usable: Callable[[Any], bool] = lambda consumable: True
+) -> Optional[Item]:
+    return next(
+        (
+            item for item in player.inventory.items
+            if isinstance(item.consumable, consumable_type) and usable(item.consumable)
+        ),
+        None,
+    )
+
+def arena_action(engine: Engine, monsters: List[Actor], turn: int) -> actions.Action:
+    """Return the player's action on `turn` of an arena room, following the script in the module docstring."""
+    player = engine.player
+    living = [monster for monster in monsters if monster.is_alive]
+    if turn < APPROACH_TURNS:
+        if len(living) >= 2:
+            nearest = min(living, key=lambda monster: player.distance(monster.x, monster.y))
+            distance = player.distance(nearest.x, nearest.y)
+            fireball = first_item(player, FireballDamageConsumable, lambda c: distance > c.radius)
+            if fireball is not None:
+                return actions.ItemAction(player, fireball, (nearest.x, nearest.y))
+            lightning = first_item(player, LightningDamageConsumable, lambda c: distance < c.maximum_range + 1)
+            if lightning is not None:
+                return actions.ItemAction(player, lightning)
+            calm = [monster for monster in living if not isinstance(monster.ai, ConfusedEnemy)]
+            confusion = first_item(player, ConfusionConsumable)
+            if confusion is not None and calm:
+                return actions.ItemAction(player, confusion, (calm[0].x, calm[0].y))
+        return actions.WaitAction(player)
+
+    incoming = sum(
+        max(melee_damage(monster.fighter.power, player.fighter.defense), 0)
+        for monster in living if not isinstance(monster.ai, ConfusedEnemy)
+    )
+    potion = first_item(player, HealingConsumable)
+    if potion is not None and player.fighter.hp <= incoming and player.fighter.hp < player.fighter.max_hp:
+        return actions.ItemAction(player, potion)
+    adjacent = [monster for monster in living if max(abs(monster.x - player.x), abs(monster.y - player.y)) <= 1]
+    if adjacent:
+        target = min(adjacent, key=lambda monster: (monster.fighter.hp, monsters.index(monster)))
+        return actions.MeleeAction(player, target.x - player.x, target.y - player.y)
+    # The rest are confused and wandering, so go after the nearest.
+    nearest = min(living, key=lambda monster: player.distance(monster.x, monster.y))
+    return actions.BumpAction(player, int(np.sign(nearest.x - player.x)), int(np.sign(nearest.y - player.y)))
+
+def take_item(player: Actor, item: Item) -> None:
+    """Add `item` to the player's inventory, and wear it if it is better than what they have on."""
+    player.inventory.add(item)
+    equippable = item.equippable
+    if equippable is None:
+        return
+    if equippable.equipment_type == EquipmentType.WEAPON:
+        worn = player.equipment.weapon
+        better = worn is None or equippable.power_bonus > worn.equippable.power_bonus
+    else:
+        worn = player.equipment.armor
+        better = worn is None or equippable.defense_bonus > worn.equippable.defense_bonus
+    if better:
+        player.equipment.toggle_equip(item, add_message=False)
+
+def arena_floor(floor: int, templates: Templates, rooms: int, seed: int) -> Tuple[bool, int, int]:
+    """Clear `floor` once in the arena, with the game's own rules and monster AI.
+    Reseeds the global RNG, which the AI uses. Returns whether the player survived, the hp they lost and the turns taken."""
+    from engine import Engine
+    from game_map import GameMap
+    import input_handlers
+    import settings
+    import tile_types
+
+    random.seed(seed)
+    rng = random.Random(seed)
+    player = copy.deepcopy(templates.player)
+    engine = Engine(player=player, config=settings.Config(map_width=ARENA_SIZE, map_height=ARENA_SIZE))
+    engine.game_map = GameMap(engine, ARENA_SIZE, ARENA_SIZE)
+    engine.game_map.tiles[1:-1, 1:-1] = tile_types.floor
+    center = ARENA_SIZE // 2
+    player.place(center, center, engine.game_map)
+    handler = input_handlers.EventHandler(engine)
+    spawns = procgen.spawn_tables.for_floor(floor)
+
+    turns = 0
+    for _room in range(rooms):
+        player.place(center, center)
+        monsters = []
+        for dx, dy in ARENA_OFFSETS[: rng.randint(0, spawns.max_monsters)]:
+            monster = copy.deepcopy(templates.monsters[parameter_key(spawns.monsters.sample(rng).name)])
+            monster.place(center + dx, center + dy, engine.game_map)
+            monsters.append(monster)
+        engine.update_fov()
+        for turn in range(MAX_ARENA_TURNS):
+            if not player.is_alive or not any(monster.is_alive for monster in monsters):
+                break
+            if not handler.handle_action(arena_action(engine, monsters, turn)):
+                handler.handle_action(actions.WaitAction(player)) # The action was impossible, the turn still passes.
+            turns += 1
+        if not player.is_alive:
+            break
+        engine.game_map.entities.difference_update(monsters) # Clear the corpses away.
+        for _ in range(rng.randint(0, spawns.max_items)):
+            take_item(player, copy.deepcopy(templates.items[parameter_key(spawns.items.sample(rng).name)]))
+    return player.is_alive, templates.player.fighter.max_hp - player.fighter.hp, turns
+
+def arena_clear(
+    floor: int, trials: int, parameters: Optional[Dict[str, int]] = None, seed: int = 0
+) -> FloorResult:
+    """Play `trials` clears of `floor` in the arena. Much slower than simulate_floor, this is for calibrating it."""
+    params = default_parameters()
+    params.update(parameters or {})
+    templates = build_templates(params)
+    outcomes = [
+        arena_floor(floor, templates, params["rooms_per_floor"], seed=seed * 1_000_003 + trial)
+        for trial in range(trials)
+    ]
+    survived, hp_lost, turns = (np.array(column) for column in zip(*outcomes))
+    return FloorResult(floor, survived, hp_lost, turns)
+
+def calibrate(
+    floors: Iterable[int], trials: int, parameters: Optional[Dict[str, int]] = None, seed: int = 0
+) -> List[Dict[str, float]]:
+    """Compare the simulator with `trials` arena clears of each floor, returning one row per floor."""
+    rows = []
+    for floor in floors:
+        simulated = simulate_floor(floor, max(trials, 10_000), parameters, seed=seed + floor).summary()
+        played = arena_clear(floor, trials, parameters, seed=seed + floor).summary()
+        row: Dict[str, float] = {"floor": floor}
+        for name in ("win_rate", "hp_lost_mean", "turns_mean"):
+            row[f"{name}_sim"] = simulated[name]
+            row[f"{name}_arena"] = played[name]
+        rows.append(row)
+    return rows
+
+def simulate_floors(
+    floors: Iterable[int], trials: int, parameters: Dict[str, int], seed: int = 0
+) -> List[Dict[str, float]]:
+    """Simulate every floor with one parameter set, returning one summary per floor."""
+    summaries = []
+    for floor in floors:
+        summary = simulate_floor(floor, trials, parameters, seed=seed + floor).summary()
+        summary.update(parameters)
+        summaries.append(summary)
+    return summaries
+
+def sweep(
+    grid: Dict[str, List[int]],
+    floors: Iterable[int],
+    trials: int,
+    workers: Optional[int] = None,
+) -> Iterable[Dict[str, float]]:
+    """Simulate every combination of the parameter values in `grid`, in parallel across processes.
+    Summaries are yielded as each combination finishes."""
+    floors = list(floors)
+    names = list(grid)
+    combinations = [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(simulate_floors, floors, trials, parameters)
+            for parameters in combinations
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            yield from future.result()
+
+def parse_floors(text: str) -> List[int]:
+    """Parse "3" or "1-8" into a list of floors."""
+    first, _, last = text.partition("-")
+    return list(range(int(first), int(last or first) + 1))
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--floors", default="1-8", help="A floor or a range of floors, such as 1-8.")
+    parser.add_argument("--trials", type=int, default=100_000, help="Trials per floor and parameter set.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores).")
+    parser.add_argument(
+        "--calibrate",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Compare the simulator with N arena clears of each floor, instead of sweeping.",
+    )
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="NAME=V1,V2",
+        help=f"Sweep a parameter over some values. Parameters: {', '.join(default_parameters())}.",
+    )
+    args = parser.parse_args(argv)
+
+    grid: Dict[str, List[int]] = {}
+    for assignment in args.set:
+        name, _, values = assignment.partition("=")
+        if name not in default_parameters():
+            parser.error(f"Unknown parameter: {name}")
+        grid[name] = [int(value) for value in values.split(",")]
+
+    floors = parse_floors(args.floors)
+    if args.calibrate:
+        rows = calibrate(floors, args.calibrate)
+        print("\t".join(rows[0]))
+        for row in rows:
+            print("\t".join(f"{value:.3f}" if isinstance(value, float) else str(value) for value in row.values()))
+        return
+
+    monster_keys: List[str] = []
+    for floor in floors:
+        for monster in procgen.spawn_tables.for_floor(floor).monsters.entities:
+            if parameter_key(monster.name) not in monster_keys:
+                monster_keys.append(parameter_key(monster.name))
+    columns = ["floor", "win_rate", "hp_lost_mean", "hp_lost_p90", "turns_mean"]
+    for key in monster_keys:
+        columns += [f"{key}_ttk_mean", f"{key}_ttk_p90", f"{key}_ttd_mean", f"{key}_ttd_p90"]
+    columns += list(grid)
+    print("\t".join(columns))
+    for summary in sweep(grid, floors, args.trials, args.workers):
+        # A monster which wasn't met on a floor has no turns to report.
+        print("\t".join(
+            f"{summary[column]:.3f}" if isinstance(summary.get(column), float) else str(summary.get(column, "-"))
+            for column in columns
+        ))
+
+if __name__ == "__main__":
+    main()
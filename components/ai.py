@@ -3,46 +3,44 @@ from __future__ import annotations
 import random
 from typing import List, Optional, Tuple, TYPE_CHECKING
 
-import numpy as np # type: ignore
-import tcod
-
-from actions import Action, BumpAction, MeleeAction, MovementAction, WaitAction
+from actions import Action, bump, melee, move
+from awareness import Sense
+from path_graph import local_path
 
 if TYPE_CHECKING:
     from entity import Actor
 
+# How far outside the box between an actor and its destination a path may wander.
+PATH_MARGIN = 20
+
+# Paths to destinations further away than this are planned over the floor's PathGraph.
+LONG_PATH_DISTANCE = 32
+
 class BaseAI(Action):
     entity: Actor
     
     def perform(self) -> None:
         raise NotImplementedError()
     
+    def is_active(self, sense: Sense) -> bool:
+        """Return False if this AI would do nothing this turn, so its turn can be skipped.
+        `sense` is how the actor perceives the player this turn."""
+        return True
+    
     def get_path_to(self, dest_x: int, dest_y: int) -> List[Tuple[int, int]]:
         """Compute and return a path to the target position.
         If there is no valid path then returns an empty list."""
-        # Copy the walkable array.
-        cost = np.array(self.entity.gamemap.tiles["walkable"], dtype=np.int8)
-        
-        for entity in self.entity.gamemap.entities:
-            # Check that an entity blocks movement and the cost isn't zero (blocking).
-            if entity.blocks_movement and cost[entity.x, entity.y]:
-                # Add to the cost of a blocked position.
-                # A lower number means more enemies will crowd behind each other in
-                # hallways. A higher number means enemies will take longer paths in
-                # order to surround the player.
-                cost[entity.x, entity.y] += 10
-        
-        # Create a graph from the cost array and pass that graph to a new pathfinder.
-        graph = tcod.path.SimpleGraph(cost=cost, cardinal=2, diagonal=3)
-        pathfinder = tcod.path.Pathfinder(graph)
-        
-        pathfinder.add_root((self.entity.x, self.entity.y)) # Start position.
-        
-        # Compute the path to the destination and remove the starting point.
-        path: List[List[int]] = pathfinder.path_to((dest_x, dest_y))[1:].tolist()
-        
-        # Convert from List[List[int]] to List[Tuple[int, int]].
-        return [(index[0], index[1]) for index in path]
+        game_map = self.entity.gamemap
+        origin = (self.entity.x, self.entity.y)
+        blocked = [(entity.x, entity.y) for entity in game_map.entities if entity.blocks_movement]
+        path: List[Tuple[int, int]] = []
+        if max(abs(dest_x - origin[0]), abs(dest_y - origin[1])) <= LONG_PATH_DISTANCE:
+            # Only search the area around the actor and its destination, so large maps cost no more than small ones.
+            path = local_path(game_map, origin, (dest_x, dest_y), blocked, margin=PATH_MARGIN)
+        if not path:
+            # Far away, or the way there leaves the area searched: plan the path over the floor's clusters.
+            path = game_map.path_graph.find_path(origin, (dest_x, dest_y), blocked)
+        return path
 
 class ConfusedEnemy(BaseAI):
     """A confused enemy will stumble around aimlessly for a given number of turns, then revert back to its previous AI.
@@ -81,29 +79,35 @@ class ConfusedEnemy(BaseAI):
             
             # The actor will either try to move or attack in the chosen random direction.
             # It's possible the actor will just bump into a wall, wasting a turn.
-            return BumpAction(self.entity, direction_x, direction_y,).perform()
+            return bump(self.engine, self.entity, direction_x, direction_y)
 
 class HostileEnemy(BaseAI):
     def __init__(self, entity: Actor):
         super().__init__(entity)
         self.path: List[Tuple[int,int]] =[]
     
+    def is_active(self, sense: Sense) -> bool:
+        return bool(self.path) or sense is not Sense.NONE
+    
     def perform(self) -> None:
-        target = self.engine.player
+        engine = self.engine
+        target = engine.player
         dx = target.x - self.entity.x
         dy = target.y - self.entity.y
         distance = max(abs(dx), abs(dy)) # Chebyshev distance.
+        sense, step = engine.game_map.awareness.sense_of(self.entity)
         
-        if self.engine.game_map.visible[self.entity.x, self.entity.y]:
+        if sense is Sense.SIGHT:
             if distance <= 1:
-                return MeleeAction(self.entity, dx, dy).perform()
+                return melee(engine, self.entity, dx, dy, target)
             
             self.path = self.get_path_to(target.x, target.y)
+        elif step and not self.path:
+            # The player can't be seen, but can be heard or smelled. Head that way one step at a time.
+            return move(engine, self.entity, *step)
         
         if self.path:
             dest_x, dest_y = self.path.pop(0)
-            return MovementAction(
-                self.entity, dest_x - self.entity.x, dest_y - self.entity.y,
-            ).perform()
+            return move(engine, self.entity, dest_x - self.entity.x, dest_y - self.entity.y)
         
-        return WaitAction(self.entity).perform()
\ No newline at end of file
+        return None # Wait.
\ No newline at end of file
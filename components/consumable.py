@@ -6,6 +6,7 @@ import actions
 import color
 import components.ai
 import components.inventory
+import events
 from components.base_component import BaseComponent
 from exceptions import Impossible
 from input_handlers import (
@@ -34,7 +35,10 @@ class Consumable(BaseComponent):
         entity = self.parent
         inventory = entity.parent
         if isinstance(inventory, components.inventory.Inventory):
-            inventory.items.remove(entity)
+            inventory.remove(entity)
+            events.publish(
+                inventory.parent, events.Consumed(inventory.parent.entity_id, entity.entity_id)
+            )
 
 class ConfusionConsumable(Consumable):
     def __init__(self, number_of_turns: int):
@@ -107,16 +111,14 @@ class FireballDamageConsumable(Consumable):
         if not self.engine.game_map.visible[target_xy]:
             raise Impossible("You cannot target an area that you cannot see.")
         
-        targets_hit = False
-        for actor in self.engine.game_map.actors:
-            if actor.distance(*target_xy) <= self.radius:
-                self.engine.message_log.add_message(
-                    f"The {actor.name} is engulfed in a fiery explosion, taking {self.damage} damage!"
-                )
-                actor.fighter.take_damage(self.damage)
-                targets_hit = True
+        targets = self.engine.game_map.actors_within(target_xy, self.radius)
+        for actor in targets:
+            self.engine.message_log.add_message(
+                f"The {actor.name} is engulfed in a fiery explosion, taking {self.damage} damage!"
+            )
+            actor.fighter.take_damage(self.damage)
         
-        if not targets_hit:
+        if not targets:
             raise Impossible("There are no targets in the radius.")
         self.consume()
 
@@ -127,16 +129,11 @@ class LightningDamageConsumable(Consumable):
     
     def activate(self, action: actions.ItemAction) -> None:
         consumer = action.entity
-        target = None
-        closest_distance = self.maximum_range + 1.0
-        
-        for actor in self.engine.game_map.actors:
-            if actor is not consumer and self.parent.gamemap.visible[actor.x, actor.y]:
-                distance = consumer.distance(actor.x, actor.y)
-                
-                if distance < closest_distance:
-                    target = actor
-                    closest_distance = distance
+        target = self.engine.game_map.nearest_visible_actor(
+            (consumer.x, consumer.y),
+            max_distance=self.maximum_range + 1.0,
+            exclude=consumer,
+        )
         
         if target:
             self.engine.message_log.add_message(
@@ -1,9 +1,10 @@
 from __future__ import annotations
 
-from typing import Optional, TYPE_CHECKING
+from typing import Any, Dict, Optional, TYPE_CHECKING
 
 from components.base_component import BaseComponent
 from equipment_types import EquipmentType
+import events
 
 if TYPE_CHECKING:
     from entity import Actor, Item
@@ -14,30 +15,27 @@ class Equipment(BaseComponent):
     def __init__(self, weapon: Optional[Item] = None, armor: Optional[Item] = None):
         self.weapon = weapon
         self.armor = armor
-    
-    @property
-    def defense_bonus(self) -> int:
-        bonus = 0
-        
-        if self.weapon is not None and self.weapon.equippable is not None:
-            bonus += self.weapon.equippable.defense_bonus
         
-        if self.armor is not None and self.armor.equippable is not None:
-            bonus += self.armor.equippable.defense_bonus
-        
-        return bonus
+        # Running totals of the equipped items' bonuses, updated on every (un)equip.
+        self.defense_bonus = 0
+        self.power_bonus = 0
+        for item in (weapon, armor):
+            self.add_bonuses(item, 1)
     
-    @property
-    def power_bonus(self) -> int:
-        bonus = 0
-        
-        if self.weapon is not None and self.weapon.equippable is not None:
-            bonus += self.weapon.equippable.power_bonus
-        
-        if self.armor is not None and self.armor.equippable is not None:
-            bonus += self.armor.equippable.power_bonus
-        
-        return bonus
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        if "defense_bonus" not in state:
+            # Saves from before the running totals existed. Sum the equipped items' bonuses once.
+            self.defense_bonus = 0
+            self.power_bonus = 0
+            for item in (self.weapon, self.armor):
+                self.add_bonuses(item, 1)
+    
+    def add_bonuses(self, item: Optional[Item], sign: int) -> None:
+        """Add (sign=1) or remove (sign=-1) an item's bonuses from the running totals."""
+        if item is not None and item.equippable is not None:
+            self.defense_bonus += sign * item.equippable.defense_bonus
+            self.power_bonus += sign * item.equippable.power_bonus
     
     def item_is_equipped(self, item: Item) -> bool:
         return self.weapon == item or self.armor == item
@@ -59,6 +57,9 @@ class Equipment(BaseComponent):
             self.unequip_from_slot(slot, add_message)
         
         setattr(self, slot, item)
+        self.add_bonuses(item, 1)
+        self.parent.fighter.invalidate_stats()
+        events.publish(self.parent, events.Equipped(self.parent.entity_id, item.entity_id, slot))
         
         if add_message:
             self.equip_message(item.name)
@@ -70,6 +71,9 @@ class Equipment(BaseComponent):
             self.unequip_message(current_item.name)
         
         setattr(self, slot, None)
+        self.add_bonuses(current_item, -1)
+        self.parent.fighter.invalidate_stats()
+        events.publish(self.parent, events.Unequipped(self.parent.entity_id, current_item.entity_id, slot))
     
     def toggle_equip(self, equippable_item: Item, add_message: bool = True) -> None:
         if (
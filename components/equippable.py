@@ -21,19 +21,3 @@ class Equippable(BaseComponent):
         
         self.power_bonus = power_bonus
         self.defense_bonus = defense_bonus
-
-class Dagger(Equippable):
-    def __init__(self) -> None:
-        super().__init__(equipment_type=EquipmentType.WEAPON, power_bonus=2)
-
-class Sword(Equippable):
-    def __init__(self) -> None:
-        super().__init__(equipment_type=EquipmentType.WEAPON, power_bonus=4)
-
-class LeatherArmor(Equippable):
-    def __init__(self) -> None:
-        super().__init__(equipment_type=EquipmentType.ARMOR, defense_bonus=1)
-
-class ChainMail(Equippable):
-    def __init__(self) -> None:
-        super().__init__(equipment_type=EquipmentType.ARMOR, defense_bonus=3)
\ No newline at end of file
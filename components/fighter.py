@@ -1,8 +1,9 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from typing import Any, Dict, Optional, Tuple, TYPE_CHECKING
 
 import color
+import events
 from components.base_component import BaseComponent
 from render_order import RenderOrder
 
@@ -15,8 +16,25 @@ class Fighter(BaseComponent):
     def __init__(self, hp: int, base_defense: int, base_power: int):
         self.max_hp = hp
         self._hp = hp
-        self.base_defense = base_defense
-        self.base_power = base_power
+        self._base_defense = base_defense
+        self._base_power = base_power
+        
+        # Temporary buffs and debuffs, as (power, defense) by source name.
+        self.modifiers: Dict[str, Tuple[int, int]] = {}
+        
+        # Derived stats are cached until equipment, base stats or modifiers change.
+        self._defense: Optional[int] = None
+        self._power: Optional[int] = None
+    
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        if "base_power" in state:
+            # Saves from before stats were cached stored the base stats as plain attributes.
+            state["_base_power"] = state.pop("base_power")
+            state["_base_defense"] = state.pop("base_defense")
+            state.setdefault("modifiers", {})
+        state.setdefault("_defense", None)
+        state.setdefault("_power", None)
+        self.__dict__.update(state)
     
     @property
     def hp(self) -> int:
@@ -24,31 +42,74 @@ class Fighter(BaseComponent):
     
     @hp.setter
     def hp(self, value: int) -> None:
+        previous_hp = self._hp
         self._hp = max(0, min(value, self.max_hp))
+        if self._hp < previous_hp:
+            events.publish(self.parent, events.Damaged(self.parent.entity_id, previous_hp - self._hp, self._hp))
+        elif self._hp > previous_hp:
+            events.publish(self.parent, events.Healed(self.parent.entity_id, self._hp - previous_hp, self._hp))
         if self._hp == 0 and self.parent.ai:
             self.die()
     
+    @property
+    def base_defense(self) -> int:
+        return self._base_defense
+    
+    @base_defense.setter
+    def base_defense(self, value: int) -> None:
+        self._base_defense = value
+        self.invalidate_stats()
+    
+    @property
+    def base_power(self) -> int:
+        return self._base_power
+    
+    @base_power.setter
+    def base_power(self, value: int) -> None:
+        self._base_power = value
+        self.invalidate_stats()
+    
     @property
     def defense(self) -> int:
-        return self.base_defense + self.defense_bonus
+        if self._defense is None:
+            self._defense = self.base_defense + self.defense_bonus
+        return self._defense
     
     @property
     def power(self) -> int:
-        return self.base_power + self.power_bonus
+        if self._power is None:
+            self._power = self.base_power + self.power_bonus
+        return self._power
     
     @property
     def defense_bonus(self) -> int:
+        bonus = sum(defense for _, defense in self.modifiers.values())
         if self.parent.equipment:
-            return self.parent.equipment.defense_bonus
-        else:
-            return 0
+            bonus += self.parent.equipment.defense_bonus
+        return bonus
     
     @property
     def power_bonus(self) -> int:
+        bonus = sum(power for power, _ in self.modifiers.values())
         if self.parent.equipment:
-            return self.parent.equipment.power_bonus
-        else:
-            return 0
+            bonus += self.parent.equipment.power_bonus
+        return bonus
+    
+    def invalidate_stats(self) -> None:
+        """Forget the cached power and defense, so they are recomputed on the next read.
+        Must be called whenever anything they are derived from changes."""
+        self._defense = None
+        self._power = None
+    
+    def add_modifier(self, source: str, power: int = 0, defense: int = 0) -> None:
+        """Add a buff or debuff. Adding another modifier from the same source replaces it."""
+        self.modifiers[source] = (power, defense)
+        self.invalidate_stats()
+    
+    def remove_modifier(self, source: str) -> None:
+        """Remove the modifier added by `source`, if there is one."""
+        if self.modifiers.pop(source, None) is not None:
+            self.invalidate_stats()
     
     def die(self) -> None:
         if self.engine.player is self.parent:
@@ -58,16 +119,21 @@ class Fighter(BaseComponent):
             death_message = f"{self.parent.name} is dead!"
             death_message_color = color.enemy_die
         
+        self.become_remains()
+        events.publish(self.parent, events.Died(self.parent.entity_id))
+        
+        self.engine.message_log.add_message(death_message, death_message_color)
+        
+        self.engine.player.level.add_xp(self.parent.level.xp_given)
+    
+    def become_remains(self) -> None:
+        """Turn the parent actor into a corpse."""
         self.parent.char = "%"
         self.parent.color = (191, 0, 0)
         self.parent.blocks_movement = False
         self.parent.ai = None
         self.parent.name = f"remains of {self.parent.name}"
         self.parent.render_order = RenderOrder.CORPSE
-        
-        self.engine.message_log.add_message(death_message, death_message_color)
-        
-        self.engine.player.level.add_xp(self.parent.level.xp_given)
     
     def heal(self, amount: int) -> int:
         if self.hp == self.max_hp:
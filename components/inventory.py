@@ -1,22 +1,107 @@
 from __future__ import annotations
 
-from typing import List, TYPE_CHECKING
+from typing import Dict, Hashable, Optional, Tuple, TYPE_CHECKING
 
 from components.base_component import BaseComponent
+import events
 
 if TYPE_CHECKING:
     from entity import Actor, Item
 
+def item_kinds(item: Item) -> Tuple[Hashable, ...]:
+    """Return the kinds an item is indexed under: "consumable", "equippable" and its EquipmentType."""
+    kinds: Tuple[Hashable, ...] = ()
+    if item.consumable:
+        kinds += ("consumable",)
+    if item.equippable:
+        kinds += ("equippable", item.equippable.equipment_type)
+    return kinds
+
 class Inventory(BaseComponent):
+    """The items an actor carries.
+    Items are their own handles: adding and removing one is O(1), and so is looking up every
+    item of a kind. Stackable items (those with a stack count, like gold) merge into the stack
+    of the same name that is already held."""
     parent: Actor
-    
+
     def __init__(self, capacity: int):
         self.capacity = capacity
-        self.items: List[Item] = []
-    
+        # Dicts are used as insertion-ordered sets, so the menu lists items in pickup order.
+        self._items: Dict[Item, None] = {}
+        self._by_kind: Dict[Hashable, Dict[Item, None]] = {}
+        self._stacks: Dict[str, Item] = {}
+        # Bumped on every change, so views of the inventory know when to rebuild.
+        self.version = 0
+        self._view: Optional[Tuple[int, Tuple[Item, ...]]] = None
+
+    def __setstate__(self, state: dict) -> None:
+        if "items" in state:
+            # Saves from before the inventory was indexed stored a plain list.
+            items = state.pop("items")
+            self.__init__(state.pop("capacity"))
+            self.__dict__.update(state)
+            for item in items:
+                self.add(item)
+        else:
+            self.__dict__.update(state)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, item: object) -> bool:
+        return item in self._items
+
+    @property
+    def items(self) -> Tuple[Item, ...]:
+        """Every held item in pickup order. The tuple is cached until the inventory changes."""
+        if self._view is None or self._view[0] != self.version:
+            self._view = (self.version, tuple(self._items))
+        return self._view[1]
+
+    @property
+    def is_full(self) -> bool:
+        return len(self._items) >= self.capacity
+
+    def can_hold(self, item: Item) -> bool:
+        """Return True if `item` fits, either in a free slot or on an existing stack."""
+        return not self.is_full or (item.stack > 0 and item.name in self._stacks)
+
+    def of_kind(self, kind: Hashable) -> Tuple[Item, ...]:
+        """Return the held items of a kind, such as "consumable" or EquipmentType.WEAPON."""
+        return tuple(self._by_kind.get(kind, ()))
+
+    def add(self, item: Item) -> Item:
+        """Add an item, merging it into a matching stack if there is one.
+        Returns the item that now holds it, which is the existing stack after a merge."""
+        self.version += 1
+        if item.stack > 0:
+            stack = self._stacks.get(item.name)
+            if stack is not None:
+                stack.stack += item.stack
+                return stack
+            self._stacks[item.name] = item
+
+        item.parent = self
+        self._items[item] = None
+        for kind in item_kinds(item):
+            self._by_kind.setdefault(kind, {})[item] = None
+        return item
+
+    def remove(self, item: Item) -> None:
+        """Remove an item (or its whole stack) from the inventory."""
+        del self._items[item]
+        for kind in item_kinds(item):
+            del self._by_kind[kind][item]
+        if self._stacks.get(item.name) is item:
+            del self._stacks[item.name]
+        self.version += 1
+
     def drop(self, item: Item) -> None:
         """Removes an item from the inventory and restores it to the game map, at the player's current location."""
-        self.items.remove(item)
+        self.remove(item)
         item.place(self.parent.x, self.parent.y, self.gamemap)
-        
-        self.engine.message_log.add_message(f"You dropped the {item.name}.")
\ No newline at end of file
+        events.publish(
+            self.parent, events.Dropped(self.parent.entity_id, item.entity_id, item.x, item.y)
+        )
+
+        self.engine.message_log.add_message(f"You dropped the {item.name}.")
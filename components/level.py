@@ -3,6 +3,7 @@ from __future__ import annotations
 from typing import TYPE_CHECKING
 
 from components.base_component import BaseComponent
+import events
 
 if TYPE_CHECKING:
     from entity import Actor
@@ -37,6 +38,7 @@ class Level(BaseComponent):
             return
         
         self.current_xp += xp
+        events.publish(self.parent, events.GainedXp(self.parent.entity_id, xp, self.current_xp))
         
         self.engine.message_log.add_message(f"You gain {xp} experience points.")
         
@@ -49,6 +51,31 @@ class Level(BaseComponent):
         self.current_xp -= self.experience_to_next_level
         
         self.current_level += 1
+        
+        fighter = self.parent.fighter
+        events.publish(
+            self.parent,
+            events.Leveled(
+                self.parent.entity_id,
+                self.current_level,
+                self.current_xp,
+                fighter.max_hp,
+                fighter.hp,
+                fighter.base_power,
+                fighter.base_defense,
+            ),
+        )
+    
+    def increase_stat(self, stat: str) -> None:
+        """Apply a level up choice by name: "hp", "power" or "defense"."""
+        if stat == "hp":
+            self.increase_max_hp()
+        elif stat == "power":
+            self.increase_power()
+        elif stat == "defense":
+            self.increase_defense()
+        else:
+            raise ValueError(f"Unknown stat: {stat!r}")
     
     def increase_max_hp(self, amount: int = 20) -> None:
         self.parent.fighter.max_hp += amount
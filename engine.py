@@ -1,35 +1,131 @@
 from __future__ import annotations
 
+import contextlib
+import copy
+import io
 import lzma
 import pickle
 import random
-from typing import TYPE_CHECKING
+from typing import Any, Dict, Iterator, Optional, TYPE_CHECKING
 
 from tcod.console import Console
-from tcod.map import compute_fov
 
+from camera import Camera
+from events import EventBus, TurnEnded
 import exceptions
 from message_log import MessageLog
 import render_functions
-import settings
+from settings import Config
 
 if TYPE_CHECKING:
     from entity import Actor
     from game_map import GameMap, GameWorld
+    from observations import ObservationRing
+    from replay import SessionRecorder
 
 class Engine:
     game_map: GameMap
     game_world: GameWorld
     
-    def __init__(self, player: Actor):
+    def __init__(self, player: Actor, config: Config):
+        self.config = config
         self.message_log = MessageLog()
         self.mouse_location = (0, 0)
         self.player = player
-        self.world_seed = settings.seed
+        self.world_seed = config.seed
         self.seed_state = None
+        self.events = EventBus()
+        self.turn = 0
+        self.recorder: Optional[SessionRecorder] = None
+        self.camera = Camera(*config.viewport_size)
+    
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state["recorder"] = None # A recording belongs to the session that started it, not to saves.
+        return state
+    
+    def __setstate__(self, state: dict) -> None:
+        # Saves from before events existed have no bus or turn counter.
+        state.setdefault("events", EventBus())
+        state.setdefault("turn", 0)
+        state.setdefault("recorder", None)
+        state.setdefault("camera", Camera())
+        if "config" not in state:
+            # Saves from before configs existed. Their difficulty wasn't saved, so the default is assumed.
+            player = state["player"]
+            state["config"] = Config(
+                player_name=player.name, player_class=str(player.character_class), seed=state["world_seed"]
+            )
+        self.__dict__.update(state)
+    
+    def fork(self) -> Engine:
+        """Return an independent copy of this game, for lookahead search such as rollouts.
+        
+        The map grids are forked copy-on-write, so a fork costs about the same however large the
+        floor is, and only the chunks a fork changes are ever copied. The floors the player has left
+        are shared, as they are only read until the player returns to them, except that the fork
+        holds its own copy of floors this game has spilled to disk. The message log,
+        the event subscribers, the recording and the camera are not copied: the fork starts with
+        empty ones. Everything else, the entities and their components, is copied.
+        
+        The fork takes a copy of the current state of the global RNG. Step it inside
+        `with fork.random_state():` so that it is deterministic and doesn't disturb this game's rolls."""
+        game_map = self.game_map
+        game_world = self.game_world
+        replacements: Dict[int, Any] = {
+            id(self.message_log): MessageLog(),
+            id(self.events): EventBus(),
+            id(self.camera): Camera(self.camera.width, self.camera.height),
+            # Copying a spilled floor reads its data into the copy, leaving this game's floor spilled.
+            id(game_world.stored_floors): game_world.stored_floors.__class__(
+                (floor, copy.copy(stored_floor)) for floor, stored_floor in game_world.stored_floors.items()
+            ),
+        }
+        for grid in (game_map.tiles, game_map.visible, game_map.explored, game_map.awareness.last_visit):
+            replacements[id(grid)] = grid.fork()
+        for name in ("_line_of_sight", "_path_graph"):
+            cache = getattr(game_map, name, None)
+            if cache is not None:
+                replacements[id(cache)] = None # Rebuilt by the fork on first use.
+        
+        # Pickling copies the entities about twice as fast as copy.deepcopy.
+        buffer = io.BytesIO()
+        _ForkPickler(buffer, replacements).dump(self)
+        buffer.seek(0)
+        fork: Engine = _ForkUnpickler(buffer, replacements).load()
+        fork.mouse_location = (0, 0)
+        fork.seed_state = random.getstate()
+        return fork
+    
+    @contextlib.contextmanager
+    def random_state(self) -> Iterator[None]:
+        """Swap this game's own RNG state, `seed_state`, in for the duration of the block.
+        The game uses the global `random` module, so games stepped side by side must each restore theirs."""
+        outer_state = random.getstate()
+        random.setstate(self.seed_state)
+        try:
+            yield
+        finally:
+            self.seed_state = random.getstate()
+            random.setstate(outer_state)
+    
+    def record(self, spec: Dict[str, Any]) -> None:
+        """Record one of the player's inputs, if this session is being recorded."""
+        if self.recorder is not None:
+            self.recorder.record(spec)
+    
+    def end_turn(self) -> None:
+        """Advance the turn counter once everyone has acted."""
+        self.turn += 1
+        self.events.publish(TurnEnded(self.turn))
     
     def handle_enemy_turns(self) -> None:
-        for entity in set(self.game_map.actors) - {self.player}:
+        # Actors take their turns in map order, so replays don't depend on set iteration order.
+        enemies = sorted(set(self.game_map.actors) - {self.player}, key=lambda actor: (actor.y, actor.x))
+        awareness = self.game_map.awareness
+        awareness.update(self.player)
+        # Monsters which don't know about the player and have nowhere to go are skipped entirely.
+        for entity in awareness.active(enemies):
             if entity.ai:
                 try:
                     entity.ai.perform()
@@ -38,16 +134,16 @@ class Engine:
     
     def update_fov(self) -> None:
         """Recompute the visible area based on the player's point of view."""
-        self.game_map.visible[:] = compute_fov(
-            self.game_map.tiles["transparent"],
-            (self.player.x, self.player.y),
-            radius = 8,
+        fov = self.game_map.line_of_sight.visible_from(
+            (self.player.x, self.player.y), radius=self.config.fov_radius
         )
-        # If a tile is "visible" it should be added to "explored".
-        self.game_map.explored |= self.game_map.visible
+        # Tiles which become "visible" are also added to "explored".
+        self.game_map.set_visible(fov.window, fov.mask)
     
     def render(self, console: Console) -> None:
-        self.game_map.render(console)
+        self.game_map.render(
+            console, self.camera.follow(self.player.x, self.player.y, self.game_map)
+        )
         
         self.message_log.render(console=console, x=21, y=45, width=40, height=5)
         
@@ -68,9 +164,42 @@ class Engine:
             console=console, x=21, y=44, engine=self
         )
     
+    def export_observation(self, ring: ObservationRing) -> int:
+        """Write what the player knows into the next slot of an observation ring, for agents learning from the game.
+        Returns the step written."""
+        return ring.append(self)
+    
     def save_as(self, filename: str) -> None:
         """Save this Engine instance as a compressed file."""
         self.seed_state = random.getstate() # This saves the current seed state of the RNG so that it is preserved via saving and loading.
         save_data = lzma.compress(pickle.dumps(self))
         with open(filename, "wb") as f:
-            f.write(save_data)
\ No newline at end of file
+            f.write(save_data)
+
+
+def _replacement(key: int) -> Any:
+    raise RuntimeError("Only _ForkUnpickler can load objects left out by _ForkPickler.")
+
+class _ForkPickler(pickle.Pickler):
+    """Pickles a game for Engine.fork, leaving out the objects in `replacements`.
+    reducer_override is only called for objects which aren't ints, strings and other plain values,
+    which makes it much cheaper than persistent_id for a check on every object."""
+    def __init__(self, file: io.BytesIO, replacements: Dict[int, Any]):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.replacements = replacements
+    
+    def reducer_override(self, obj: Any) -> Any:
+        if id(obj) in self.replacements:
+            return _replacement, (id(obj),)
+        return NotImplemented
+
+class _ForkUnpickler(pickle.Unpickler):
+    """Loads a game pickled by _ForkPickler, putting the replacements in place of the objects left out."""
+    def __init__(self, file: io.BytesIO, replacements: Dict[int, Any]):
+        super().__init__(file)
+        self.replacements = replacements
+    
+    def find_class(self, module: str, name: str) -> Any:
+        if module == __name__ and name == "_replacement":
+            return self.replacements.__getitem__
+        return super().find_class(module, name)
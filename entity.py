@@ -4,6 +4,7 @@ import copy
 import math
 from typing import Optional, Tuple, Type, TypeVar, TYPE_CHECKING, Union
 
+import events
 from render_order import RenderOrder
 
 if TYPE_CHECKING:
@@ -28,6 +29,8 @@ class Entity:
     
     parent: Union[GameMap, Inventory]
     
+    _entity_id: Optional[str] = None
+    
     def __init__(
         self,
         parent: Optional[GameMap] = None,
@@ -55,9 +58,17 @@ class Entity:
     def gamemap(self) -> GameMap:
         return self.parent.gamemap
     
+    @property
+    def entity_id(self) -> str:
+        """A unique id which events use to refer to this entity. Assigned on first use."""
+        if self._entity_id is None:
+            self._entity_id = events.new_entity_id()
+        return self._entity_id
+    
     def spawn(self: T, gamemap: GameMap, x: int, y: int) -> T:
         """Spawn a copy of this instance at the given location."""
         clone = copy.deepcopy(self)
+        clone._entity_id = None
         clone.x = x
         clone.y = y
         clone.parent = gamemap
@@ -83,6 +94,7 @@ class Entity:
         # Move the entity by a given amount
         self.x += dx
         self.y += dy
+        events.publish(self, events.Moved(self.entity_id, self.x, self.y))
 
 class Actor(Entity):
     def __init__(
@@ -1,114 +1,167 @@
-import color
-import settings
+"""Entity templates, compiled from the definitions in data/entities.json.
+
+Every template is available as an attribute of this module, named by its key in the
+definitions file (for example `entity_factories.orc`), and through `templates`.
+Templates are spawned with `Entity.spawn` or copied with `copy.deepcopy`, never used directly."""
+from __future__ import annotations
 
-from components.ai import HostileEnemy
+import hashlib
+import json
+import os
+import pickle
+import sys
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, Mapping, Tuple
+
+import color
+from components import ai, consumable
 from components.character_class import CharacterClass
-from components import consumable, equippable
 from components.equipment import Equipment
+from components.equippable import Equippable
 from components.fighter import Fighter
 from components.inventory import Inventory
 from components.level import Level
 from components.stats import Stats
-from entity import Actor, Item
-
-
-player = Actor(
-    char="@",
-    color=(255, 255, 255),
-    name="Unnamed Player",
-    ai_cls=HostileEnemy,
-    equipment=Equipment(),
-    fighter=Fighter(hp=30, base_defense=1, base_power=2),
-    inventory=Inventory(capacity=26),
-    level=Level(level_up_base=200),
-    stats=Stats(),
-    character_class=CharacterClass(),
-)
+from entity import Actor, Entity, Item
+from equipment_types import EquipmentType
 
-orc = Actor(
-    char="o",
-    color=(63, 127, 63),
-    name="Orc",
-    ai_cls=HostileEnemy,
-    equipment=Equipment(),
-    fighter=Fighter(hp=10, base_defense=0, base_power=3),
-    inventory=Inventory(capacity=0),
-    level=Level(xp_given=35),
-    stats=Stats(),
-    character_class=CharacterClass(),
-)
+DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DEFINITIONS_PATH = os.path.join(DATA_DIRECTORY, "entities.json")
+CACHE_PATH = os.path.join(DATA_DIRECTORY, "entities.cache")
 
-troll = Actor(
-    char="T",
-    color=(0, 127, 0),
-    name="Troll",
-    ai_cls=HostileEnemy,
-    equipment=Equipment(),
-    fighter=Fighter(hp=16, base_defense=1, base_power=4),
-    inventory=Inventory(capacity=0),
-    level=Level(xp_given=100),
-    stats=Stats(),
-    character_class=CharacterClass(),
+# The modules of the classes pickled into the cache, and this compiler. Their source is part of
+# the cache's key, so a change to any of them rebuilds the cache instead of loading stale objects.
+CACHE_KEY_MODULES = (
+    __name__, "color", "entity", "equipment_types", "components.base_component",
+    *sorted({cls.__module__ for cls in (
+        ai.BaseAI, consumable.Consumable, CharacterClass, Equipment, Equippable, Fighter, Inventory, Level, Stats,
+    )}),
 )
 
-gold = Item(
-    char="$",
-    color=color.gold,
-    name="Gold piece",
-)
+def cache_key(source: bytes) -> str:
+    """Return the key of the cache for a definitions file with the contents `source`."""
+    digest = hashlib.sha256(source)
+    for name in CACHE_KEY_MODULES:
+        with open(sys.modules[name].__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
 
-confusion_scroll = Item(
-    char="~",
-    color=(207, 63, 255),
-    name="Confusion Scroll",
-    consumable=consumable.ConfusionConsumable(number_of_turns=10),
-)
+class TemplateTable:
+    """An immutable table of entity templates, indexed both by name and by a dense integer id."""
+    def __init__(self, templates: Dict[str, Entity]):
+        self.names: Tuple[str, ...] = tuple(templates)
+        self.templates: Tuple[Entity, ...] = tuple(templates.values())
+        self.ids: Mapping[str, int] = MappingProxyType(
+            {name: index for index, name in enumerate(self.names)}
+        )
 
-fireball_scroll = Item(
-    char="~",
-    color=(255, 0, 0),
-    name="Fireball Scroll",
-    consumable=consumable.FireballDamageConsumable(damage=12, radius=3),
-)
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state["ids"] = dict(self.ids) # MappingProxyType can't be pickled.
+        return state
 
-health_potion = Item(
-    char="!",
-    color=(127, 0, 255),
-    name="Health Potion",
-    consumable=consumable.HealingConsumable(amount=4),
-)
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        state["ids"] = MappingProxyType(state["ids"])
+        self.__dict__.update(state)
 
-lightning_scroll = Item(
-    char="~",
-    color=(255, 255, 0),
-    name="Lightning Scroll",
-    consumable=consumable.LightningDamageConsumable(damage=20, maximum_range=5),
-)
+    def __getitem__(self, name: str) -> Entity:
+        return self.templates[self.ids[name]]
 
-dagger = Item(
-    char=")",
-    color=(0, 191, 255),
-    name="Dagger",
-    equippable=equippable.Dagger(),
-)
+    def __contains__(self, name: object) -> bool:
+        return name in self.ids
 
-sword = Item(
-    char=")",
-    color=(0, 191, 255),
-    name="Sword",
-    equippable=equippable.Sword(),
-)
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
 
-leather_armor = Item(
-    char="[",
-    color=(139,69,19),
-    name="Leather Armor",
-    equippable=equippable.LeatherArmor(),
-)
+    def __len__(self) -> int:
+        return len(self.names)
+
+def compile_color(value: Any) -> Tuple[int, int, int]:
+    """Colors are either [r, g, b] lists or the name of a color in the color module."""
+    if isinstance(value, str):
+        return getattr(color, value)
+    r, g, b = value
+    return r, g, b
+
+def compile_definition(name: str, definition: Dict[str, Any]) -> Entity:
+    """Build one template from its definition."""
+    common = {
+        "char": definition.get("char", "?"),
+        "color": compile_color(definition.get("color", [255, 255, 255])),
+        "name": definition.get("name", name),
+    }
+
+    if definition["kind"] == "actor":
+        return Actor(
+            **common,
+            ai_cls=getattr(ai, definition.get("ai", "HostileEnemy")),
+            equipment=Equipment(),
+            fighter=Fighter(**definition["fighter"]),
+            inventory=Inventory(**definition.get("inventory", {"capacity": 0})),
+            level=Level(**definition.get("level", {})),
+            stats=Stats(**definition.get("stats", {})),
+            character_class=CharacterClass(**definition.get("character_class", {})),
+        )
+
+    if definition["kind"] == "item":
+        consumable_component = None
+        if "consumable" in definition:
+            arguments = dict(definition["consumable"])
+            consumable_cls = getattr(consumable, arguments.pop("type"))
+            if not issubclass(consumable_cls, consumable.Consumable):
+                raise ValueError(f"{name}: {consumable_cls.__name__} is not a Consumable.")
+            consumable_component = consumable_cls(**arguments)
+
+        equippable_component = None
+        if "equippable" in definition:
+            arguments = dict(definition["equippable"])
+            arguments["equipment_type"] = EquipmentType[arguments["equipment_type"]]
+            equippable_component = Equippable(**arguments)
+
+        return Item(
+            **common,
+            consumable=consumable_component,
+            equippable=equippable_component,
+            stack=definition.get("stack", 0),
+        )
+
+    raise ValueError(f"{name}: unknown entity kind {definition['kind']!r}.")
+
+def load_templates(path: str = DEFINITIONS_PATH, cache_path: str = CACHE_PATH) -> TemplateTable:
+    """Return the compiled templates for a definitions file.
+    The compiled table is cached next to the definitions, and reused for as long as the
+    definitions file and the code of the templates' classes are unchanged."""
+    with open(path, "rb") as f:
+        source = f.read()
+    source_hash = cache_key(source)
+
+    try:
+        with open(cache_path, "rb") as f:
+            cached_hash, table = pickle.load(f)
+        if cached_hash == source_hash:
+            return table
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+        pass # A missing or unreadable cache is rebuilt below.
+
+    definitions = json.loads(source)
+    table = TemplateTable(
+        {name: compile_definition(name, definition) for name, definition in definitions.items()}
+    )
+
+    try:
+        temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as f:
+            pickle.dump((source_hash, table), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, cache_path)
+    except OSError:
+        pass # The cache is only an optimization, so a read-only data directory is fine.
+
+    return table
+
+templates = load_templates()
 
-chain_mail = Item(
-    char="[",
-    color=(139, 69, 19),
-    name="Chain Mail",
-    equippable=equippable.ChainMail(),
-)
\ No newline at end of file
+def __getattr__(name: str) -> Entity:
+    """Expose every template as a module attribute, such as `entity_factories.orc`."""
+    if name in templates:
+        return templates[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
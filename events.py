@@ -0,0 +1,340 @@
+"""Typed game events, the bus that delivers them, and an append-only journal of them.
+
+Components publish an event for every change they make to the game state, so the renderer,
+the message log or analytics can subscribe instead of polling. EventJournal writes every event
+to a log next to a snapshot of the game, and `recover` rebuilds the game from the two after a crash.
+Events hold the resulting values (an actor's new hp, not only the damage dealt), so replaying one
+only has to copy those values back."""
+from __future__ import annotations
+
+import contextlib
+import json
+import lzma
+import os
+import pickle
+import random
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Type, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from engine import Engine
+    from entity import Entity
+
+SNAPSHOT_FILENAME = "snapshot.sav"
+LOG_FILENAME = "events.log"
+
+class Moved(NamedTuple):
+    entity: str
+    x: int
+    y: int
+
+    def apply(self, replay: Replay) -> None:
+        entity = replay.entity(self.entity)
+        entity.x, entity.y = self.x, self.y
+
+class Damaged(NamedTuple):
+    entity: str
+    amount: int
+    hp: int
+
+    def apply(self, replay: Replay) -> None:
+        # Bypass the hp setter, deaths are replayed by their own event.
+        replay.entity(self.entity).fighter._hp = self.hp
+
+class Healed(NamedTuple):
+    entity: str
+    amount: int
+    hp: int
+
+    def apply(self, replay: Replay) -> None:
+        replay.entity(self.entity).fighter._hp = self.hp
+
+class Died(NamedTuple):
+    entity: str
+
+    def apply(self, replay: Replay) -> None:
+        replay.entity(self.entity).fighter.become_remains()
+
+class Attacked(NamedTuple):
+    attacker: str
+    target: str
+    damage: int
+
+    def apply(self, replay: Replay) -> None:
+        pass # The damage itself is a separate event.
+
+class PickedUp(NamedTuple):
+    entity: str
+    item: str
+
+    def apply(self, replay: Replay) -> None:
+        item = replay.entity(self.item)
+        replay.engine.game_map.entities.discard(item)
+        replay.entity(self.entity).inventory.add(item)
+
+class Dropped(NamedTuple):
+    entity: str
+    item: str
+    x: int
+    y: int
+
+    def apply(self, replay: Replay) -> None:
+        item = replay.entity(self.item)
+        replay.entity(self.entity).inventory.remove(item)
+        item.place(self.x, self.y, replay.engine.game_map)
+
+class Consumed(NamedTuple):
+    entity: str
+    item: str
+
+    def apply(self, replay: Replay) -> None:
+        replay.entity(self.entity).inventory.remove(replay.entity(self.item))
+
+class Equipped(NamedTuple):
+    entity: str
+    item: str
+    slot: str
+
+    def apply(self, replay: Replay) -> None:
+        equipment = replay.entity(self.entity).equipment
+        equipment.equip_to_slot(self.slot, replay.entity(self.item), add_message=False)
+
+class Unequipped(NamedTuple):
+    entity: str
+    item: str
+    slot: str
+
+    def apply(self, replay: Replay) -> None:
+        replay.entity(self.entity).equipment.unequip_from_slot(self.slot, add_message=False)
+
+class GainedXp(NamedTuple):
+    entity: str
+    amount: int
+    xp: int
+
+    def apply(self, replay: Replay) -> None:
+        replay.entity(self.entity).level.current_xp = self.xp
+
+class Leveled(NamedTuple):
+    entity: str
+    level: int
+    xp: int
+    max_hp: int
+    hp: int
+    base_power: int
+    base_defense: int
+
+    def apply(self, replay: Replay) -> None:
+        actor = replay.entity(self.entity)
+        actor.level.current_level = self.level
+        actor.level.current_xp = self.xp
+        actor.fighter.max_hp = self.max_hp
+        actor.fighter._hp = self.hp
+        actor.fighter.base_power = self.base_power
+        actor.fighter.base_defense = self.base_defense
+
+class TurnEnded(NamedTuple):
+    turn: int
+
+    def apply(self, replay: Replay) -> None:
+        replay.engine.turn = self.turn
+
+class FloorChanged(NamedTuple):
+    floor: int
+
+    def apply(self, replay: Replay) -> None:
+        pass # EventJournal takes a new snapshot on a floor change instead of logging it, so there is nothing to replay.
+
+EVENT_TYPES: Dict[str, Type[Any]] = {
+    event_type.__name__: event_type
+    for event_type in (
+        Moved, Damaged, Healed, Died, Attacked, PickedUp, Dropped, Consumed,
+        Equipped, Unequipped, GainedXp, Leveled, TurnEnded,
+    )
+} # The events which can appear in a journal's log. FloorChanged never does.
+
+def new_entity_id() -> str:
+    return uuid.uuid4().hex
+
+def publish(source: Entity, event: Any) -> None:
+    """Publish `event` on the bus of the game `source` belongs to."""
+    try:
+        bus = source.gamemap.engine.events
+    except AttributeError:
+        return # Templates and simulated entities aren't part of a game, so nothing is listening.
+    bus.publish(event)
+
+class EventBus:
+    """Delivers published events to the callbacks subscribed to their type."""
+    def __init__(self) -> None:
+        # Callbacks by event type. Callbacks under None receive every event.
+        self.subscribers: Dict[Optional[type], List[Callable[[Any], None]]] = {}
+        self._muted = 0
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Subscribers are live objects such as open files, so they are never saved.
+        return {"subscribers": {}, "_muted": 0}
+
+    def subscribe(self, callback: Callable[[Any], None], *event_types: type) -> None:
+        """Call `callback` with every event of the given types, or with every event if none are given."""
+        for event_type in event_types or (None,):
+            self.subscribers.setdefault(event_type, []).append(callback)
+
+    def unsubscribe(self, callback: Callable[[Any], None]) -> None:
+        for callbacks in self.subscribers.values():
+            while callback in callbacks:
+                callbacks.remove(callback)
+
+    def publish(self, event: Any) -> None:
+        if self._muted or not self.subscribers:
+            return
+        # Copied, since a callback may unsubscribe itself.
+        for callback in tuple(self.subscribers.get(type(event), ())):
+            callback(event)
+        for callback in tuple(self.subscribers.get(None, ())):
+            callback(event)
+
+    @contextlib.contextmanager
+    def muted(self) -> Iterator[None]:
+        """Publish nothing inside this block, which is used while events are being replayed."""
+        self._muted += 1
+        try:
+            yield
+        finally:
+            self._muted -= 1
+
+def world_entities(engine: Engine) -> Iterator[Entity]:
+    """Iterate over the entities on the current floor and in their inventories."""
+    for entity in engine.game_map.entities:
+        yield entity
+        inventory = getattr(entity, "inventory", None)
+        if inventory is not None:
+            yield from inventory.items
+
+class Replay:
+    """Applies logged events to a game loaded from a snapshot."""
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.entities = {entity.entity_id: entity for entity in world_entities(engine)}
+
+    def entity(self, entity_id: str) -> Any:
+        return self.entities[entity_id]
+
+    def apply(self, event: Any) -> None:
+        with self.engine.events.muted():
+            event.apply(self)
+
+class EventJournal:
+    """Records every event of a game to an append-only log, next to a snapshot of the game
+    the log starts from. A new snapshot is taken whenever the player changes floors.
+    Snapshots pickle spilled floors from their files, so they stay spilled (see StoredFloor.__getstate__).
+
+    Both files are tagged with a random generation, and are replaced snapshot first. If the
+    game crashes between the two replacements, the log's generation won't match the snapshot's
+    and recovery ignores it, rather than replaying old events onto a newer snapshot."""
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.generation = ""
+        self.engine: Optional[Engine] = None
+        self.file: Optional[Any] = None
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.directory, SNAPSHOT_FILENAME)
+
+    @property
+    def log_path(self) -> str:
+        return os.path.join(self.directory, LOG_FILENAME)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.snapshot_path)
+
+    def last_modified(self) -> float:
+        return max(
+            os.path.getmtime(path) for path in (self.snapshot_path, self.log_path) if os.path.exists(path)
+        )
+
+    def attach(self, engine: Engine) -> None:
+        """Start journaling `engine`, beginning with a fresh snapshot."""
+        os.makedirs(self.directory, exist_ok=True)
+        self.engine = engine
+        engine.events.subscribe(self.record)
+        self.snapshot()
+
+    def detach(self) -> None:
+        if self.engine is not None:
+            self.engine.events.unsubscribe(self.record)
+            self.engine = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def discard(self) -> None:
+        """Stop journaling and delete the journal, so a finished game can't be recovered."""
+        self.detach()
+        for path in (self.snapshot_path, self.log_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def record(self, event: Any) -> None:
+        assert self.engine is not None
+        if isinstance(event, Died) and event.entity == self.engine.player.entity_id:
+            self.discard() # The game is over.
+            return
+        if isinstance(event, FloorChanged):
+            self.snapshot()
+            return
+        assert self.file is not None
+        self.file.write(json.dumps([type(event).__name__, *event]) + "\n")
+        if isinstance(event, (TurnEnded, Leveled)):
+            # Flushing once per turn, not per event, keeps the log cheap. A crash loses at most the current turn.
+            # Level ups are chosen in a menu after the turn that earned them ended, so they are flushed on their own,
+            # rather than waiting for a turn which may come after the game is saved.
+            self.file.flush()
+
+    def snapshot(self) -> None:
+        """Save the whole game and start a new, empty log for it."""
+        engine = self.engine
+        assert engine is not None
+        # Every entity the log may refer to needs its id saved in the snapshot.
+        for entity in world_entities(engine):
+            entity.entity_id
+        self.generation = new_entity_id()
+        engine.seed_state = random.getstate()
+        snapshot = lzma.compress(pickle.dumps({"generation": self.generation, "engine": engine}))
+
+        with open(f"{self.snapshot_path}.tmp", "wb") as f:
+            f.write(snapshot)
+        with open(f"{self.log_path}.tmp", "w") as f:
+            f.write(json.dumps({"generation": self.generation}) + "\n")
+        if self.file is not None:
+            self.file.close()
+        os.replace(f"{self.snapshot_path}.tmp", self.snapshot_path)
+        os.replace(f"{self.log_path}.tmp", self.log_path)
+        self.file = open(self.log_path, "a")
+
+def recover(directory: str) -> Engine:
+    """Rebuild a game from the journal in `directory`: load its snapshot and replay its log.
+    The RNG is restored to its state at the snapshot, so later rolls won't match the lost session's."""
+    journal = EventJournal(directory)
+    with open(journal.snapshot_path, "rb") as f:
+        data = pickle.loads(lzma.decompress(f.read()))
+    engine: Engine = data["engine"]
+    random.setstate(engine.seed_state)
+
+    replay = Replay(engine)
+    try:
+        with open(journal.log_path) as f:
+            header = json.loads(f.readline() or "{}")
+            if header.get("generation") == data["generation"]:
+                for line in f:
+                    try:
+                        name, *fields = json.loads(line)
+                    except ValueError:
+                        break # The last line was cut off by the crash.
+                    replay.apply(EVENT_TYPES[name](*fields))
+    except FileNotFoundError:
+        pass # The snapshot on its own is still a consistent game.
+
+    engine.update_fov()
+    return engine
@@ -0,0 +1,194 @@
+"""Encode rendered consoles as compact diffs against the previous frame, for remote viewers and recordings.
+
+A frame lists only the cells that changed since the previous frame, as runs of identical
+glyph/fg/bg values:
+
+    header: magic, width, height, number of runs, flags
+    skips:  for each run, how many unchanged cells come before it (uint16, or uint32 for huge consoles)
+    counts: for each run, how many cells it covers
+    cells:  for each run, the cell value as a packed (ch int32, fg 3 bytes, bg 3 bytes) record
+
+Cells are numbered row by row, `y * width + x`. The body is zlib-compressed unless FLAG_RAW is set.
+
+Usage: python frame_codec.py --turns 1000 --seed bench
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import struct
+import time
+import zlib
+from typing import List, Optional
+
+import numpy as np # type: ignore
+
+MAGIC = b"GFD1"
+HEADER = struct.Struct("<4sHHIB")
+
+FLAG_KEYFRAME = 1 # The decoder starts from a blank frame instead of the previous one.
+FLAG_WIDE = 2 # Skips and counts are uint32 instead of uint16.
+FLAG_RAW = 4 # The body is not compressed.
+
+# tcod pads its cell records to 12 bytes, these are packed into 10.
+CELL_DTYPE = np.dtype([("ch", "<i4"), ("fg", "u1", (3,)), ("bg", "u1", (3,))])
+
+def console_cells(console: "tcod.console.Console") -> np.ndarray:
+    """Return a console's cells as a packed (height, width) array, whichever order the console uses."""
+    rgb = console.rgb
+    if rgb.shape != (console.height, console.width) or not rgb.flags.c_contiguous:
+        rgb = rgb.T
+    cells = np.empty(rgb.shape, dtype=CELL_DTYPE)
+    cells["ch"] = rgb["ch"]
+    cells["fg"] = rgb["fg"]
+    cells["bg"] = rgb["bg"]
+    return cells
+
+class FrameEncoder:
+    """Encodes each frame as the difference from the one encoded before it."""
+    def __init__(self, compress: bool = True, keyframe_interval: int = 0):
+        self.compress = compress
+        # If set, every Nth frame is a keyframe, so a viewer can join or recover mid-stream.
+        self.keyframe_interval = keyframe_interval
+        self.previous: Optional[np.ndarray] = None
+        self.frames = 0
+
+    def encode(self, cells: np.ndarray, keyframe: bool = False) -> bytes:
+        """Encode a (height, width) array of CELL_DTYPE cells."""
+        height, width = cells.shape
+        if (
+            self.previous is None
+            or self.previous.shape != cells.shape
+            or (self.keyframe_interval and self.frames % self.keyframe_interval == 0)
+        ):
+            keyframe = True
+        self.frames += 1
+
+        current = np.ascontiguousarray(cells, dtype=CELL_DTYPE).ravel()
+        previous = np.zeros_like(current) if keyframe else self.previous.ravel()
+        self.previous = current.reshape(cells.shape).copy()
+
+        raw = current.view(np.uint8).reshape(-1, CELL_DTYPE.itemsize)
+        changed = (raw != previous.view(np.uint8).reshape(raw.shape)).any(axis=1)
+
+        # A run starts at every changed cell which doesn't continue the run of the cell before it.
+        same_as_before = np.zeros_like(changed)
+        same_as_before[1:] = changed[:-1] & (raw[1:] == raw[:-1]).all(axis=1)
+        run_starts = changed & ~same_as_before
+        starts = np.flatnonzero(run_starts)
+        counts = np.bincount(np.cumsum(run_starts)[changed] - 1, minlength=len(starts))
+        ends = starts + counts
+        skips = starts - np.concatenate(([0], ends[:-1]))
+
+        flags = FLAG_KEYFRAME if keyframe else 0
+        index_type = np.uint16
+        if width * height > 0xFFFF:
+            flags |= FLAG_WIDE
+            index_type = np.uint32
+        body = (
+            skips.astype(index_type).tobytes()
+            + counts.astype(index_type).tobytes()
+            + current[starts].tobytes()
+        )
+        if self.compress:
+            body = zlib.compress(body, 1)
+        else:
+            flags |= FLAG_RAW
+        return HEADER.pack(MAGIC, width, height, len(starts), flags) + body
+
+class FrameDecoder:
+    """Rebuilds frames from the output of FrameEncoder, which must be fed in order."""
+    def __init__(self) -> None:
+        self.cells: Optional[np.ndarray] = None
+
+    def decode(self, data: bytes) -> np.ndarray:
+        """Apply one encoded frame and return the full (height, width) frame.
+        The returned array is reused by the next call, copy it to keep it."""
+        magic, width, height, runs, flags = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not an encoded frame.")
+        body = data[HEADER.size:]
+        if not flags & FLAG_RAW:
+            body = zlib.decompress(body)
+
+        if flags & FLAG_KEYFRAME or self.cells is None or self.cells.shape != (height, width):
+            if not flags & FLAG_KEYFRAME:
+                raise ValueError("A stream must start with a keyframe.")
+            self.cells = np.zeros((height, width), dtype=CELL_DTYPE)
+
+        index_type = np.dtype(np.uint32 if flags & FLAG_WIDE else np.uint16)
+        index_bytes = runs * index_type.itemsize
+        skips = np.frombuffer(body, index_type, runs, 0).astype(np.intp)
+        counts = np.frombuffer(body, index_type, runs, index_bytes).astype(np.intp)
+        values = np.frombuffer(body, CELL_DTYPE, runs, 2 * index_bytes)
+
+        # Each run starts after the skipped cells, and after all the cells of the runs before it.
+        starts = np.cumsum(skips) + np.concatenate(([0], np.cumsum(counts)[:-1]))
+        run_offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+        indices = run_offsets + np.arange(counts.sum())
+        self.cells.ravel()[indices] = np.repeat(values, counts)
+        return self.cells
+
+def benchmark(turns: int, seed: str) -> None:
+    """Play random moves, encoding a frame per turn, and report frame sizes and encode times."""
+    import tcod
+
+    import actions
+    import exceptions
+    from settings import Config
+    import setup_game
+
+    config = Config(player_name="Bench", seed=seed)
+    engine = setup_game.new_game(config)
+    console = tcod.console.Console(config.screen_width, config.screen_height, order="F")
+
+    encoder, decoder = FrameEncoder(), FrameDecoder()
+    sizes: List[int] = []
+    encode_times: List[float] = []
+    for _ in range(turns):
+        player = engine.player
+        if not player.is_alive:
+            # Start over, so that the benchmark covers a long stretch of play rather than one short life.
+            engine = setup_game.new_game(config)
+            player = engine.player
+        if player.level.requires_level_up:
+            player.level.increase_power()
+        if (player.x, player.y) == engine.game_map.downstairs_location:
+            action: actions.Action = actions.TakeStairsAction(player)
+        else:
+            action = actions.BumpAction(player, random.choice((-1, 0, 1)), random.choice((-1, 0, 1)))
+        try:
+            action.perform()
+        except exceptions.Impossible:
+            pass
+        engine.handle_enemy_turns()
+        engine.update_fov()
+
+        console.clear()
+        engine.render(console)
+        cells = console_cells(console)
+        start = time.perf_counter()
+        data = encoder.encode(cells)
+        encode_times.append(time.perf_counter() - start)
+        sizes.append(len(data))
+        if not np.array_equal(decoder.decode(data), cells):
+            raise AssertionError("The decoded frame doesn't match the rendered one.")
+
+    full_frame = config.screen_width * config.screen_height * CELL_DTYPE.itemsize
+    encode_times.sort()
+    print(f"frames:             {len(sizes)}")
+    print(f"full frame:         {full_frame} bytes")
+    print(f"first frame:        {sizes[0]} bytes")
+    print(f"bytes per frame:    mean {np.mean(sizes[1:]):.0f}, p50 {np.median(sizes[1:]):.0f}, max {max(sizes[1:])}")
+    print(f"encode time:        p50 {encode_times[len(encode_times) // 2] * 1e6:.0f} us, "
+          f"p99 {encode_times[int(len(encode_times) * 0.99)] * 1e6:.0f} us")
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--seed", default="frame-codec")
+    args = parser.parse_args(argv)
+    benchmark(args.turns, args.seed)
+
+if __name__ == "__main__":
+    main()
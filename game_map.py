@@ -1,11 +1,24 @@
 from __future__ import annotations
 
-from typing import Iterable, Iterator, Optional, TYPE_CHECKING
+import atexit
+from collections import OrderedDict
+import io
+import lzma
+import os
+import pickle
+import shutil
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, TYPE_CHECKING
 
 import numpy as np # type: ignore
 from tcod.console import Console
 
+from awareness import Awareness
+from chunked_grid import ChunkedGrid, PackedBoolGrid, Window
 from entity import Actor, Item
+from events import FloorChanged
+from line_of_sight import LineOfSight
+from path_graph import PathGraph
 import tile_types
 
 if TYPE_CHECKING:
@@ -20,21 +33,96 @@ class GameMap:
         self.engine = engine
         self.width, self.height = width, height
         self.entities = set(entities)
-        self.tiles = np.full((width, height), fill_value=tile_types.wall, order="F")
+        # The map arrays are chunked, so that only the parts of a large map in use take memory.
+        # The masks are also bit-packed, and unpacked a window at a time for rendering and FOV.
+        self.tiles = ChunkedGrid(
+            (width, height), dtype=np.uint8, fill=tile_types.wall
+        ) # Tile ids, see tile_types.palette.
         
-        self.visible = np.full(
-            (width,height), fill_value=False, order="F"
+        self.visible = PackedBoolGrid(
+            (width, height)
         ) # Tiles the player can currently see.
-        self.explored = np.full(
-            (width, height), fill_value=False, order="F"
+        self.visible_window = Window(0, 0, 0, 0) # Where `visible` can be True.
+        self.explored = PackedBoolGrid(
+            (width, height)
         ) # Tiles the player has seen before.
         
         self.downstairs_location = (0, 0)
+        self.upstairs_location: Optional[Tuple[int, int]] = None
+    
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        # Saves from before maps were chunked hold plain arrays, and saves from before the masks were packed hold bool chunks.
+        if isinstance(state["tiles"], np.ndarray):
+            tiles = state["tiles"]
+            if tiles.dtype.names:
+                tiles = tile_types.ids_from_tiles(tiles) # Saves from before tile ids hold the tile structs.
+            state["tiles"] = ChunkedGrid.from_array(tiles, fill=tile_types.wall)
+            state["visible_window"] = Window(0, 0, state["width"], state["height"])
+        for name in ("visible", "explored"):
+            if not isinstance(state[name], PackedBoolGrid):
+                state[name] = PackedBoolGrid.from_array(np.asarray(state[name]))
+        self.__dict__.update(state)
         
     @property
     def gamemap(self) -> GameMap:
         return self
     
+    @property
+    def line_of_sight(self) -> LineOfSight:
+        """The line of sight queries for this map, created on first use."""
+        line_of_sight: Optional[LineOfSight] = getattr(self, "_line_of_sight", None)
+        if line_of_sight is None:
+            line_of_sight = self._line_of_sight = LineOfSight(self)
+        return line_of_sight
+    
+    @property
+    def awareness(self) -> Awareness:
+        """What the monsters on this map know about the player, created on first use."""
+        awareness: Optional[Awareness] = getattr(self, "_awareness", None)
+        if awareness is None:
+            awareness = self._awareness = Awareness(self)
+        return awareness
+    
+    @property
+    def path_graph(self) -> PathGraph:
+        """The graph long paths across this map are planned over, built as it is searched."""
+        path_graph: Optional[PathGraph] = getattr(self, "_path_graph", None)
+        if path_graph is None:
+            path_graph = self._path_graph = PathGraph(self)
+        return path_graph
+    
+    @property
+    def walkable(self) -> np.ndarray:
+        """Return a boolean array of the tiles which can be walked over.
+        This covers the whole map, prefer walkable_in on large maps."""
+        return tile_types.walkable[np.asarray(self.tiles)]
+    
+    @property
+    def transparent(self) -> np.ndarray:
+        """Return a boolean array of the tiles which don't block FOV.
+        This covers the whole map, prefer transparent_in on large maps."""
+        return tile_types.transparent[np.asarray(self.tiles)]
+    
+    def walkable_in(self, window: Window) -> np.ndarray:
+        """Return a boolean array of the tiles in `window` which can be walked over."""
+        return tile_types.walkable[self.tiles.read(window)]
+    
+    def transparent_in(self, window: Window) -> np.ndarray:
+        """Return a boolean array of the tiles in `window` which don't block FOV."""
+        return tile_types.transparent[self.tiles.read(window)]
+    
+    def transparent_at(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Return whether each of the tiles at (xs, ys) doesn't block FOV."""
+        return tile_types.transparent[self.tiles[xs, ys]]
+    
+    def set_visible(self, window: Window, mask: np.ndarray) -> None:
+        """Make the cells of `mask`, which covers `window`, the visible ones, and mark them explored.
+        Only the previous and new windows are touched, however large the map is."""
+        self.visible[self.visible_window.slices] = False
+        self.visible[window.slices] = mask
+        self.explored[window.slices] = self.explored[window.slices] | mask
+        self.visible_window = window
+    
     @property
     def actors(self) -> Iterator[Actor]:
         """Iterate over this map's living actors."""
@@ -53,35 +141,87 @@ class GameMap:
     ) -> Optional[Entity]:
         for entity in self.entities:
             if (
-                entity.blocks_movement
-                and entity.x == location_x
+                entity.x == location_x
                 and entity.y == location_y
+                and entity.blocks_movement
             ):
                 return entity
         
         return None
     
     def get_actor_at_location(self, x: int, y: int) -> Optional[Actor]:
-        for actor in self.actors:
-            if actor.x == x and actor.y == y:
-                return actor
+        # The position is compared first, as it rules out almost every entity.
+        for entity in self.entities:
+            if entity.x == x and entity.y == y and isinstance(entity, Actor) and entity.is_alive:
+                return entity
         
         return None
-    
+
+    def actor_coordinates(self) -> Tuple[List[Actor], np.ndarray, np.ndarray]:
+        """Return the living actors along with their x and y coordinates as arrays.
+        The arrays line up with the list, so `xs[i], ys[i]` is the position of `actors[i]`."""
+        # Sorted by position, so that ties between actors are broken the same way in every process.
+        actors = sorted(self.actors, key=lambda actor: (actor.y, actor.x))
+        xs = np.fromiter((actor.x for actor in actors), dtype=np.intp, count=len(actors))
+        ys = np.fromiter((actor.y for actor in actors), dtype=np.intp, count=len(actors))
+        return actors, xs, ys
+
+    def actors_within(self, xy: Tuple[int, int], radius: float) -> List[Actor]:
+        """Return the living actors whose distance to `xy` is at most `radius`."""
+        actors, xs, ys = self.actor_coordinates()
+        x, y = xy
+        squared_distances = (xs - x) ** 2 + (ys - y) ** 2
+        hits = np.flatnonzero(squared_distances <= radius ** 2)
+        return [actors[i] for i in hits]
+
+    def actors_in_mask(self, mask: np.ndarray) -> List[Actor]:
+        """Return the living actors standing on a True cell of `mask`.
+        `mask` must be a boolean array the same shape as this map."""
+        actors, xs, ys = self.actor_coordinates()
+        hits = np.flatnonzero(mask[xs, ys])
+        return [actors[i] for i in hits]
+
+    def nearest_visible_actor(
+        self,
+        origin: Tuple[int, int],
+        max_distance: float,
+        exclude: Optional[Actor] = None,
+    ) -> Optional[Actor]:
+        """Return the visible living actor closest to `origin`, or None.
+        Only actors strictly closer than `max_distance` are considered.
+        `exclude` is skipped, which is usually the actor doing the searching."""
+        actors, xs, ys = self.actor_coordinates()
+        if not actors:
+            return None
+        x, y = origin
+        squared_distances = ((xs - x) ** 2 + (ys - y) ** 2).astype(np.float64)
+        squared_distances[~self.visible[xs, ys]] = np.inf
+        if exclude is not None:
+            for i, actor in enumerate(actors):
+                if actor is exclude:
+                    squared_distances[i] = np.inf
+        nearest = int(np.argmin(squared_distances))
+        if squared_distances[nearest] < max_distance ** 2:
+            return actors[nearest]
+        return None
+
     def in_bounds(self, x: int, y:int) -> bool:
         """Return True if x and y are inside of the bounds of this map."""
         return 0 <= x < self.width and 0 <= y < self.height
     
-    def render(self, console: Console) -> None:
-        """Renders the map.
+    def render(self, console: Console, window: Optional[Window] = None) -> None:
+        """Renders the part of the map inside `window`, or all of it, to the top left of the console.
         If a tile is in the "visible" array, then draw it with the "light" colors.
         If it isn't, but it's in the "explored" array, then draw it with the "dark" colors.
         Otherwise, the default is "SHROUD"."""
-        console.tiles_rgb[0 : self.width, 0 : self.height] = np.select(
-            condlist=[self.visible, self.explored],
-            choicelist=[self.tiles["light"], self.tiles["dark"]],
-            default=tile_types.SHROUD,
+        if window is None:
+            window = Window(0, 0, self.width, self.height)
+        light_level = (
+            (self.visible.read(window).view(np.uint8) << 1) | self.explored.read(window).view(np.uint8)
         )
+        console.tiles_rgb[0 : window.width, 0 : window.height] = tile_types.graphics[
+            light_level, self.tiles.read(window)
+        ]
         
         entities_sorted_for_rendering = sorted(
             self.entities, key=lambda x: x.render_order.value
@@ -89,13 +229,128 @@ class GameMap:
         
         for entity in entities_sorted_for_rendering:
             # Only print entities that are in the FOV.
-            if self.visible[entity.x, entity.y]:
+            if window.contains(entity.x, entity.y) and self.visible[entity.x, entity.y]:
                 console.print(
-                    x=entity.x, y=entity.y, string=entity.char, fg=entity.color
+                    x=entity.x - window.x, y=entity.y - window.y, string=entity.char, fg=entity.color
                 )
 
+class _EntityPickler(pickle.Pickler):
+    """Pickles a floor's entities without following references back into the live game."""
+    def __init__(self, file: io.BytesIO, game_map: GameMap):
+        super().__init__(file)
+        self.game_map = game_map
+    
+    def persistent_id(self, obj: Any) -> Optional[str]:
+        if obj is self.game_map:
+            return "game_map"
+        if obj is self.game_map.engine:
+            return "engine"
+        if obj is self.game_map.engine.player:
+            return "player"
+        return None
+
+class _EntityUnpickler(pickle.Unpickler):
+    def __init__(self, file: io.BytesIO, game_map: GameMap):
+        super().__init__(file)
+        self.game_map = game_map
+    
+    def persistent_load(self, pid: str) -> Any:
+        if pid == "game_map":
+            return self.game_map
+        if pid == "engine":
+            return self.game_map.engine
+        if pid == "player":
+            return self.game_map.engine.player
+        raise pickle.UnpicklingError(f"Unknown persistent id: {pid!r}")
+
+class StoredFloor:
+    """A compact copy of a floor the player is not on.
+    Tiles are kept as chunks of uint8 tile ids, the explored mask is bit-packed, and the entities
+    are pickled into a compressed blob. The data can be spilled to disk and read back later."""
+    def __init__(self, game_map: GameMap):
+        self.width, self.height = game_map.width, game_map.height
+        self.downstairs_location = game_map.downstairs_location
+        self.upstairs_location = game_map.upstairs_location
+        self.path: Optional[str] = None # Set while the data is spilled to disk.
+        
+        player = game_map.engine.player
+        buffer = io.BytesIO()
+        _EntityPickler(buffer, game_map).dump(
+            [entity for entity in game_map.entities if entity is not player]
+        )
+        
+        self.data: Optional[Dict[str, Any]] = {
+            "tiles": game_map.tiles.copy(), # Chunked, so unused parts of the map take no space.
+            "explored": game_map.explored.copy(),
+            "entities": lzma.compress(buffer.getvalue()),
+        }
+    
+    @property
+    def in_memory(self) -> bool:
+        return self.data is not None
+    
+    def spill(self, path: str) -> None:
+        """Write this floor's data to `path` and release it from memory."""
+        assert self.data is not None
+        with open(path, "wb") as f:
+            pickle.dump(self.data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.path = path
+        self.data = None
+    
+    def __getstate__(self) -> Dict[str, Any]:
+        """Pickle a spilled floor with its data read from disk, so save files are self-contained.
+        This floor itself stays spilled."""
+        state = self.__dict__.copy()
+        state["data"] = self.read()
+        state["path"] = None
+        return state
+    
+    def read(self) -> Dict[str, Any]:
+        """Return this floor's data without changing where it is kept. A spilled floor's file is left in place."""
+        if self.data is not None:
+            return self.data
+        assert self.path is not None
+        with open(self.path, "rb") as f:
+            data: Dict[str, Any] = pickle.load(f)
+        return data
+    
+    def load(self) -> Dict[str, Any]:
+        """Return this floor's data, reading it back into memory if it was spilled."""
+        if self.data is None:
+            assert self.path is not None
+            self.data = self.read()
+            os.remove(self.path)
+            self.path = None
+        return self.data
+    
+    def restore(self, engine: Engine) -> GameMap:
+        """Rebuild a live GameMap from this stored floor."""
+        data = self.load()
+        game_map = GameMap(engine, self.width, self.height)
+        if isinstance(data["tiles"], ChunkedGrid):
+            game_map.tiles = data["tiles"].copy()
+        else:
+            game_map.tiles[:] = data["tiles"] # Stored before maps were chunked.
+        if isinstance(data["explored"], PackedBoolGrid):
+            game_map.explored = data["explored"].copy()
+        else:
+            game_map.explored[:] = (
+                np.unpackbits(data["explored"], count=self.width * self.height)
+                .astype(bool)
+                .reshape((self.width, self.height), order="F")
+            ) # Stored as one packed array, before maps were chunked.
+        game_map.downstairs_location = self.downstairs_location
+        game_map.upstairs_location = self.upstairs_location
+        
+        entities = _EntityUnpickler(
+            io.BytesIO(lzma.decompress(data["entities"])), game_map
+        ).load()
+        game_map.entities.update(entities)
+        return game_map
+
 class GameWorld:
-    """Holds the settings for the GameMap, and generates new maps when moving down the stairs."""
+    """Holds the settings for the GameMap, generates new maps when moving down the stairs,
+    and keeps the floors the player has left so they can be returned to."""
     def __init__(
         self,
         *,
@@ -105,7 +360,8 @@ class GameWorld:
         max_rooms: int,
         room_min_size: int,
         room_max_size: int,
-        current_floor: int = 0
+        current_floor: int = 0,
+        max_floors_in_memory: int = 4,
     ):
         self.engine = engine
         
@@ -118,10 +374,65 @@ class GameWorld:
         self.room_max_size = room_max_size
         
         self.current_floor = current_floor
+        
+        # Floors the player is not on, least recently visited first.
+        # Only the most recent `max_floors_in_memory` of them are kept in memory, the rest are spilled to disk.
+        self.stored_floors: OrderedDict[int, StoredFloor] = OrderedDict()
+        self.max_floors_in_memory = max_floors_in_memory
+        self.spill_directory: Optional[str] = None
+    
+    def __getstate__(self) -> Dict[str, Any]:
+        # Spilled floors pickle their data from disk (see StoredFloor.__getstate__), so they stay spilled here.
+        state = self.__dict__.copy()
+        state["spill_directory"] = None
+        return state
+    
+    def store_current_floor(self) -> None:
+        """Compact the floor the player is leaving, spilling older floors to disk if needed."""
+        if not hasattr(self.engine, "game_map"):
+            return # No floor has been generated yet.
+        
+        self.stored_floors[self.current_floor] = StoredFloor(self.engine.game_map)
+        self.stored_floors.move_to_end(self.current_floor)
+        
+        in_memory = [
+            floor for floor, stored_floor in self.stored_floors.items()
+            if stored_floor.in_memory
+        ]
+        for floor in in_memory[: -self.max_floors_in_memory or None]:
+            if self.spill_directory is None:
+                self.spill_directory = tempfile.mkdtemp(prefix="gold_floors_")
+                atexit.register(shutil.rmtree, self.spill_directory, ignore_errors=True)
+            self.stored_floors[floor].spill(
+                os.path.join(self.spill_directory, f"floor_{floor}.bin")
+            )
+    
+    def descend(self) -> None:
+        """Move the player down one floor, onto that floor's up stairs."""
+        if self.current_floor + 1 not in self.stored_floors:
+            self.generate_floor()
+            return
+        
+        self.store_current_floor()
+        self.current_floor += 1
+        game_map = self.stored_floors.pop(self.current_floor).restore(self.engine)
+        self.engine.game_map = game_map
+        self.engine.player.place(*game_map.upstairs_location, game_map)
+        self.engine.events.publish(FloorChanged(self.current_floor))
+    
+    def ascend(self) -> None:
+        """Move the player up one floor, onto that floor's down stairs."""
+        self.store_current_floor()
+        self.current_floor -= 1
+        game_map = self.stored_floors.pop(self.current_floor).restore(self.engine)
+        self.engine.game_map = game_map
+        self.engine.player.place(*game_map.downstairs_location, game_map)
+        self.engine.events.publish(FloorChanged(self.current_floor))
     
     def generate_floor(self) -> None:
-        from procgen import generate_dungeon
+        from procgen import generate_dungeon, get_generator_for_floor
         
+        self.store_current_floor()
         self.current_floor += 1
         
         self.engine.game_map = generate_dungeon(
@@ -131,4 +442,6 @@ class GameWorld:
             map_width=self.map_width,
             map_height=self.map_height,
             engine=self.engine,
-        )
\ No newline at end of file
+            generator=get_generator_for_floor(self.current_floor),
+        )
+        self.engine.events.publish(FloorChanged(self.current_floor))
\ No newline at end of file
@@ -2,9 +2,10 @@ from __future__ import annotations
 
 import os
 
-from typing import Callable, Optional, Tuple, TYPE_CHECKING, Union
+from typing import Callable, List, Optional, Tuple, TYPE_CHECKING, Union
 
 import copy
+import numpy as np # type: ignore
 import tcod
 
 import actions
@@ -134,6 +135,9 @@ class EventHandler(BaseEventHandler):
         if action is None:
             return False
         
+        if self.engine.recorder is not None:
+            self.engine.record(actions.action_to_spec(action))
+        
         try:
             action.perform()
         except exceptions.Impossible as exc:
@@ -143,11 +147,13 @@ class EventHandler(BaseEventHandler):
         self.engine.handle_enemy_turns()
         
         self.engine.update_fov()
+        self.engine.end_turn()
         return True
     
     def ev_mousemotion(self, event: tcod.event.MouseMotion) -> None:
-        if self.engine.game_map.in_bounds(event.tile.x, event.tile.y):
-            self.engine.mouse_location = event.tile.x, event.tile.y
+        x, y = self.engine.camera.to_map(event.tile.x, event.tile.y)
+        if self.engine.game_map.in_bounds(x, y) and self.engine.camera.on_screen(x, y):
+            self.engine.mouse_location = x, y
     
     def on_render(self, console: tcod.Console) -> None:
         self.engine.render(console)
@@ -324,12 +330,9 @@ class LevelUpEventHandler(AskUserEventHandler):
         index = key - tcod.event.K_a
         
         if 0 <= index <= 2:
-            if index == 0:
-                player.level.increase_max_hp()
-            elif index == 1:
-                player.level.increase_power()
-            else:
-                player.level.increase_defense()
+            stat = ("hp", "power", "defense")[index]
+            self.engine.record({"type": "level_up", "stat": stat})
+            player.level.increase_stat(stat)
         else:
             self.engine.message_log.add_message("Invalid entry.", color.invalid)
             
@@ -348,12 +351,46 @@ class InventoryEventHandler(AskUserEventHandler):
     What happens then depends on the subclass."""
     TITLE = "<missing title>"
     
+    def __init__(self, engine: Engine):
+        super().__init__(engine)
+        # The menu lines, and the inventory version and equipped items they were built from.
+        self._lines: List[str] = []
+        self._lines_key: Optional[Tuple[object, ...]] = None
+    
+    def item_lines(self) -> List[str]:
+        """Return one menu line per inventory item, rebuilding them only when the inventory
+        or the player's equipment has changed since the last frame."""
+        player = self.engine.player
+        key = (player.inventory, player.inventory.version, player.equipment.weapon, player.equipment.armor)
+        if key == self._lines_key:
+            return self._lines
+        
+        lines = []
+        for i, item in enumerate(player.inventory.items):
+            item_key = chr(ord("a") + i)
+            
+            is_equipped = player.equipment.item_is_equipped(item)
+            
+            item_string = f"({item_key}) {item.name}"
+            
+            if is_equipped:
+                item_string = f"{item_string} (E)"
+            if item.stack > 0:
+                item_string = f"({item_key}) {item.stack} {item.name}s"
+            
+            lines.append(item_string)
+        
+        self._lines = lines
+        self._lines_key = key
+        return lines
+    
     def on_render(self, console: tcod.Console) -> None:
         """Render an inventory menu, which displays the items in the inventory, and the letter to select them.
         Will move to a different position based on where the player is located, so the player can always see where
         they are."""
         super().on_render(console)
-        number_of_items_in_inventory = len(self.engine.player.inventory.items)
+        lines = self.item_lines()
+        number_of_items_in_inventory = len(lines)
         
         height = number_of_items_in_inventory + 2
         
@@ -381,18 +418,7 @@ class InventoryEventHandler(AskUserEventHandler):
         )
         
         if number_of_items_in_inventory > 0:
-            for i, item in enumerate(self.engine.player.inventory.items):
-                item_key = chr(ord("a") + i)
-                
-                is_equipped = self.engine.player.equipment.item_is_equipped(item)
-                
-                item_string = f"({item_key}) {item.name}"
-                
-                if is_equipped:
-                    item_string = f"{item_string} (E)"
-                if item.stack > 0:
-                    item_string = f"({item_key}) {item.stack} {item.name}s"
-                
+            for i, item_string in enumerate(lines):
                 console.print(x + 1, y + i + 1, item_string)
         else:
             console.print(x + 1, y + 1, "(Empty)")
@@ -448,7 +474,7 @@ class SelectIndexHandler(AskUserEventHandler):
     def on_render(self, console: tcod.Console) -> None:
         """Highlight the tile under the cursor."""
         super().on_render(console)
-        x, y = self.engine.mouse_location
+        x, y = self.engine.camera.to_screen(*self.engine.mouse_location)
         console.tiles_rgb["bg"][x, y] = color.white
         console.tiles_rgb["fg"][x, y] = color.black
     
@@ -468,9 +494,10 @@ class SelectIndexHandler(AskUserEventHandler):
             dx, dy = MOVE_KEYS[key]
             x += dx * modifier
             y += dy * modifier
-            # Clamp the cursor index to the map size.
-            x = max(0, min(x, self.engine.game_map.width - 1))
-            y = max(0, min(y, self.engine.game_map.height - 1))
+            # Clamp the cursor index to the part of the map on screen.
+            window = self.engine.camera.window(self.engine.game_map)
+            x = max(window.x, min(x, window.x + window.width - 1))
+            y = max(window.y, min(y, window.y + window.height - 1))
             self.engine.mouse_location = x, y
             return None
         elif key in CONFIRM_KEYS:
@@ -481,9 +508,10 @@ class SelectIndexHandler(AskUserEventHandler):
         self, event: tcod.event.MouseButtonDown
     ) -> Optional[ActionOrHandler]:
         """Left click confirms a selection."""
-        if self.engine.game_map.in_bounds(*event.tile):
+        x, y = self.engine.camera.to_map(*event.tile)
+        if self.engine.game_map.in_bounds(x, y) and self.engine.camera.on_screen(x, y):
             if event.button == 1:
-                return self.on_index_selected(*event.tile)
+                return self.on_index_selected(x, y)
         return super().ev_mousebuttondown(event)
     
     def on_index_selected(self, x: int, y: int) -> Optional[ActionOrHandler]:
@@ -525,17 +553,22 @@ class AreaRangedAttackHandler(SelectIndexHandler):
         """Highlight the tile under the cursor."""
         super().on_render(console)
         
+        camera = self.engine.camera
         x, y = self.engine.mouse_location
         
-        # Draw a rectangle around the targeted area, so the player can see the affected tiles.
-        console.draw_frame(
-            x=x - self.radius - 1,
-            y=y - self.radius - 1,
-            width=self.radius ** 2,
-            height=self.radius ** 2,
-            fg=color.red,
-            clear=False,
-        )
+        # Tint the targeted area red, so the player can see exactly which tiles will be affected.
+        # The area comes from a cached stencil, so moving the cursor doesn't recompute it.
+        window = camera.window(self.engine.game_map)
+        (area_x, area_y), stencil = self.engine.game_map.line_of_sight.area((x, y), self.radius, window)
+        area_bg = console.rgb["bg"][
+            area_x.start - camera.x : area_x.stop - camera.x, area_y.start - camera.y : area_y.stop - camera.y
+        ]
+        area_bg[stencil] = area_bg[stencil] // 2 + np.array(color.red, dtype=np.uint8) // 2
+        
+        # Keep the cursor itself highlighted.
+        x, y = camera.to_screen(x, y)
+        console.rgb["bg"][x, y] = color.white
+        console.rgb["fg"][x, y] = color.black
     
     def on_index_selected(self, x: int, y: int) -> Optional[Action]:
         return self.callback((x, y))
@@ -553,6 +586,11 @@ class MainGameEventHandler(EventHandler):
             tcod.event.KMOD_LSHIFT | tcod.event.KMOD_RSHIFT
         ):
             return actions.TakeStairsAction(player)
+        
+        if key == tcod.event.K_COMMA and modifier & (
+            tcod.event.KMOD_LSHIFT | tcod.event.KMOD_RSHIFT
+        ):
+            return actions.TakeUpStairsAction(player)
 
         if key in MOVE_KEYS:
             dx, dy = MOVE_KEYS[key]
@@ -0,0 +1,106 @@
+"""A content-addressed, on-disk cache of generated map layouts."""
+from __future__ import annotations
+
+import functools
+import glob
+import hashlib
+import inspect
+import json
+import os
+import sys
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np # type: ignore
+
+import settings
+
+# The modules every generator builds on. Their source is part of the cache's key, as is the source
+# of the generator itself, so a change to any of them regenerates layouts instead of loading stale ones.
+CACHE_KEY_MODULES = ("procgen", "tile_types", __name__)
+
+@functools.lru_cache(maxsize=None)
+def source_digest(generator: Callable[..., Any]) -> str:
+    """Return the hash of the source code a layout made by `generator` depends on."""
+    digest = hashlib.sha256(inspect.getsource(generator).encode("utf-8"))
+    for name in CACHE_KEY_MODULES:
+        with open(sys.modules[name].__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+class LayoutCache:
+    """Stores layouts as compressed `.npz` files named after the hash of what produced them.
+    Only the `max_entries` most recently used layouts are kept."""
+    def __init__(
+        self,
+        directory: str = os.path.join(settings.GAME_DIRECTORY, "layout_cache"),
+        max_entries: int = 256,
+    ):
+        self.directory = directory
+        self.max_entries = max_entries
+
+    @staticmethod
+    def key(
+        generator_name: str,
+        generator: Callable[..., Any],
+        params: Dict[str, Any],
+        seed: str,
+        floor: int,
+    ) -> str:
+        """Return the cache key for a layout.
+        The key changes whenever the generator or the code it uses, its parameters, the world seed
+        or the floor change."""
+        description = json.dumps(
+            {
+                "source": source_digest(generator),
+                "generator": generator_name,
+                "params": params,
+                "seed": seed,
+                "floor": floor,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(description.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.npz")
+
+    def load(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        """Return the arrays stored under `key`, or None if they are not cached."""
+        path = self.path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+            os.utime(path) # Mark the entry as recently used.
+        except (FileNotFoundError, OSError, ValueError):
+            return None # Missing or unreadable entries are regenerated.
+        return arrays
+
+    def store(self, key: str, arrays: Dict[str, np.ndarray]) -> None:
+        """Store `arrays` under `key`.
+        The file is written under a temporary name first, so a reader never sees a partial entry."""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(temporary_path, path)
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used entries until at most `max_entries` are left."""
+        paths = glob.glob(os.path.join(self.directory, "*", "*.npz"))
+        if len(paths) <= self.max_entries:
+            return
+        
+        def last_used(path: str) -> float:
+            try:
+                return os.path.getmtime(path)
+            except OSError:
+                return 0.0 # Already removed by another process.
+        
+        paths.sort(key=last_used)
+        for path in paths[: len(paths) - self.max_entries]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
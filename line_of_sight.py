@@ -0,0 +1,130 @@
+"""Line of sight queries shared by the player's FOV, targeting, spells and monster awareness.
+
+Every floor has one LineOfSight (see GameMap.line_of_sight), which caches what can be reused:
+- FOV results depend only on the origin and radius while the tiles stay the same. They only
+  cover the square the radius can reach, so they cost the same on any size of map.
+- Radius stencils (the cells within a radius of a point) depend only on the radius.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+import functools
+from typing import Any, Dict, NamedTuple, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np # type: ignore
+import tcod
+
+from chunked_grid import Window
+
+if TYPE_CHECKING:
+    from game_map import GameMap
+
+@functools.lru_cache(maxsize=64)
+def radius_stencil(radius: float) -> np.ndarray:
+    """Return a (2r+1, 2r+1) boolean disk of the cells within `radius` of its center.
+    This uses the same Euclidean rule as GameMap.actors_within. The result must not be modified."""
+    r = int(radius)
+    offsets = np.arange(-r, r + 1)
+    stencil = offsets[:, None] ** 2 + offsets[None, :] ** 2 <= radius ** 2
+    stencil.flags.writeable = False
+    return stencil
+
+class FieldOfView(NamedTuple):
+    """The cells visible from a point. `mask` covers `window`, the square the FOV's radius can reach."""
+    window: Window
+    mask: np.ndarray
+
+    def visible(self, xs: Any, ys: Any) -> np.ndarray:
+        """Return True where the map cells (xs, ys) are visible."""
+        return self.window.lookup(self.mask, xs, ys, False)
+
+class LineOfSight:
+    """Line of sight and visibility queries for one floor.
+    The caches assume the floor's tiles don't change. Call `invalidate` if they do."""
+    def __init__(self, game_map: GameMap, max_cached_fovs: int = 256):
+        self.game_map = game_map
+        self.max_cached_fovs = max_cached_fovs
+        self.invalidate()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # The cache is cheap to rebuild, so it is not saved.
+        return {"game_map": self.game_map, "max_cached_fovs": self.max_cached_fovs}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """Forget everything cached, because the floor's tiles changed."""
+        self._fovs: OrderedDict[Tuple[int, int, int, int], FieldOfView] = OrderedDict()
+
+    def visible_from(
+        self,
+        origin: Tuple[int, int],
+        radius: int,
+        algorithm: int = tcod.constants.FOV_RESTRICTIVE,
+    ) -> FieldOfView:
+        """Return the cells visible from `origin`, as computed by tcod's FOV (its default algorithm unless given).
+        Results are cached, so standing still or revisiting a spot costs nothing.
+        The returned mask is shared and must not be modified."""
+        key = (origin[0], origin[1], radius, algorithm)
+        fov = self._fovs.get(key)
+        if fov is None:
+            x, y = origin
+            window = Window.around(x, y, radius, self.game_map.width, self.game_map.height)
+            mask = tcod.map.compute_fov(
+                self.game_map.transparent_in(window), (x - window.x, y - window.y), radius=radius, algorithm=algorithm
+            )
+            mask.flags.writeable = False
+            fov = self._fovs[key] = FieldOfView(window, mask)
+            if len(self._fovs) > self.max_cached_fovs:
+                self._fovs.popitem(last=False)
+        else:
+            self._fovs.move_to_end(key)
+        return fov
+
+    def can_see(
+        self,
+        origins: np.ndarray,
+        targets: np.ndarray,
+        radius: int,
+        algorithm: int = tcod.constants.FOV_RESTRICTIVE,
+    ) -> np.ndarray:
+        """Answer "can origins[i] see targets[i]" for many pairs at once.
+        `origins` and `targets` are (n, 2) arrays of map coordinates. This is the FOV's own rule:
+        a target can be seen when it is in `visible_from(origin, radius, algorithm)`, so the player,
+        spells and monsters all agree with what is drawn on screen.
+        Pairs are grouped by origin, so each origin's FOV is computed, or taken from the cache, once."""
+        origins = np.asarray(origins, dtype=np.intp).reshape(-1, 2)
+        targets = np.asarray(targets, dtype=np.intp).reshape(-1, 2)
+        result = np.zeros(len(origins), dtype=bool)
+        if not len(origins):
+            return result
+        
+        unique_origins, inverse = np.unique(origins, axis=0, return_inverse=True)
+        order = np.argsort(inverse.reshape(-1), kind="stable")
+        groups = np.split(order, np.cumsum(np.bincount(inverse.reshape(-1)))[:-1])
+        for (x, y), pairs in zip(unique_origins.tolist(), groups):
+            fov = self.visible_from((x, y), radius, algorithm)
+            result[pairs] = fov.visible(targets[pairs, 0], targets[pairs, 1])
+        return result
+
+    def area(
+        self, center: Tuple[int, int], radius: float, bounds: Optional[Window] = None
+    ) -> Tuple[Tuple[slice, slice], np.ndarray]:
+        """Return the map slices around `center` and the matching part of the radius stencil.
+        The two are clipped to `bounds`, or to the map, so `mask[slices] |= stencil` marks the area in place."""
+        if bounds is None:
+            bounds = Window(0, 0, self.game_map.width, self.game_map.height)
+        stencil = radius_stencil(radius)
+        r = stencil.shape[0] // 2
+        x, y = center
+        x0, y0 = max(x - r, bounds.x), max(y - r, bounds.y)
+        x1 = min(x + r + 1, bounds.x + bounds.width)
+        y1 = min(y + r + 1, bounds.y + bounds.height)
+        if x0 >= x1 or y0 >= y1:
+            return (slice(0, 0), slice(0, 0)), stencil[0:0, 0:0]
+        return (
+            (slice(x0, x1), slice(y0, y1)),
+            stencil[x0 - (x - r) : x1 - (x - r), y0 - (y - r) : y1 - (y - r)],
+        )
@@ -1,3 +1,4 @@
+import argparse
 import traceback
 
 import tcod
@@ -5,8 +6,10 @@ import tcod
 import color
 import exceptions
 import input_handlers
+import procgen
 import settings
 import setup_game
+from layout_cache import LayoutCache
 
 def save_game(handler: input_handlers.BaseEventHandler, filename: str) -> None:
     """If the current event handler has an active Engine then save it."""
@@ -15,10 +18,14 @@ def save_game(handler: input_handlers.BaseEventHandler, filename: str) -> None:
         print("Game saved.")
 
 def main() -> None:
-    handler: input_handlers.BaseEventHandler = setup_game.MainMenu()
+    parser = argparse.ArgumentParser(description="GOLD, a roguelike.")
+    settings.add_config_arguments(parser)
+    config = settings.config_from_args(parser.parse_args())
+    procgen.layout_cache = LayoutCache()
 
-    with settings.main_context as context:
-        root_console = tcod.Console(settings.screen_width, settings.screen_height, order="F")
+    with settings.open_context(config) as context:
+        handler: input_handlers.BaseEventHandler = setup_game.MainMenu(config, context)
+        root_console = tcod.Console(config.screen_width, config.screen_height, order="F")
         try:
             while True:
                 root_console.clear()
@@ -0,0 +1,246 @@
+"""Observations of the game for training agents, written to a ring buffer in a memory-mapped file.
+
+Each step, ObservationRing.append writes what the player knows into the next slot of the ring:
+a stack of map planes around the player, plus a row of stats. A learner in another process maps
+the same file and reads the planes in place, without copying or unpickling anything. Put the file
+on a RAM-backed filesystem such as /dev/shm to keep it out of the disk cache.
+
+The planes are indexed [plane, x, y] like the map arrays, one uint8 per cell:
+    TILE      the tile id from tile_types, or UNKNOWN where the player hasn't explored
+    VISIBLE   1 where the player can see
+    EXPLORED  1 where the player has been able to see
+    ACTOR_HP  the hp of each visible actor, capped at 255, the player included
+    ITEMS     the number of visible items on each cell
+    PLAYER    1 on the player's cell
+
+Nothing is allocated per step on the writer's side apart from the small temporaries of unpacking
+the bit-packed masks, so exporting costs far less than the turn that produced it.
+
+The file starts with a header of int64 fields (see HEADER_FIELDS), followed by the planes of every
+slot and then the stats of every slot. The step counter is only increased once a slot is fully
+written, so readers never see a half written observation as the latest one. A reader that falls a
+whole ring behind gets a LookupError rather than a slot which has been overwritten.
+
+Usage: python observations.py --steps 5000 --readers 2 --path /dev/shm/gold_observations
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import time
+from typing import Any, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np # type: ignore
+
+from camera import Camera
+from entity import Actor, Item
+
+if TYPE_CHECKING:
+    from engine import Engine
+
+PLANES = ("TILE", "VISIBLE", "EXPLORED", "ACTOR_HP", "ITEMS", "PLAYER")
+TILE, VISIBLE, EXPLORED, ACTOR_HP, ITEMS, PLAYER = range(len(PLANES))
+
+STATS = ("turn", "floor", "hp", "max_hp", "level", "xp", "x", "y", "window_x", "window_y")
+
+UNKNOWN = 255 # The TILE plane value of unexplored cells.
+
+MAGIC = 0x474F4C444F425331 # "GOLDOBS1"
+HEADER_FIELDS = ("magic", "capacity", "width", "height", "planes", "stats", "count", "closed")
+COUNT = HEADER_FIELDS.index("count")
+CLOSED = HEADER_FIELDS.index("closed")
+HEADER_BYTES = 64
+
+class ObservationRing:
+    """A ring of `capacity` observations of `width` x `height` cells in the file at `path`.
+    The writer creates it with `create=True`. Readers open the existing file and learn its shape from the header."""
+    def __init__(
+        self, path: str, capacity: int = 256, width: int = 80, height: int = 43, *, create: bool = False
+    ):
+        self.path = path
+        if create:
+            self.header = np.memmap(path, dtype=np.int64, mode="w+", shape=(HEADER_BYTES // 8,))
+            self.header[: len(HEADER_FIELDS)] = (MAGIC, capacity, width, height, len(PLANES), len(STATS), 0, 0)
+        else:
+            self.header = np.memmap(path, dtype=np.int64, mode="r+", shape=(HEADER_BYTES // 8,))
+            if self.header[0] != MAGIC:
+                raise ValueError(f"{path} is not an observation ring.")
+        self.header = self.header.view(np.ndarray)
+        self.capacity, self.width, self.height = (int(value) for value in self.header[1:4])
+
+        planes_shape = (self.capacity, len(PLANES), self.width, self.height)
+        planes = np.memmap(path, dtype=np.uint8, mode="r+", offset=HEADER_BYTES, shape=planes_shape, order="C")
+        stats = np.memmap(
+            path,
+            dtype=np.int32,
+            mode="r+",
+            offset=HEADER_BYTES + planes.nbytes,
+            shape=(self.capacity, len(STATS)),
+        )
+        # Plain ndarray views of the mapping, as indexing an np.memmap is several times slower.
+        self.planes = planes.view(np.ndarray)
+        self.stats = stats.view(np.ndarray)
+        # The writer's own state, so that exporting allocates nothing per step.
+        self.camera = Camera(self.width, self.height)
+        self._unexplored = np.zeros((self.width, self.height), dtype=bool, order="F")
+
+    @property
+    def count(self) -> int:
+        """The number of observations written so far. The latest one is step count - 1."""
+        return int(self.header[COUNT])
+
+    @property
+    def closed(self) -> bool:
+        """True once the writer has finished."""
+        return bool(self.header[CLOSED])
+
+    def close(self) -> None:
+        self.header[CLOSED] = 1
+
+    def append(self, engine: Engine) -> int:
+        """Write what the player knows into the next slot, overwriting the oldest one. Returns the step written."""
+        step = self.count
+        slot = step % self.capacity
+        player = engine.player
+        game_map = engine.game_map
+        window = self.camera.follow(player.x, player.y, game_map)
+        planes = self.planes[slot]
+        width, height = window.width, window.height
+        if width < self.width or height < self.height:
+            # A map smaller than the observation leaves the rest of the planes as unknown, unseen cells.
+            planes[...] = 0
+            planes[TILE] = UNKNOWN
+
+        tiles = game_map.tiles.read(window, out=planes[TILE, :width, :height])
+        explored = game_map.explored.read(window, out=planes[EXPLORED, :width, :height].view(bool))
+        visible = game_map.visible.read(window, out=planes[VISIBLE, :width, :height].view(bool))
+        unexplored = np.logical_not(explored, out=self._unexplored[:width, :height])
+        np.copyto(tiles, UNKNOWN, where=unexplored)
+
+        planes[ACTOR_HP] = 0
+        planes[ITEMS] = 0
+        planes[PLAYER] = 0
+        for entity in game_map.entities:
+            x, y = entity.x - window.x, entity.y - window.y
+            if not (0 <= x < width and 0 <= y < height and visible[x, y]):
+                continue
+            if isinstance(entity, Actor) and entity.is_alive:
+                planes[ACTOR_HP, x, y] = min(entity.fighter.hp, 255)
+            elif isinstance(entity, Item):
+                planes[ITEMS, x, y] = min(int(planes[ITEMS, x, y]) + 1, 255)
+        planes[PLAYER, player.x - window.x, player.y - window.y] = 1
+
+        stats = self.stats[slot]
+        stats[0] = engine.turn
+        stats[1] = engine.game_world.current_floor
+        stats[2] = player.fighter.hp
+        stats[3] = player.fighter.max_hp
+        stats[4] = player.level.current_level
+        stats[5] = player.level.current_xp
+        stats[6], stats[7] = player.x, player.y
+        stats[8], stats[9] = window.x, window.y
+
+        self.header[COUNT] = step + 1 # Published only once the slot is complete.
+        return step
+
+    def view(self, step: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the planes and stats of `step` as views into the ring, without copying.
+        The views are overwritten once the writer laps the ring, so copy them if they must be kept."""
+        count = self.count
+        if step >= count:
+            raise LookupError(f"Step {step} hasn't been written yet.")
+        if step < count - self.capacity:
+            raise LookupError(f"Step {step} has been overwritten.")
+        slot = step % self.capacity
+        return self.planes[slot], self.stats[slot]
+
+    def still_valid(self, step: int) -> bool:
+        """Return True if the slot of `step` hasn't started being overwritten.
+        Check this after reading a view, to tell whether the writer lapped the reader while it read."""
+        return step >= self.count - self.capacity + 1
+
+def reader(path: str, results: Any) -> None:
+    """Demo learner: follow the latest observations and report how many were read, skipped and torn."""
+    ring = ObservationRing(path)
+    step, read, lost, torn, explored = 0, 0, 0, 0, 0
+    while True:
+        closed = ring.closed
+        count = ring.count
+        if count > step + ring.capacity - 1:
+            lost += count - (step + ring.capacity - 1) # Fell behind, skip to the oldest safe slot.
+            step = count - ring.capacity + 1
+        while step < count:
+            planes, stats = ring.view(step)
+            explored += int(planes[EXPLORED].sum()) # Use the data as a learner would, straight from the mapping.
+            if ring.still_valid(step):
+                read += 1
+            else:
+                torn += 1
+            step += 1
+        if closed and step >= ring.count:
+            break
+        time.sleep(0.0005)
+    results.put((read, lost, torn, explored / max(read + torn, 1)))
+
+def demo(path: str, steps: int, readers: int, capacity: int, seed: str) -> None:
+    """Play random moves, exporting every step, while reader processes consume the ring."""
+    import input_handlers
+    from settings import Config
+    import setup_game
+    from sweep import random_walk
+
+    config = Config(player_name="Observer", seed=seed)
+    width, height = config.viewport_size
+    ring = ObservationRing(path, capacity, width, height, create=True)
+    results: Any = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=reader, args=(path, results)) for _ in range(readers)]
+    for process in processes:
+        process.start()
+
+    engine = setup_game.new_game(config)
+    handler = input_handlers.EventHandler(engine)
+    export_time = 0.0
+    games = 1
+    start = time.perf_counter()
+    for _ in range(steps):
+        if not engine.player.is_alive:
+            engine = setup_game.new_game(config._replace(seed=f"{seed}-{games}"))
+            handler = input_handlers.EventHandler(engine)
+            games += 1
+        if engine.player.level.requires_level_up:
+            engine.player.level.increase_stat("hp")
+        handler.handle_action(random_walk(engine))
+        export_start = time.perf_counter()
+        engine.export_observation(ring)
+        export_time += time.perf_counter() - export_start
+    elapsed = time.perf_counter() - start
+    ring.close()
+
+    print(f"observation:        {len(PLANES)} planes of {width}x{height}, {ring.planes[0].nbytes} bytes")
+    print(f"steps:              {steps} in {games} games")
+    print(f"steps per second:   {steps / elapsed:.0f} (game and export)")
+    print(f"export time:        {export_time / steps * 1e6:.1f} us per step")
+    for i in range(readers):
+        read, lost, torn, explored = results.get()
+        print(f"reader {i}:           {read} read, {lost} skipped after falling behind, {torn} overwritten while read")
+        print(f"                    {explored:.0f} explored cells per observation on average")
+    for process in processes:
+        process.join()
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--path", default=os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else ".", "gold_observations"))
+    parser.add_argument("--steps", type=int, default=5000)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--capacity", type=int, default=256)
+    parser.add_argument("--seed", default="observations")
+    args = parser.parse_args(argv)
+    try:
+        demo(args.path, args.steps, args.readers, args.capacity, args.seed)
+    finally:
+        if os.path.exists(args.path):
+            os.remove(args.path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+"""Hierarchical pathfinding for paths longer than a local search can cheaply cover.
+
+A plain A* search costs as much as the area it may explore. BaseAI.get_path_to keeps that area
+small by only searching around the actor and its destination, so on a large map a destination far
+away could only be reached if the way there happened to stay inside that box.
+
+PathGraph cuts the floor into square clusters of CLUSTER_SIZE cells. Where two neighbouring
+clusters share an open stretch of border, the middle of the stretch is an entrance: a pair of
+cells, one on each side, one cardinal step apart. Inside each cluster the walking cost between its
+entrances is measured once with a Dijkstra search over that cluster alone. A long path is then
+planned over this small graph of entrances, and only refined into cells one short leg at a time.
+
+Clusters are worked out the first time a search reaches them and cached after that, so a floor
+costs nothing until something paths across it, and a search only pays for the clusters it visits.
+The cache assumes the floor's tiles don't change. Call `invalidate` with the changed area if they
+do, and only the clusters touching it are worked out again.
+
+Paths found this way can be a few percent longer than the shortest path, because they pass
+through the middle of each opening. Procgen's rooms are not used as the regions: not every
+generator makes rooms, and fixed clusters work the same way on caves, mazes and loaded saves.
+
+Usage: python path_graph.py --size 400 --queries 100
+"""
+from __future__ import annotations
+
+import argparse
+import heapq
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, TYPE_CHECKING
+
+import numpy as np # type: ignore
+import tcod
+
+from chunked_grid import Window
+
+if TYPE_CHECKING:
+    from game_map import GameMap
+
+CLUSTER_SIZE = 16
+
+# The cost of a cardinal and of a diagonal step, the same as BaseAI.get_path_to uses.
+CARDINAL, DIAGONAL = 2, 3
+
+# The cost get_path_to adds for walking through a cell with a blocking entity in it.
+BLOCKED_COST = 10
+
+# How far outside the box between two points a local search may wander.
+LOCAL_MARGIN = 20
+
+UNREACHABLE = int(tcod.path.maxarray((1, 1))[0, 0])
+
+Position = Tuple[int, int]
+Cluster = Tuple[int, int]
+
+def local_path(
+    game_map: GameMap,
+    origin: Position,
+    dest: Position,
+    blocked: Iterable[Position],
+    margin: int = LOCAL_MARGIN,
+) -> List[Position]:
+    """Return the cells of the cheapest path from `origin` to `dest`, without `origin`, searching
+    only within `margin` cells of the box between them. Cells in `blocked` cost extra to walk through.
+    Returns an empty list if there is no path inside that area."""
+    window = Window.bounding(
+        min(origin[0], dest[0]) - margin,
+        min(origin[1], dest[1]) - margin,
+        max(origin[0], dest[0]) + margin,
+        max(origin[1], dest[1]) + margin,
+        game_map.width,
+        game_map.height,
+    )
+    # Copy the walkable array.
+    cost = np.array(game_map.walkable_in(window), dtype=np.int8)
+
+    for x, y in blocked:
+        # Check that the position is in the window and the cost isn't zero (blocking).
+        if window.contains(x, y) and cost[x - window.x, y - window.y]:
+            # Add to the cost of a blocked position.
+            # A lower number means more enemies will crowd behind each other in
+            # hallways. A higher number means enemies will take longer paths in
+            # order to surround the player.
+            cost[x - window.x, y - window.y] += BLOCKED_COST
+
+    # Create a graph from the cost array and pass that graph to a new pathfinder.
+    graph = tcod.path.SimpleGraph(cost=cost, cardinal=CARDINAL, diagonal=DIAGONAL)
+    pathfinder = tcod.path.Pathfinder(graph)
+
+    pathfinder.add_root((origin[0] - window.x, origin[1] - window.y)) # Start position.
+
+    # Compute the path to the destination and remove the starting point.
+    path: List[List[int]] = pathfinder.path_to((dest[0] - window.x, dest[1] - window.y))[1:].tolist()
+
+    # Convert from List[List[int]] in window coordinates to List[Tuple[int, int]] in map coordinates.
+    return [(index[0] + window.x, index[1] + window.y) for index in path]
+
+def estimate(a: Position, b: Position) -> int:
+    """The cost of the path from `a` to `b` if nothing was in the way."""
+    dx, dy = abs(a[0] - b[0]), abs(a[1] - b[1])
+    return DIAGONAL * min(dx, dy) + CARDINAL * abs(dx - dy)
+
+class PathGraph:
+    """The graph of cluster entrances of one floor, built as searches need it."""
+    def __init__(self, game_map: GameMap, cluster_size: int = CLUSTER_SIZE):
+        self.game_map = game_map
+        self.cluster_size = cluster_size
+        self.invalidate()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # The graph is rebuilt as it is searched, so it is not saved.
+        return {"game_map": self.game_map, "cluster_size": self.cluster_size}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.invalidate()
+
+    def invalidate(self, window: Optional[Window] = None) -> None:
+        """Forget what is cached about the clusters touching `window`, or about the whole floor,
+        because tiles there changed."""
+        if window is None:
+            # (cx, cy, 0) is the border between cluster (cx, cy) and the one to its right, (cx, cy, 1) the one below.
+            self._borders: Dict[Tuple[int, int, int], List[Tuple[Position, Position]]] = {}
+            # The entrances of each cluster, with the other entrances they reach and what it costs.
+            self._edges: Dict[Cluster, Dict[Position, List[Tuple[Position, int]]]] = {}
+            # The cells between pairs of entrances of each cluster, worked out when a path first uses them.
+            self._segments: Dict[Cluster, Dict[Tuple[Position, Position], List[Position]]] = {}
+            return
+        size = self.cluster_size
+        # A change on the edge of a cluster also changes the entrances of the cluster next to it.
+        x0, y0 = (window.x - 1) // size, (window.y - 1) // size
+        x1, y1 = (window.x + window.width) // size, (window.y + window.height) // size
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                self._borders.pop((cx, cy, 0), None)
+                self._borders.pop((cx, cy, 1), None)
+                self._edges.pop((cx, cy), None)
+                self._segments.pop((cx, cy), None)
+
+    def cluster_of(self, x: int, y: int) -> Cluster:
+        return x // self.cluster_size, y // self.cluster_size
+
+    def cluster_window(self, cluster: Cluster) -> Window:
+        size = self.cluster_size
+        x, y = cluster[0] * size, cluster[1] * size
+        return Window.bounding(x, y, x + size - 1, y + size - 1, self.game_map.width, self.game_map.height)
+
+    def border(self, cx: int, cy: int, axis: int) -> List[Tuple[Position, Position]]:
+        """Return the entrances from cluster (cx, cy) into the one to its right (axis 0) or below it (axis 1),
+        as pairs of the cell on this side and the cell on the other."""
+        key = (cx, cy, axis)
+        entrances = self._borders.get(key)
+        if entrances is not None:
+            return entrances
+        entrances = self._borders[key] = []
+        size = self.cluster_size
+        game_map = self.game_map
+        if axis == 0:
+            x = (cx + 1) * size - 1
+            if x + 1 >= game_map.width:
+                return entrances
+            window = Window.bounding(x, cy * size, x + 1, (cy + 1) * size - 1, game_map.width, game_map.height)
+            walkable = game_map.walkable_in(window)
+            open_cells = walkable[0, :] & walkable[1, :]
+        else:
+            y = (cy + 1) * size - 1
+            if y + 1 >= game_map.height:
+                return entrances
+            window = Window.bounding(cx * size, y, (cx + 1) * size - 1, y + 1, game_map.width, game_map.height)
+            walkable = game_map.walkable_in(window)
+            open_cells = walkable[:, 0] & walkable[:, 1]
+        # Find each stretch of open border, and put an entrance in its middle.
+        padded = np.concatenate(([False], open_cells, [False]))
+        changes = np.flatnonzero(padded[1:] != padded[:-1])
+        for start, end in zip(changes[::2], changes[1::2]):
+            middle = int(start + end - 1) // 2
+            if axis == 0:
+                entrances.append(((x, window.y + middle), (x + 1, window.y + middle)))
+            else:
+                entrances.append(((window.x + middle, y), (window.x + middle, y + 1)))
+        return entrances
+
+    def entrances(self, cluster: Cluster) -> Dict[Position, List[Position]]:
+        """Return the entrances of `cluster`, each with the cells it leads to in the neighbouring clusters."""
+        cx, cy = cluster
+        entrances: Dict[Position, List[Position]] = {}
+        for inside, outside in self.border(cx, cy, 0) + self.border(cx, cy, 1):
+            entrances.setdefault(inside, []).append(outside)
+        if cx > 0:
+            for outside, inside in self.border(cx - 1, cy, 0):
+                entrances.setdefault(inside, []).append(outside)
+        if cy > 0:
+            for outside, inside in self.border(cx, cy - 1, 1):
+                entrances.setdefault(inside, []).append(outside)
+        return entrances
+
+    def distances_from(self, origin: Position, cluster: Cluster) -> Tuple[Window, np.ndarray]:
+        """Return the cost of walking from `origin` to each cell of `cluster` without leaving it."""
+        window = self.cluster_window(cluster)
+        cost = self.game_map.walkable_in(window).astype(np.int8)
+        distance = tcod.path.maxarray((window.width, window.height), order="F")
+        distance[origin[0] - window.x, origin[1] - window.y] = 0
+        tcod.path.dijkstra2d(distance, cost, cardinal=CARDINAL, diagonal=DIAGONAL, out=distance)
+        return window, distance
+
+    def edges(self, cluster: Cluster) -> Dict[Position, List[Tuple[Position, int]]]:
+        """Return the edges leaving each entrance of `cluster`: to the other entrances it can reach
+        inside the cluster, and across the border to the neighbouring clusters."""
+        edges = self._edges.get(cluster)
+        if edges is not None:
+            return edges
+        edges = self._edges[cluster] = {}
+        entrances = self.entrances(cluster)
+        for entrance, outside in entrances.items():
+            window, distance = self.distances_from(entrance, cluster)
+            edges[entrance] = [(cell, CARDINAL) for cell in outside] + [
+                (other, int(distance[other[0] - window.x, other[1] - window.y]))
+                for other in entrances
+                if other != entrance and distance[other[0] - window.x, other[1] - window.y] != UNREACHABLE
+            ]
+        return edges
+
+    def _endpoint_edges(self, position: Position) -> List[Tuple[Position, int]]:
+        """Return the costs from a cell which may not be an entrance to the entrances of its cluster."""
+        cluster = self.cluster_of(*position)
+        window, distance = self.distances_from(position, cluster)
+        return [
+            (entrance, int(distance[entrance[0] - window.x, entrance[1] - window.y]))
+            for entrance in self.edges(cluster)
+            if distance[entrance[0] - window.x, entrance[1] - window.y] != UNREACHABLE
+        ]
+
+    def waypoints(self, origin: Position, dest: Position) -> List[Position]:
+        """Return the cells a path from `origin` to `dest` passes through, ending with `dest`:
+        the entrances it crosses between clusters. Returns an empty list if there is no such path."""
+        if origin == dest:
+            return []
+        origin_cluster = self.cluster_of(*origin)
+        dest_cluster = self.cluster_of(*dest)
+        # Paths into the destination, which is usually not an entrance itself. Costs are the same both ways.
+        into_dest = {entrance: cost for entrance, cost in self._endpoint_edges(dest)}
+
+        costs: Dict[Position, int] = {origin: 0}
+        came_from: Dict[Position, Position] = {}
+        closed: Set[Position] = set()
+        start_edges = self._endpoint_edges(origin)
+        if origin_cluster == dest_cluster:
+            window, distance = self.distances_from(origin, origin_cluster)
+            direct = int(distance[dest[0] - window.x, dest[1] - window.y])
+            if direct != UNREACHABLE:
+                start_edges.append((dest, direct))
+        if origin in self.edges(origin_cluster):
+            start_edges += self.edges(origin_cluster)[origin]
+
+        counter = 0 # Breaks ties in the order cells were reached, so the search is deterministic.
+        frontier = [(estimate(origin, dest), counter, origin)]
+        while frontier:
+            _, _, current = heapq.heappop(frontier)
+            if current == dest:
+                break
+            if current in closed:
+                continue
+            closed.add(current)
+            if current == origin:
+                neighbours = start_edges
+            else:
+                neighbours = list(self.edges(self.cluster_of(*current))[current])
+                if current in into_dest:
+                    neighbours.append((dest, into_dest[current]))
+            for neighbour, step_cost in neighbours:
+                cost = costs[current] + step_cost
+                if cost < costs.get(neighbour, UNREACHABLE):
+                    costs[neighbour] = cost
+                    came_from[neighbour] = current
+                    counter += 1
+                    heapq.heappush(frontier, (cost + estimate(neighbour, dest), counter, neighbour))
+        else:
+            return []
+
+        waypoints = [dest]
+        while waypoints[-1] in came_from and came_from[waypoints[-1]] != origin:
+            waypoints.append(came_from[waypoints[-1]])
+        waypoints.reverse()
+        return waypoints
+
+    def segment(self, origin: Position, dest: Position) -> List[Position]:
+        """Return the cells from `origin` to `dest`, without `origin`, where `origin` is an entrance and `dest`
+        is either an entrance it leads to across a border, or a cell it reaches inside its cluster."""
+        cluster = self.cluster_of(*origin)
+        if self.cluster_of(*dest) != cluster:
+            return [dest]
+        segments = self._segments.setdefault(cluster, {})
+        cells = segments.get((origin, dest))
+        if cells is None:
+            window, distance = self.distances_from(origin, cluster)
+            descent = tcod.path.hillclimb2d(
+                distance, (dest[0] - window.x, dest[1] - window.y), cardinal=True, diagonal=True
+            )
+            cells = [(int(x) + window.x, int(y) + window.y) for x, y in descent[-2::-1]]
+            if dest in self.edges(cluster):
+                segments[(origin, dest)] = cells # Only cache the ways between entrances, not to every destination.
+        return cells
+
+    def find_path(self, origin: Position, dest: Position, blocked: Iterable[Position] = ()) -> List[Position]:
+        """Return the cells of a path from `origin` to `dest`, without `origin`, like local_path does,
+        but however far apart they are. Returns an empty list if there is no path.
+        Only the first leg, inside the cluster of `origin`, steps around the cells in `blocked`.
+        Anything further away will have moved by the time it is reached."""
+        waypoints = self.waypoints(origin, dest)
+        if not waypoints:
+            return []
+        path = local_path(self.game_map, origin, waypoints[0], blocked, margin=self.cluster_size // 2)
+        if not path:
+            return []
+        for start, end in zip(waypoints, waypoints[1:]):
+            path += self.segment(start, end)
+        return path
+
+def full_path(game_map: GameMap, origin: Position, dest: Position) -> List[Position]:
+    """Return the shortest path searching the whole map at once, for comparison."""
+    return local_path(game_map, origin, dest, (), margin=max(game_map.width, game_map.height))
+
+def path_cost(path: List[Position], origin: Position) -> int:
+    cost, previous = 0, origin
+    for position in path:
+        cost += DIAGONAL if position[0] != previous[0] and position[1] != previous[1] else CARDINAL
+        previous = position
+    return cost
+
+def benchmark(size: int, queries: int, seed: str) -> None:
+    """Time paths between far apart cells of a generated floor, hierarchically and over the whole map."""
+    import random
+
+    from settings import Config
+    import setup_game
+
+    config = Config(player_name="Pathfinder", seed=seed, map_width=size, map_height=size)
+    engine = setup_game.new_game(config)
+    game_map = engine.game_map
+    walkable = np.argwhere(game_map.walkable)
+    rng = random.Random(seed)
+    pairs = []
+    while len(pairs) < queries:
+        a, b = (tuple(int(v) for v in walkable[rng.randrange(len(walkable))]) for _ in range(2))
+        if max(abs(a[0] - b[0]), abs(a[1] - b[1])) >= size // 3:
+            pairs.append((a, b))
+
+    def timed(find: Any) -> Tuple[float, List[List[Position]]]:
+        start = time.perf_counter()
+        paths = [find(a, b) for a, b in pairs]
+        return time.perf_counter() - start, paths
+
+    graph = PathGraph(game_map)
+    cold, paths = timed(graph.find_path)
+    warm, _ = timed(graph.find_path)
+    full, shortest = timed(lambda a, b: full_path(game_map, a, b))
+
+    found = [(a, path, best) for (a, _), path, best in zip(pairs, paths, shortest) if path and best]
+    missed = sum(1 for path, best in zip(paths, shortest) if best and not path)
+    overhead = np.mean([path_cost(path, a) / path_cost(best, a) for a, path, best in found]) if found else 1.0
+    print(f"map:                {size}x{size}, {len(graph._edges)} of {(-(-size // CLUSTER_SIZE)) ** 2} clusters built")
+    print(f"queries:            {queries}, at least {size // 3} cells apart")
+    print(f"whole map A*:       {full / queries * 1000:.2f} ms per path")
+    print(f"hierarchical, cold: {cold / queries * 1000:.2f} ms per path (building clusters as they are reached)")
+    print(f"hierarchical, warm: {warm / queries * 1000:.2f} ms per path")
+    print(f"path length:        {overhead:.3f} times the shortest, {missed} paths missed")
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=400, help="The width and height of the map.")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--seed", default="path_graph")
+    args = parser.parse_args(argv)
+    benchmark(args.size, args.queries, args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,113 @@
 from __future__ import annotations
 
+import json
+import os
 import random
-from typing import Dict, Iterator, List, Tuple, TYPE_CHECKING
+from typing import Any, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
 
+import numpy as np # type: ignore
 import tcod
 
 import entity_factories
 from game_map import GameMap
+from layout_cache import LayoutCache
 import tile_types
 
 if TYPE_CHECKING:
     from engine import Engine
     from entity import Entity
 
-max_items_by_floor = [
-    (1, 1),
-    (4, 2),
-]
+SPAWN_TABLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "spawn_tables.json")
 
-max_monsters_by_floor = [
-    (1, 2),
-    (4, 3),
-    (6, 5),
-]
+class AliasTable:
+    """A weighted choice between entities, compiled with Vose's alias method so each draw is O(1)."""
+    def __init__(self, entities: List[Entity], weights: List[int]):
+        self.entities = entities
+        count = len(weights)
+        self.probabilities = np.array(weights, dtype=np.float64) / sum(weights)
+        
+        # Split every entity's scaled probability into one "own" share and one alias.
+        scaled = self.probabilities * count
+        self.own_chance = np.ones(count, dtype=np.float64)
+        self.alias = np.arange(count, dtype=np.intp)
+        small = [i for i in range(count) if scaled[i] < 1.0]
+        large = [i for i in range(count) if scaled[i] >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.own_chance[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+    
+    def sample(self, rng: random.Random) -> Entity:
+        """Draw one entity."""
+        column = rng.randrange(len(self.entities))
+        if rng.random() < self.own_chance[column]:
+            return self.entities[column]
+        return self.entities[self.alias[column]]
+    
+    def sample_indices(self, rng: np.random.Generator, k: int) -> np.ndarray:
+        """Draw `k` entities at once, returned as indices into `entities`."""
+        columns = rng.integers(0, len(self.entities), size=k)
+        keep = rng.random(k) < self.own_chance[columns]
+        return np.where(keep, columns, self.alias[columns])
 
-item_chances: Dict[int, List[Tuple[Entity, int]]] = {
-    0: [(entity_factories.health_potion, 35)],
-    2: [(entity_factories.confusion_scroll, 10)],
-    4: [(entity_factories.lightning_scroll, 25), (entity_factories.sword, 5)],
-    6: [(entity_factories.fireball_scroll, 25), (entity_factories.chain_mail, 15)],
-}
+class FloorSpawns:
+    """Everything needed to populate one floor, compiled from the spawn tables."""
+    def __init__(
+        self, max_items: int, max_monsters: int, items: AliasTable, monsters: AliasTable
+    ):
+        self.max_items = max_items
+        self.max_monsters = max_monsters
+        self.items = items
+        self.monsters = monsters
 
-enemy_chances: Dict[int, List[Tuple[Entity, int]]] = {
-    0: [(entity_factories.orc, 80)],
-    3: [(entity_factories.troll, 15)],
-    5: [(entity_factories.troll, 30)],
-    7: [(entity_factories.troll, 60)],
-}
+class SpawnTables:
+    """The spawn data for every floor, as loaded from a data file.
+    Floors are compiled into FloorSpawns the first time they are asked for."""
+    def __init__(
+        self,
+        max_items_by_floor: List[Tuple[int, int]],
+        max_monsters_by_floor: List[Tuple[int, int]],
+        item_chances: Dict[int, List[Tuple[Entity, int]]],
+        enemy_chances: Dict[int, List[Tuple[Entity, int]]],
+    ):
+        self.max_items_by_floor = max_items_by_floor
+        self.max_monsters_by_floor = max_monsters_by_floor
+        self.item_chances = item_chances
+        self.enemy_chances = enemy_chances
+        self.compiled: Dict[int, FloorSpawns] = {}
+    
+    @classmethod
+    def load(cls, path: str) -> SpawnTables:
+        """Load spawn tables from a JSON file. Entities are named by their entity_factories template."""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        
+        def chances(table: Dict[str, List[List[Any]]]) -> Dict[int, List[Tuple[Entity, int]]]:
+            return {
+                int(floor): [
+                    (getattr(entity_factories, name), weight) for name, weight in values
+                ]
+                for floor, values in sorted(table.items(), key=lambda item: int(item[0]))
+            }
+        
+        return cls(
+            max_items_by_floor=[tuple(pair) for pair in data["max_items_by_floor"]],
+            max_monsters_by_floor=[tuple(pair) for pair in data["max_monsters_by_floor"]],
+            item_chances=chances(data["item_chances"]),
+            enemy_chances=chances(data["enemy_chances"]),
+        )
+    
+    def for_floor(self, floor: int) -> FloorSpawns:
+        if floor not in self.compiled:
+            self.compiled[floor] = FloorSpawns(
+                max_items=get_max_value_for_floor(self.max_items_by_floor, floor),
+                max_monsters=get_max_value_for_floor(self.max_monsters_by_floor, floor),
+                items=compile_chances(self.item_chances, floor),
+                monsters=compile_chances(self.enemy_chances, floor),
+            )
+        return self.compiled[floor]
 
 def get_max_value_for_floor(
     max_value_by_floor: List[Tuple[int, int]], floor: int
@@ -51,31 +122,30 @@ def get_max_value_for_floor(
     
     return current_value
 
-def get_entities_at_random(
-    weighted_chances_by_floor: Dict[int, List[Tuple[Entity, int]]],
-    number_of_entities: int,
-    floor: int,
-) -> List[Entity]:
+def compile_chances(
+    weighted_chances_by_floor: Dict[int, List[Tuple[Entity, int]]], floor: int
+) -> AliasTable:
+    """Collect the chances that apply on `floor` into an AliasTable.
+    A later floor's chance for an entity replaces the earlier one."""
     entity_weighted_chances = {}
     
     for key, values in weighted_chances_by_floor.items():
         if key > floor:
             break
         else:
-            for value in values:
-                entity = value[0]
-                weighted_chance = value[1]
-                
+            for entity, weighted_chance in values:
                 entity_weighted_chances[entity] = weighted_chance
     
-    entities = list(entity_weighted_chances.keys())
-    entity_weighted_chance_values = list(entity_weighted_chances.values())
-    
-    chosen_entities = random.choices(
-        entities, weights=entity_weighted_chance_values, k=number_of_entities
+    return AliasTable(
+        list(entity_weighted_chances.keys()), list(entity_weighted_chances.values())
     )
-    
-    return chosen_entities
+
+spawn_tables = SpawnTables.load(SPAWN_TABLES_PATH)
+
+max_items_by_floor = spawn_tables.max_items_by_floor
+max_monsters_by_floor = spawn_tables.max_monsters_by_floor
+item_chances = spawn_tables.item_chances
+enemy_chances = spawn_tables.enemy_chances
 
 class RectangularRoom:
     def __init__(self, x: int, y:int, width: int, height: int):
@@ -105,97 +175,443 @@ class RectangularRoom:
             and self.y2 >= other.y1
         )
 
-def place_entities(room: RectangularRoom, dungeon: GameMap, floor_number: int,) -> None:
-    number_of_monsters = random.randint(
-        0, get_max_value_for_floor(max_monsters_by_floor, floor_number)
-    )
-    number_of_items = random.randint(
-        0, get_max_value_for_floor(max_items_by_floor, floor_number)
-    )
+def place_entities(
+    rooms: List[RectangularRoom], dungeon: GameMap, floor_number: int,
+) -> None:
+    """Populate every room of a floor, drawing all of the floor's monsters and items in one batch."""
+    spawns = spawn_tables.for_floor(floor_number)
+    rng = np.random.default_rng(random.getrandbits(64))
     
-    monsters: List[Entity] = get_entities_at_random(
-        enemy_chances, number_of_monsters, floor_number
-    )
-    items: List[Entity] = get_entities_at_random(
-        item_chances, number_of_items, floor_number
-    )
+    bounds = np.array(
+        [(room.x1, room.y1, room.x2, room.y2) for room in rooms], dtype=np.intp
+    ).reshape(-1, 4)
     
-    for entity in monsters + items:
-        x = random.randint(room.x1 + 1, room.x2 - 1)
-        y = random.randint(room.y1 + 1, room.y2 - 1)
+    placements: List[Tuple[Entity, int, int]] = []
+    for table, maximum in (
+        (spawns.monsters, spawns.max_monsters),
+        (spawns.items, spawns.max_items),
+    ):
+        counts = rng.integers(0, maximum, size=len(rooms), endpoint=True)
+        room_of = np.repeat(np.arange(len(rooms)), counts)
+        kinds = table.sample_indices(rng, len(room_of))
+        x1, y1, x2, y2 = bounds[room_of].T
+        xs = rng.integers(x1 + 1, x2 - 1, endpoint=True)
+        ys = rng.integers(y1 + 1, y2 - 1, endpoint=True)
+        placements.extend(
+            (table.entities[kind], x, y)
+            for kind, x, y in zip(kinds.tolist(), xs.tolist(), ys.tolist())
+        )
+    
+    occupied = {(entity.x, entity.y) for entity in dungeon.entities}
+    for entity, x, y in placements:
+        if not tile_types.walkable[dungeon.tiles[x, y]]:
+            continue # Rooms from cave generators are not solid floor.
         
-        if not any(entity.x == x and entity.y == y for entity in dungeon.entities):
+        if (x, y) not in occupied:
             entity.spawn(dungeon, x, y)
+            occupied.add((x, y))
 
 def tunnel_between(
-    start: Tuple[int, int], end: Tuple[int, int]
-) -> Iterator[Tuple[int, int]]:
-    """Return an L-shaped tunnel between these two points."""
+    start: Tuple[int, int], end: Tuple[int, int], rng: random.Random
+) -> List[Tuple[slice, slice]]:
+    """Return an L-shaped tunnel between these two points, as two 2D array indices.
+    Both legs of the tunnel are straight lines, so each one can be carved with a single slice."""
     x1, y1 = start
     x2, y2 = end
-    if random.random() < 0.5: # 50% chance.
+    if rng.random() < 0.5: # 50% chance.
         # Move horizontally, then vertically.
         corner_x, corner_y = x2, y1
     else:
         # Move vertically, then horizontally.
         corner_x, corner_y = x1, y2
     
-    # Generate the coordinates for this tunnel.
-    for x, y in tcod.los.bresenham((x1, y1), (corner_x, corner_y)).tolist():
-        yield x, y
-    for x, y in tcod.los.bresenham((corner_x, corner_y), (x2, y2)).tolist():
-        yield x, y
+    return [
+        line_slice((x1, y1), (corner_x, corner_y)),
+        line_slice((corner_x, corner_y), (x2, y2)),
+    ]
 
-def generate_dungeon(
+def line_slice(start: Tuple[int, int], end: Tuple[int, int]) -> Tuple[slice, slice]:
+    """Return the 2D array index covering a horizontal or vertical line, including both ends."""
+    x1, y1 = start
+    x2, y2 = end
+    return (
+        slice(min(x1, x2), max(x1, x2) + 1),
+        slice(min(y1, y2), max(y1, y2) + 1),
+    )
+
+class RoomBounds:
+    """The bounds of every accepted room, kept in NumPy arrays for batch intersection tests."""
+    def __init__(self, capacity: int):
+        self.count = 0
+        # Columns are x1, y1, x2, y2.
+        self.bounds = np.zeros((capacity, 4), dtype=np.int32)
+    
+    def intersects(self, room: RectangularRoom) -> bool:
+        """Return True if `room` overlaps with any accepted room."""
+        x1, y1, x2, y2 = self.bounds[: self.count].T
+        return bool(
+            np.any(
+                (room.x1 <= x2) & (room.x2 >= x1) & (room.y1 <= y2) & (room.y2 >= y1)
+            )
+        )
+    
+    def append(self, room: RectangularRoom) -> None:
+        self.bounds[self.count] = room.x1, room.y1, room.x2, room.y2
+        self.count += 1
+
+class Layout:
+    """The tiles and rooms made by a map generator, before any entities are placed."""
+    def __init__(
+        self,
+        tiles: np.ndarray,
+        rooms: List[RectangularRoom],
+        player_start: Tuple[int, int],
+        downstairs_location: Tuple[int, int],
+    ):
+        self.tiles = tiles
+        self.rooms = rooms
+        self.player_start = player_start
+        self.downstairs_location = downstairs_location
+    
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Return this layout as plain arrays, for the layout cache."""
+        return {
+            "tiles": self.tiles,
+            "rooms": np.array(
+                [(room.x1, room.y1, room.x2, room.y2) for room in self.rooms],
+                dtype=np.int32,
+            ).reshape(-1, 4),
+            "player_start": np.array(self.player_start, dtype=np.int32),
+            "downstairs_location": np.array(self.downstairs_location, dtype=np.int32),
+        }
+    
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> Layout:
+        rooms = [
+            RectangularRoom(x1, y1, x2 - x1, y2 - y1)
+            for x1, y1, x2, y2 in arrays["rooms"].tolist()
+        ]
+        return cls(
+            tiles=np.asfortranarray(arrays["tiles"]),
+            rooms=rooms,
+            player_start=tuple(arrays["player_start"].tolist()),
+            downstairs_location=tuple(arrays["downstairs_location"].tolist()),
+        )
+
+MapGenerator = Callable[..., Layout]
+"""A map generator takes a `random.Random` instance and the GameWorld's map parameters
+(`max_rooms`, `room_min_size`, `room_max_size`, `map_width`, `map_height`) as keywords.
+Generators only use the parameters they need."""
+
+map_generators: Dict[str, MapGenerator] = {}
+
+def register_generator(name: str) -> Callable[[MapGenerator], MapGenerator]:
+    """Register a map generator under `name`, so it can be picked per floor."""
+    def decorator(generator: MapGenerator) -> MapGenerator:
+        map_generators[name] = generator
+        return generator
+    return decorator
+
+# The generator used from each floor onwards. Later entries override earlier ones.
+generator_by_floor: List[Tuple[int, str]] = [
+    (1, "rooms_and_corridors"),
+    (4, "bsp"),
+    (7, "cellular_caves"),
+]
+
+def get_generator_for_floor(floor: int) -> str:
+    current_generator = generator_by_floor[0][1]
+    
+    for floor_minimum, generator in generator_by_floor:
+        if floor_minimum > floor:
+            break
+        else:
+            current_generator = generator
+    
+    return current_generator
+
+# Layouts are generated from scratch unless a cache is set here. The game sets one up in main.py;
+# tests, replays and sweeps leave it off, so they never read or fill a cache on disk.
+layout_cache: Optional[LayoutCache] = None
+
+def get_layout(
+    generator: str, params: Dict[str, int], seed: str, floor: int
+) -> Layout:
+    """Return the layout for this floor, loading it from the layout cache when possible.
+    Layouts only depend on their arguments, so the same seed always gives the same floors."""
+    generate = map_generators[generator]
+    if layout_cache is None:
+        return generate(random.Random(f"{seed}/{floor}"), **params)
+    
+    key = LayoutCache.key(generator, generate, params, seed, floor)
+    arrays = layout_cache.load(key)
+    if arrays is not None:
+        return Layout.from_arrays(arrays)
+    
+    layout = generate(random.Random(f"{seed}/{floor}"), **params)
+    layout_cache.store(key, layout.to_arrays())
+    
+    return layout
+
+@register_generator("rooms_and_corridors")
+def generate_rooms_and_corridors(
+    rng: random.Random,
+    *,
     max_rooms: int,
     room_min_size: int,
     room_max_size: int,
     map_width: int,
     map_height: int,
-    engine: Engine,
-) -> GameMap:
-    """Generate a new dungeon map."""
-    player = engine.player
-    dungeon = GameMap(engine, map_width, map_height, entities=[player])
+) -> Layout:
+    """Scatter non-overlapping rooms and join each one to the previous room with a tunnel."""
+    tiles = np.full(
+        (map_width, map_height), fill_value=tile_types.wall, dtype=np.uint8, order="F"
+    )
     
     rooms: List[RectangularRoom] = []
-    
-    center_of_last_room = (0, 0)
+    room_bounds = RoomBounds(max_rooms)
     
     for r in range(max_rooms):
-        room_width = random.randint(room_min_size, room_max_size)
-        room_height = random.randint(room_min_size, room_max_size)
+        room_width = rng.randint(room_min_size, room_max_size)
+        room_height = rng.randint(room_min_size, room_max_size)
         
-        x = random.randint(0, dungeon.width - room_width - 1)
-        y = random.randint(0, dungeon.height - room_height - 1)
+        x = rng.randint(0, map_width - room_width - 1)
+        y = rng.randint(0, map_height - room_height - 1)
         
         # "RectangularRoom" class makes rectangles easier to work with
         new_room = RectangularRoom(x, y, room_width, room_height)
         
         # Run through the other rooms and see if they intersect with this one.
-        if any(new_room.intersects(other_room) for other_room in rooms):
+        if room_bounds.intersects(new_room):
             continue # This room intersects, so go to the next attempt.
         # If there are no intersections then the room is valid.
         
         # Dig out this room's inner area.
-        dungeon.tiles[new_room.inner] = tile_types.floor
+        tiles[new_room.inner] = tile_types.floor
         
-        if len(rooms) == 0:
-            # The first room, where the player starts.
-            player.place(*new_room.center, dungeon)
-        else: # All rooms after the first.
+        if rooms:
             # Dig out a tunnel between this room and the previous one.
-            for x, y in tunnel_between(rooms[-1].center, new_room.center):
-                dungeon.tiles[x, y] = tile_types.floor
-            
-            center_of_last_room = new_room.center
+            for leg in tunnel_between(rooms[-1].center, new_room.center, rng):
+                tiles[leg] = tile_types.floor
         
-        place_entities(new_room, dungeon, engine.game_world.current_floor)
+        # Finally, append the new room to the list.
+        rooms.append(new_room)
+        room_bounds.append(new_room)
+    
+    return finish_room_layout(tiles, rooms)
+
+@register_generator("bsp")
+def generate_bsp(
+    rng: random.Random,
+    *,
+    room_min_size: int,
+    room_max_size: int,
+    map_width: int,
+    map_height: int,
+    **_: int,
+) -> Layout:
+    """Split the map into a binary space partition, put a room in every leaf and join neighbouring leaves."""
+    tiles = np.full(
+        (map_width, map_height), fill_value=tile_types.wall, dtype=np.uint8, order="F"
+    )
+    minimum_leaf_size = room_min_size + 2
+    
+    leaves: List[Tuple[int, int, int, int]] = []
+    unsplit = [(0, 0, map_width - 1, map_height - 1)]
+    while unsplit:
+        x, y, width, height = unsplit.pop()
+        can_split_x = width >= 2 * minimum_leaf_size and width > room_max_size + 1
+        can_split_y = height >= 2 * minimum_leaf_size and height > room_max_size + 1
+        if can_split_x and (not can_split_y or width >= height):
+            split = rng.randint(minimum_leaf_size, width - minimum_leaf_size)
+            # Pushed in reverse so that leaves come out in left-to-right order.
+            unsplit.append((x + split, y, width - split, height))
+            unsplit.append((x, y, split, height))
+        elif can_split_y:
+            split = rng.randint(minimum_leaf_size, height - minimum_leaf_size)
+            unsplit.append((x, y + split, width, height - split))
+            unsplit.append((x, y, width, split))
+        else:
+            leaves.append((x, y, width, height))
+    
+    rooms: List[RectangularRoom] = []
+    for x, y, width, height in leaves:
+        room_width = rng.randint(room_min_size, min(room_max_size, width - 1))
+        room_height = rng.randint(room_min_size, min(room_max_size, height - 1))
+        new_room = RectangularRoom(
+            rng.randint(x, x + width - room_width - 1),
+            rng.randint(y, y + height - room_height - 1),
+            room_width,
+            room_height,
+        )
+        tiles[new_room.inner] = tile_types.floor
         
-        dungeon.tiles[center_of_last_room] = tile_types.down_stairs
-        dungeon.downstairs_location = center_of_last_room
+        if rooms:
+            # Leaves are in traversal order, so consecutive leaves are siblings or cousins.
+            for leg in tunnel_between(rooms[-1].center, new_room.center, rng):
+                tiles[leg] = tile_types.floor
         
-        # Finally, append the new room to the list.
         rooms.append(new_room)
     
-    return dungeon
\ No newline at end of file
+    return finish_room_layout(tiles, rooms)
+
+def finish_room_layout(tiles: np.ndarray, rooms: List[RectangularRoom]) -> Layout:
+    """Start the player in the first room and put the down stairs in the last one."""
+    player_start = rooms[0].center
+    downstairs_location = rooms[-1].center
+    tiles[downstairs_location] = tile_types.down_stairs
+    return Layout(tiles, rooms, player_start, downstairs_location)
+
+def label_regions(open_cells: np.ndarray) -> np.ndarray:
+    """Label the regions of `open_cells` connected by cardinal or diagonal steps, in one pass over the map.
+    Returns an array of the same shape holding 0 on closed cells, and on open cells the label of their
+    region, numbered from 1 in the order regions are first met scanning the array with np.argwhere."""
+    width, height = open_cells.shape
+    # Split every row of the array into runs of open cells, numbered in scan order.
+    starts = open_cells.copy()
+    starts[:, 1:] &= ~open_cells[:, :-1]
+    runs = np.cumsum(starts.ravel()).reshape(open_cells.shape)
+    runs[~open_cells] = 0
+    count = int(runs.max())
+    
+    # Runs in neighbouring rows touching each other, straight or diagonally, belong to the same region.
+    above, below = runs[:-1], runs[1:]
+    pairs = [
+        np.stack((above[:, max(offset, 0) : height + min(offset, 0)], below[:, max(-offset, 0) : height + min(-offset, 0)]))
+        for offset in (-1, 0, 1)
+    ]
+    a, b = np.concatenate([pair.reshape(2, -1) for pair in pairs], axis=1)
+    touching = (a > 0) & (b > 0)
+    # Long runs touch along many cells, so each pair of runs is only joined once.
+    a, b = np.divmod(np.unique(a[touching] * (count + 1) + b[touching]), count + 1)
+    
+    # Join the touching runs with a union-find, in one pass over the pairs.
+    parent = list(range(count + 1))
+    for x, y in zip(a.tolist(), b.tolist()):
+        while parent[x] != x:
+            parent[x] = x = parent[parent[x]]
+        while parent[y] != y:
+            parent[y] = y = parent[parent[y]]
+        if x != y:
+            # The lower run number is kept as the root, so that regions keep their scan order.
+            parent[max(x, y)] = min(x, y)
+    region = np.array(parent)
+    while True:
+        roots = region[region]
+        if np.array_equal(roots, region):
+            break
+        region = roots
+    
+    # Number the regions 1, 2, ... in the order of their first run.
+    _, numbers = np.unique(region, return_inverse=True)
+    result: np.ndarray = numbers.reshape(region.shape)[runs]
+    return result
+
+@register_generator("cellular_caves")
+def generate_cellular_caves(
+    rng: random.Random,
+    *,
+    map_width: int,
+    map_height: int,
+    **_: int,
+) -> Layout:
+    """Grow organic caves with a cellular automaton, keeping only the largest connected cave."""
+    np_rng = np.random.default_rng(rng.getrandbits(64))
+    wall = np_rng.random((map_width, map_height)) < 0.45
+    
+    for _iteration in range(5):
+        wall[[0, -1], :] = True
+        wall[:, [0, -1]] = True
+        padded = np.pad(wall, 1, constant_values=True)
+        neighbours = sum(
+            padded[1 + dx : map_width + 1 + dx, 1 + dy : map_height + 1 + dy]
+            for dx in (-1, 0, 1)
+            for dy in (-1, 0, 1)
+            if dx or dy
+        )
+        # The classic 4-5 rule: walls survive with 4 wall neighbours, floors become walls with 5.
+        wall = np.where(wall, neighbours >= 4, neighbours >= 5)
+    
+    wall[[0, -1], :] = True
+    wall[:, [0, -1]] = True
+    
+    # Keep only the largest region, so every floor tile can be reached.
+    cost = (~wall).astype(np.int8)
+    labels = label_regions(~wall)
+    
+    tiles = np.full(
+        (map_width, map_height), fill_value=tile_types.wall, dtype=np.uint8, order="F"
+    )
+    if not labels.any():
+        # Nothing survived the automaton, so fall back to a single open room.
+        room = RectangularRoom(1, 1, map_width - 3, map_height - 3)
+        tiles[room.inner] = tile_types.floor
+        return finish_room_layout(tiles, [room])
+    
+    # Ties go to the region found first, the one with the lowest label.
+    reachable = labels == np.argmax(np.bincount(labels.ravel())[1:]) + 1
+    tiles[reachable] = tile_types.floor
+    
+    # Start on a random floor tile and put the stairs as far from it as possible.
+    floor_tiles = np.argwhere(reachable)
+    player_start = tuple(floor_tiles[rng.randrange(len(floor_tiles))].tolist())
+    distance = tcod.path.maxarray((map_width, map_height), dtype=np.int32)
+    distance[player_start] = 0
+    tcod.path.dijkstra2d(distance, cost, 2, 3, out=distance)
+    distance[~reachable] = -1
+    downstairs_location = tuple(
+        int(i) for i in np.unravel_index(int(np.argmax(distance)), distance.shape)
+    )
+    tiles[downstairs_location] = tile_types.down_stairs
+    
+    # Caves have no rooms, so entities are spawned across fixed-size cells of the cave instead.
+    cell_size = 10
+    rooms = [
+        RectangularRoom(x, y, min(cell_size, map_width - 1 - x), min(cell_size, map_height - 1 - y))
+        for x in range(0, map_width - 1, cell_size)
+        for y in range(0, map_height - 1, cell_size)
+        if reachable[x : x + cell_size, y : y + cell_size].sum() >= cell_size
+    ]
+    
+    return Layout(tiles, rooms, player_start, downstairs_location)
+
+def generate_dungeon(
+    max_rooms: int,
+    room_min_size: int,
+    room_max_size: int,
+    map_width: int,
+    map_height: int,
+    engine: Engine,
+    generator: str = "rooms_and_corridors",
+) -> GameMap:
+    """Generate a new dungeon map using the named generator, then fill it with entities."""
+    player = engine.player
+    floor_number = engine.game_world.current_floor
+    
+    layout = get_layout(
+        generator,
+        params={
+            "max_rooms": max_rooms,
+            "room_min_size": room_min_size,
+            "room_max_size": room_max_size,
+            "map_width": map_width,
+            "map_height": map_height,
+        },
+        seed=engine.world_seed,
+        floor=floor_number,
+    )
+    
+    dungeon = GameMap(engine, map_width, map_height, entities=[player])
+    dungeon.tiles[:] = layout.tiles
+    dungeon.downstairs_location = layout.downstairs_location
+    
+    player.place(*layout.player_start, dungeon)
+    
+    if floor_number > 1:
+        # The player arrives on the up stairs, which lead back to the previous floor.
+        dungeon.tiles[layout.player_start] = tile_types.up_stairs
+        dungeon.upstairs_location = layout.player_start
+    
+    place_entities(layout.rooms, dungeon, floor_number)
+    
+    return dungeon
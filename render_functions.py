@@ -6,7 +6,6 @@ import copy
 import tcod
 
 import color
-import settings
 
 if TYPE_CHECKING:
     from engine import Engine
@@ -57,13 +56,13 @@ def render_names_at_mouse_location(
     
     console.print(x=x, y=y, string=names_at_mouse_location)
     
-def ask_for_text(x: int, y: int, console: tcod.Console) -> str:
+def ask_for_text(x: int, y: int, console: tcod.Console, context: tcod.context.Context) -> str:
     console_copy = copy.copy(console)
     buffer = ""
     while True:
         console_copy.blit(console)
         console.print(x, y, buffer, fg=(255,255,255))
-        settings.main_context.present(console)
+        context.present(console)
         for event in tcod.event.wait():
             if isinstance(event, tcod.event.TextInput):
                 buffer += event.text
@@ -0,0 +1,334 @@
+"""Record game sessions into compact replay files, and read them back.
+
+A replay stores the world seed and the character choices, then every input the player gave:
+the actions handed to EventHandler.handle_action (including impossible ones, which still
+add messages) and level up choices. Replaying the inputs from a new game with the same seed
+reproduces the session exactly.
+
+File layout:
+
+    header:  MAGIC, format version (uint16), metadata length (uint32), metadata as JSON
+    blocks:  kind (uint8), first step (uint32), step count (uint32), payload length (uint32), payload
+    footer:  offset of the INDEX block (uint64), INDEX_MAGIC
+
+ACTIONS blocks hold a zlib-compressed JSON list of inputs. KEYFRAME blocks hold an lzma-compressed
+pickle of the game before their first step. The INDEX block lists every other block, so a reader can
+seek to step N by loading the nearest keyframe at or before N and replaying only the inputs after it.
+If the game exits without writing the index, readers rebuild it by scanning the blocks.
+
+Usage: python replay.py info replays/session.rpl
+       python replay.py seek replays/session.rpl 1200
+       python replay.py stats replays/*.rpl --workers 8
+"""
+from __future__ import annotations
+
+import argparse
+import atexit
+import bisect
+import collections
+import concurrent.futures
+import json
+import lzma
+import os
+import pickle
+import random
+import struct
+import time
+import weakref
+import zlib
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, NamedTuple, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from engine import Engine
+
+MAGIC = b"GRPL"
+INDEX_MAGIC = b"GIDX"
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct("<4sHI")
+BLOCK = struct.Struct("<BIII")
+FOOTER = struct.Struct("<Q4s")
+
+ACTIONS = 1
+KEYFRAME = 2
+INDEX = 3
+
+class Block(NamedTuple):
+    kind: int
+    first_step: int
+    count: int
+    offset: int # Where the payload starts in the file.
+    length: int
+
+def apply_input(engine: Engine, spec: Dict[str, Any]) -> bool:
+    """Apply one recorded input to `engine`, the same way the event handlers do.
+    Returns True if a turn passed."""
+    import actions
+    import input_handlers
+
+    if spec.get("type") == "level_up":
+        engine.player.level.increase_stat(spec["stat"])
+        return False
+    action = actions.action_from_spec(engine.player, spec)
+    return input_handlers.EventHandler(engine).handle_action(action)
+
+def snapshot(engine: Engine) -> bytes:
+    """Return a keyframe of `engine`, including the state of the global RNG."""
+    engine.seed_state = random.getstate()
+    return lzma.compress(pickle.dumps(engine, protocol=pickle.HIGHEST_PROTOCOL))
+
+# Recorders which haven't been closed yet. Held weakly, so that recording doesn't keep finished games alive.
+_open_recorders: weakref.WeakSet[SessionRecorder] = weakref.WeakSet()
+
+@atexit.register
+def close_open_recorders() -> None:
+    """Close every recorder still open, so their files get an index."""
+    for recorder in list(_open_recorders):
+        recorder.close()
+
+class SessionRecorder:
+    """Writes a session's inputs to a replay file as they happen.
+    Inputs are buffered and written `chunk_size` at a time, with a keyframe every `keyframe_interval` steps."""
+    def __init__(
+        self,
+        path: str,
+        engine: Engine,
+        metadata: Dict[str, Any],
+        *,
+        chunk_size: int = 256,
+        keyframe_interval: int = 1024,
+        initial_keyframe: bool = False,
+    ):
+        if keyframe_interval % chunk_size:
+            raise ValueError("keyframe_interval must be a multiple of chunk_size.")
+        self.path = path
+        self.engine = engine
+        self.chunk_size = chunk_size
+        self.keyframe_interval = keyframe_interval
+        self.step = 0
+        self.pending: List[Dict[str, Any]] = []
+        self.blocks: List[Block] = []
+
+        metadata = dict(metadata, initial_keyframe=initial_keyframe, started=time.time())
+        encoded = json.dumps(metadata).encode("utf-8")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file: Optional[BinaryIO] = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(encoded)) + encoded)
+        if initial_keyframe:
+            # Continued games can't be rebuilt from the seed, so they start from a keyframe.
+            self.write_block(KEYFRAME, 0, 0, snapshot(engine))
+        _open_recorders.add(self)
+
+    def write_block(self, kind: int, first_step: int, count: int, payload: bytes) -> None:
+        assert self.file is not None
+        self.file.write(BLOCK.pack(kind, first_step, count, len(payload)))
+        self.blocks.append(Block(kind, first_step, count, self.file.tell(), len(payload)))
+        self.file.write(payload)
+
+    def flush_inputs(self) -> None:
+        if self.pending:
+            payload = zlib.compress(json.dumps(self.pending, separators=(",", ":")).encode("utf-8"))
+            self.write_block(ACTIONS, self.step - len(self.pending), len(self.pending), payload)
+            self.pending = []
+            assert self.file is not None
+            self.file.flush()
+
+    def record(self, spec: Dict[str, Any]) -> None:
+        """Record an input, before it is applied to the game."""
+        if self.file is None:
+            return
+        if self.step and self.step % self.keyframe_interval == 0:
+            self.flush_inputs()
+            self.write_block(KEYFRAME, self.step, 0, snapshot(self.engine))
+        self.pending.append(spec)
+        self.step += 1
+        if len(self.pending) >= self.chunk_size:
+            self.flush_inputs()
+
+    def close(self) -> None:
+        """Write any buffered inputs and the index. Recorders still open at exit are closed then.
+        A recorder dropped without closing leaves a file without an index, which readers rebuild."""
+        if self.file is None:
+            return
+        _open_recorders.discard(self)
+        self.flush_inputs()
+        index_offset = self.file.tell()
+        payload = json.dumps([list(block) for block in self.blocks]).encode("utf-8")
+        self.file.write(BLOCK.pack(INDEX, 0, 0, len(payload)) + payload)
+        self.file.write(FOOTER.pack(index_offset, INDEX_MAGIC))
+        self.file.close()
+        self.file = None
+        if self.engine.recorder is self:
+            self.engine.recorder = None
+
+class ReplayReader:
+    """Random access to a replay file."""
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, metadata_length = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a replay file.")
+            if version > FORMAT_VERSION:
+                raise ValueError(f"{path} uses replay format {version}, this game reads up to {FORMAT_VERSION}.")
+            self.metadata: Dict[str, Any] = json.loads(f.read(metadata_length))
+            self.data_start = f.tell()
+            self.blocks = self.read_index(f)
+        self.actions = [block for block in self.blocks if block.kind == ACTIONS]
+        self.keyframes = [block for block in self.blocks if block.kind == KEYFRAME]
+        self.steps = max((block.first_step + block.count for block in self.actions), default=0)
+
+    def read_index(self, f: BinaryIO) -> List[Block]:
+        """Read the index from the footer, or rebuild it if the recording was cut short."""
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size - self.data_start >= FOOTER.size:
+            f.seek(size - FOOTER.size)
+            index_offset, magic = FOOTER.unpack(f.read(FOOTER.size))
+            if magic == INDEX_MAGIC:
+                f.seek(index_offset)
+                _, _, _, length = BLOCK.unpack(f.read(BLOCK.size))
+                return [Block(*entry) for entry in json.loads(f.read(length))]
+
+        blocks = []
+        f.seek(self.data_start)
+        while True:
+            header = f.read(BLOCK.size)
+            if len(header) < BLOCK.size:
+                break
+            kind, first_step, count, length = BLOCK.unpack(header)
+            offset = f.tell()
+            if kind == INDEX or offset + length > size:
+                break # The index, or a block cut off by the crash.
+            blocks.append(Block(kind, first_step, count, offset, length))
+            f.seek(length, os.SEEK_CUR)
+        return blocks
+
+    def read_payload(self, f: BinaryIO, block: Block) -> bytes:
+        f.seek(block.offset)
+        return f.read(block.length)
+
+    def inputs(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Iterate over the recorded inputs from step `start` up to `stop`, reading only the blocks needed."""
+        stop = self.steps if stop is None else min(stop, self.steps)
+        first_steps = [block.first_step for block in self.actions]
+        with open(self.path, "rb") as f:
+            for block in self.actions[max(bisect.bisect_right(first_steps, start) - 1, 0):]:
+                if block.first_step >= stop:
+                    break
+                chunk = json.loads(zlib.decompress(self.read_payload(f, block)))
+                for step, spec in enumerate(chunk, block.first_step):
+                    if start <= step < stop:
+                        yield spec
+
+    def new_game(self) -> Engine:
+        """Start the recorded game over from the config it was started with."""
+        from settings import Config
+        import setup_game
+
+        if "config" in self.metadata:
+            config = Config.from_dict(self.metadata["config"])
+        else:
+            # Replays recorded before the config was saved only have the character choices.
+            config = Config(
+                player_name=self.metadata["name"],
+                player_class=self.metadata["class"],
+                difficulty=self.metadata["difficulty"],
+                seed=self.metadata["seed"],
+            )
+        return setup_game.new_game(config)
+
+    def load_keyframe(self, block: Block) -> Engine:
+        with open(self.path, "rb") as f:
+            engine: Engine = pickle.loads(lzma.decompress(self.read_payload(f, block)))
+        random.setstate(engine.seed_state)
+        return engine
+
+    def seek(self, step: int) -> Engine:
+        """Return the game as it was before input `step`.
+        Starts from the nearest keyframe at or before `step`, so the cost grows with the distance
+        from that keyframe rather than with `step`."""
+        step = max(0, min(step, self.steps))
+        keyframe_steps = [block.first_step for block in self.keyframes]
+        i = bisect.bisect_right(keyframe_steps, step) - 1
+        if i >= 0:
+            start, engine = self.keyframes[i].first_step, self.load_keyframe(self.keyframes[i])
+        else:
+            start, engine = 0, self.new_game()
+        for spec in self.inputs(start, step):
+            apply_input(engine, spec)
+        return engine
+
+def summarize(path: str) -> Dict[str, Any]:
+    """Replay a whole session headlessly and return statistics about it."""
+    from events import Died
+
+    reader = ReplayReader(path)
+    engine = reader.seek(0)
+    counts: Dict[str, int] = collections.Counter()
+    kills = 0
+
+    def count(event: Any) -> None:
+        nonlocal kills
+        counts[type(event).__name__] += 1
+        if isinstance(event, Died) and event.entity != engine.player.entity_id:
+            kills += 1
+
+    engine.events.subscribe(count)
+    for spec in reader.inputs(0):
+        apply_input(engine, spec)
+
+    return {
+        "path": path,
+        "seed": reader.metadata.get("seed"),
+        "class": reader.metadata.get("class"),
+        "difficulty": reader.metadata.get("difficulty"),
+        "steps": reader.steps,
+        "turns": engine.turn,
+        "floor": engine.game_world.current_floor,
+        "level": engine.player.level.current_level,
+        "alive": engine.player.is_alive,
+        "kills": kills,
+        "damage_events": counts["Damaged"],
+    }
+
+def batch_summaries(paths: Iterable[str], workers: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Replay many sessions in parallel across processes, yielding each summary as it finishes."""
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(summarize, path) for path in paths]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    info = commands.add_parser("info", help="Show a replay's metadata and layout.")
+    info.add_argument("path")
+    seek = commands.add_parser("seek", help="Rebuild the game at a step and describe it.")
+    seek.add_argument("path")
+    seek.add_argument("step", type=int)
+    stats = commands.add_parser("stats", help="Replay many sessions and print one line of statistics each.")
+    stats.add_argument("paths", nargs="+")
+    stats.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        reader = ReplayReader(args.path)
+        print(json.dumps(reader.metadata, indent=2))
+        print(f"steps: {reader.steps}, action blocks: {len(reader.actions)}, keyframes: {len(reader.keyframes)}")
+    elif args.command == "seek":
+        start = time.perf_counter()
+        engine = ReplayReader(args.path).seek(args.step)
+        elapsed = time.perf_counter() - start
+        player = engine.player
+        print(f"step {args.step}: floor {engine.game_world.current_floor}, turn {engine.turn}, "
+              f"player at {player.x},{player.y} with {player.fighter.hp}/{player.fighter.max_hp} hp "
+              f"(rebuilt in {elapsed * 1000:.0f} ms)")
+    else:
+        columns = ["path", "class", "difficulty", "steps", "turns", "floor", "level", "alive", "kills"]
+        print("\t".join(columns))
+        for summary in batch_summaries(args.paths, args.workers):
+            print("\t".join(str(summary[column]) for column in columns))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+"""A headless server which hosts many games in one process, for remote players.
+
+Clients speak newline-delimited JSON over TCP. Every request is one JSON object with an "op":
+
+    {"op": "new", "name": "Ada", "class": "Fighter", "difficulty": "Classic (Hard)", "seed": "abc"}
+    {"op": "act", "session": "<id>", "action": {"type": "move", "dx": 1, "dy": 0}}
+    {"op": "frame", "session": "<id>"}
+    {"op": "close", "session": "<id>"}
+
+Every reply carries a frame: only the map cells, entities, messages and status that changed
+since the last frame sent for that session. Idle sessions are saved to disk with Engine.save_as
+and loaded back on their next request.
+
+Usage: python server.py --port 7777
+       python server.py --benchmark --sessions 200 --turns 100
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from collections import OrderedDict
+import contextlib
+import json
+import os
+import random
+import re
+import statistics
+import time
+import tracemalloc
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, TYPE_CHECKING
+
+import numpy as np # type: ignore
+
+import actions
+import input_handlers
+from settings import Config
+import setup_game
+
+if TYPE_CHECKING:
+    from engine import Engine
+
+class ProtocolError(Exception):
+    """Raised for a request the server can't carry out. The message is sent back to the client."""
+
+def decode_action(engine: Engine, spec: Dict[str, Any]) -> actions.Action:
+    """Build the player's action from its JSON description, see actions.action_from_spec."""
+    try:
+        return actions.action_from_spec(engine.player, spec)
+    except (KeyError, TypeError, ValueError) as exc:
+        raise ProtocolError(str(exc))
+
+class FrameDiffer:
+    """Remembers what a client has been sent, and builds the difference to the current state."""
+    def __init__(self) -> None:
+        self.game_map: Any = None
+        self.light: Optional[np.ndarray] = None
+        self.tiles: Optional[np.ndarray] = None
+        self.entities: Dict[str, List[Any]] = {}
+        self.message_count = 0
+        self.last_message_count = 0
+        self.status: Dict[str, Any] = {}
+
+    def frame(self, engine: Engine) -> Dict[str, Any]:
+        game_map = engine.game_map
+        frame: Dict[str, Any] = {}
+        if game_map is not self.game_map:
+            # A new floor, or a client that has been sent nothing yet.
+            self.game_map = game_map
+            self.light = np.zeros((game_map.width, game_map.height), dtype=np.uint8)
+            self.tiles = np.zeros((game_map.width, game_map.height), dtype=np.uint8)
+            self.entities = {}
+            frame["map"] = [game_map.width, game_map.height]
+
+        # Only explored tiles are sent, so clients can't see the layout of unexplored areas.
+        light = (np.asarray(game_map.visible).view(np.uint8) << 1) | np.asarray(game_map.explored).view(np.uint8)
+        tiles = np.where(light > 0, np.asarray(game_map.tiles), 0).astype(np.uint8)
+        changed = np.flatnonzero(((light != self.light) | (tiles != self.tiles)).ravel(order="F"))
+        if len(changed):
+            frame["cells"] = [
+                changed.tolist(),
+                tiles.ravel(order="F")[changed].tolist(),
+                light.ravel(order="F")[changed].tolist(),
+            ]
+        self.light, self.tiles = light, tiles
+
+        entities = {
+            entity.entity_id: [entity.x, entity.y, entity.char, list(entity.color), entity.name]
+            for entity in sorted(game_map.entities, key=lambda entity: entity.render_order.value)
+            if game_map.visible[entity.x, entity.y]
+        }
+        updated = {
+            entity_id: entity for entity_id, entity in entities.items()
+            if self.entities.get(entity_id) != entity
+        }
+        removed = [entity_id for entity_id in self.entities if entity_id not in entities]
+        if updated:
+            frame["entities"] = updated
+        if removed:
+            frame["removed"] = removed
+        self.entities = entities
+
+        # Stacked messages change the count of the last message, so it may need resending.
+        messages = engine.message_log.messages
+        start = self.message_count
+        if start and start <= len(messages) and messages[start - 1].count != self.last_message_count:
+            start -= 1
+        if start < len(messages):
+            frame["messages_from"] = start
+            frame["messages"] = [[message.full_text, list(message.fg)] for message in messages[start:]]
+        self.message_count = len(messages)
+        self.last_message_count = messages[-1].count if messages else 0
+
+        player = engine.player
+        status = {
+            "hp": player.fighter.hp,
+            "max_hp": player.fighter.max_hp,
+            "floor": engine.game_world.current_floor,
+            "level": player.level.current_level,
+            "xp": player.level.current_xp,
+            "alive": player.is_alive,
+            "level_up": player.level.requires_level_up,
+            "inventory": [item.name for item in player.inventory.items],
+        }
+        changed_status = {key: value for key, value in status.items() if self.status.get(key) != value}
+        if changed_status:
+            frame["status"] = changed_status
+        self.status = status
+        return frame
+
+class Session:
+    """One game hosted by the server, with its own random number generator state."""
+    def __init__(self, session_id: str, engine: Engine, rng_state: Any):
+        self.session_id = session_id
+        self.engine = engine
+        self.rng_state = rng_state
+        self.differ = FrameDiffer()
+        self.last_active = time.monotonic()
+
+    @contextlib.contextmanager
+    def activate(self) -> Iterator[None]:
+        """Swap this session's RNG state in for the duration of the block.
+        The game uses the global `random` module, so every session must restore its own state
+        before running, or sessions would change each other's rolls."""
+        random.setstate(self.rng_state)
+        try:
+            yield
+        finally:
+            self.rng_state = random.getstate()
+            self.last_active = time.monotonic()
+
+    def act(self, spec: Dict[str, Any]) -> bool:
+        """Perform one player action. Returns True if a turn passed."""
+        engine = self.engine
+        player = engine.player
+        if not player.is_alive:
+            raise ProtocolError("The player is dead.")
+        with self.activate():
+            if spec.get("type") == "level_up":
+                if not player.level.requires_level_up:
+                    raise ProtocolError("No level up is pending.")
+                try:
+                    player.level.increase_stat(spec.get("stat"))
+                except ValueError:
+                    raise ProtocolError("stat must be hp, power or defense.")
+                return False
+            if player.level.requires_level_up:
+                raise ProtocolError("Choose a level up first.")
+            return input_handlers.EventHandler(engine).handle_action(decode_action(engine, spec))
+
+# The form of the ids given to new sessions, uuid4().hex.
+SESSION_ID = re.compile(r"[0-9a-f]{32}")
+
+class SessionStore:
+    """Holds the sessions in memory, least recently used first, and evicts idle ones to disk."""
+    def __init__(
+        self,
+        directory: str = "sessions",
+        max_in_memory: int = 1000,
+        idle_seconds: float = 300.0,
+        config: Optional[Config] = None,
+    ):
+        self.config = config or Config() # New sessions start from this, with the client's character choices.
+        self.directory = directory
+        self.max_in_memory = max_in_memory
+        self.idle_seconds = idle_seconds
+        self.sessions: OrderedDict[str, Session] = OrderedDict()
+
+    def path(self, session_id: str) -> str:
+        """Return where the session is saved while evicted.
+        Only ids this server issues are accepted, so a client can't name any other file."""
+        if not SESSION_ID.fullmatch(session_id):
+            raise ProtocolError("No such session.")
+        return os.path.join(self.directory, f"{session_id}.sav")
+
+    def create(self, name: str, player_class: str, difficulty: str, seed: str) -> Session:
+        try:
+            config = self.config._replace(
+                player_name=name, player_class=player_class, difficulty=difficulty, seed=seed
+            ).validate()
+        except ValueError as exc:
+            raise ProtocolError(str(exc))
+        engine = setup_game.new_game(config)
+        session = Session(uuid.uuid4().hex, engine, random.getstate())
+        self.sessions[session.session_id] = session
+        self.evict_over_capacity()
+        return session
+
+    def get(self, session_id: str) -> Session:
+        session = self.sessions.get(session_id)
+        if session is None:
+            if not os.path.exists(self.path(session_id)):
+                raise ProtocolError("No such session.")
+            engine = setup_game.load_game(self.path(session_id))
+            os.remove(self.path(session_id))
+            session = Session(session_id, engine, random.getstate())
+            self.sessions[session_id] = session
+            self.evict_over_capacity()
+        self.sessions.move_to_end(session_id)
+        return session
+
+    def close(self, session_id: str) -> None:
+        if self.sessions.pop(session_id, None) is None:
+            try:
+                os.remove(self.path(session_id))
+            except FileNotFoundError:
+                raise ProtocolError("No such session.")
+
+    def evict(self, session_id: str) -> None:
+        """Save a session to disk and release it from memory."""
+        session = self.sessions.pop(session_id)
+        os.makedirs(self.directory, exist_ok=True)
+        with session.activate():
+            session.engine.save_as(self.path(session_id))
+
+    def evict_over_capacity(self) -> None:
+        while len(self.sessions) > self.max_in_memory:
+            self.evict(next(iter(self.sessions)))
+
+    def evict_idle(self) -> int:
+        """Evict every session idle for longer than `idle_seconds`. Returns how many were evicted."""
+        cutoff = time.monotonic() - self.idle_seconds
+        idle = [session_id for session_id, session in self.sessions.items() if session.last_active < cutoff]
+        for session_id in idle:
+            self.evict(session_id)
+        return len(idle)
+
+class GameServer:
+    def __init__(self, store: Optional[SessionStore] = None):
+        self.store = store or SessionStore()
+
+    def handle_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Carry out one request and return the reply."""
+        try:
+            op = request.get("op")
+            if op == "new":
+                session = self.store.create(
+                    str(request.get("name", "Player")),
+                    str(request.get("class", "Fighter")),
+                    str(request.get("difficulty", "Standard (Medium)")),
+                    str(request.get("seed", uuid.uuid4().hex)),
+                )
+                return {"session": session.session_id, "frame": session.differ.frame(session.engine)}
+            if op == "act":
+                session = self.store.get(str(request.get("session")))
+                turn_passed = session.act(dict(request.get("action") or {}))
+                return {"turn_passed": turn_passed, "frame": session.differ.frame(session.engine)}
+            if op == "frame":
+                session = self.store.get(str(request.get("session")))
+                session.differ = FrameDiffer() # The client asked to resynchronize from scratch.
+                return {"frame": session.differ.frame(session.engine)}
+            if op == "close":
+                self.store.close(str(request.get("session")))
+                return {"closed": True}
+            raise ProtocolError(f"Unknown op: {op!r}")
+        except ProtocolError as exc:
+            return {"error": str(exc)}
+        except (KeyError, TypeError, ValueError) as exc:
+            return {"error": f"Malformed request: {exc!r}"}
+
+    def handle_line(self, line: bytes) -> bytes:
+        try:
+            request = json.loads(line)
+        except ValueError:
+            reply: Dict[str, Any] = {"error": "Requests must be JSON objects."}
+        else:
+            if isinstance(request, dict):
+                reply = self.handle_request(request)
+            else:
+                reply = {"error": "Requests must be JSON objects."}
+        return json.dumps(reply, separators=(",", ":")).encode() + b"\n"
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(self.handle_line(line))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def evict_idle_forever(self, interval: float = 30.0) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self.store.evict_idle()
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        eviction = asyncio.ensure_future(self.evict_idle_forever())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            eviction.cancel()
+
+class LocalClient:
+    """A stand-in for a remote client, which sends requests through the same JSON encoding
+    as a socket connection but calls the server directly."""
+    def __init__(self, server: GameServer):
+        self.server = server
+        self.bytes_received = 0
+        self.latencies: List[float] = [] # Seconds spent by the server on each request.
+
+    async def request(self, **request: Any) -> Dict[str, Any]:
+        start = time.perf_counter()
+        reply = self.server.handle_line(json.dumps(request).encode())
+        self.latencies.append(time.perf_counter() - start)
+        self.bytes_received += len(reply)
+        await asyncio.sleep(0) # Let other clients run between turns, as a socket would.
+        return json.loads(reply)
+
+async def benchmark(sessions: int, turns: int, directory: str) -> None:
+    """Play random moves in many sessions at once, and report memory use and turn latency."""
+    server = GameServer(SessionStore(directory=directory))
+    clients = [LocalClient(server) for _ in range(sessions)]
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    session_ids = [
+        (await client.request(op="new", name="Bench", seed=f"bench-{i}"))["session"]
+        for i, client in enumerate(clients)
+    ]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rng = random.Random(0)
+
+    async def play(client: LocalClient, session_id: str) -> None:
+        for _ in range(turns):
+            action = {"type": "move", "dx": rng.choice((-1, 0, 1)), "dy": rng.choice((-1, 0, 1))}
+            reply = await client.request(op="act", session=session_id, action=action)
+            if "error" in reply:
+                if reply["error"] == "Choose a level up first.":
+                    await client.request(op="act", session=session_id, action={"type": "level_up", "stat": "power"})
+                elif reply["error"] == "The player is dead.":
+                    return
+
+    start = time.perf_counter()
+    await asyncio.gather(*(play(client, session_id) for client, session_id in zip(clients, session_ids)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for client in clients for latency in client.latencies[1:])
+
+    evict_start = time.perf_counter()
+    for session_id in list(server.store.sessions):
+        server.store.evict(session_id)
+    evict_elapsed = time.perf_counter() - evict_start
+    saved_bytes = sum(os.path.getsize(server.store.path(session_id)) for session_id in session_ids)
+    for session_id in session_ids:
+        server.store.close(session_id)
+
+    print(f"sessions:               {sessions}")
+    print(f"memory per session:     {(after - before) / sessions / 1024:.1f} KiB")
+    print(f"turns played:           {len(latencies)} in {elapsed:.2f} s ({len(latencies) / elapsed:.0f} turns/s)")
+    print(f"turn latency p50:       {statistics.median(latencies) * 1000:.2f} ms")
+    print(f"turn latency p99:       {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms")
+    print(f"bytes sent per turn:    {sum(c.bytes_received for c in clients) / len(latencies):.0f}")
+    print(f"evicted session size:   {saved_bytes / sessions / 1024:.1f} KiB ({evict_elapsed / sessions * 1000:.1f} ms each)")
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--directory", default="sessions", help="Where evicted sessions are saved.")
+    parser.add_argument("--max-sessions", type=int, default=1000, help="Sessions kept in memory.")
+    parser.add_argument("--idle-seconds", type=float, default=300.0, help="Evict sessions idle this long.")
+    parser.add_argument("--benchmark", action="store_true", help="Run the benchmark instead of serving.")
+    parser.add_argument("--sessions", type=int, default=100, help="Sessions in the benchmark.")
+    parser.add_argument("--turns", type=int, default=100, help="Turns per session in the benchmark.")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        asyncio.run(benchmark(args.sessions, args.turns, args.directory))
+        return
+    store = SessionStore(args.directory, args.max_sessions, args.idle_seconds)
+    asyncio.run(GameServer(store).serve(args.host, args.port))
+
+if __name__ == "__main__":
+    main()
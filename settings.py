@@ -1,59 +1,154 @@
-import tcod
-
-# The seed
-# --------
-seed = ""
-
-# The context (as I understand it, the window)
-# --------------------------------------------
-screen_width = 80
-screen_height = 50
-
-tileset = tcod.tileset.load_tilesheet(
-    "tileset.png", # path
-    16, # the number of columns
-    16, # the number of rows
-    tcod.tileset.CHARMAP_CP437 # charmap
-)
-
-main_context = tcod.context.new_terminal(
-    screen_width,
-    screen_height,
-    tileset=tileset,
-    title="GOLD",
-    vsync=True,
-)
-
-# Character information
-# ---------------------
-player_name = "" 
-# player_name should only be grabbed during character creation. 
-# Afterwards, always use "player.name".
-# We need this because we create a player name before we have a player object to hold its name.
+"""Settings for a game session: the Config it is started with, and how to load one from a file or the command line.
+
+Importing this module has no side effects. The window is only created by open_context, so that
+servers, simulators and batch runners can import the game and run many differently configured
+sessions in one process.
+
+A config file is a JSON object with any of the Config fields, for example:
+
+    {"map_width": 200, "map_height": 120, "fov_radius": 10, "vsync": false}
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import tcod
+
+GAME_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# The choices offered during character creation.
 list_of_classes = [
-    "Cleric", 
-    "Druid", 
-    "Dwarf", 
-    "Elf", 
-    "Fighter", 
-    "Halfling", 
-    "Magic-User", 
-    "Paladin", 
-    "Ranger", 
+    "Cleric",
+    "Druid",
+    "Dwarf",
+    "Elf",
+    "Fighter",
+    "Halfling",
+    "Magic-User",
+    "Paladin",
+    "Ranger",
     "Warlock"
 ]
-player_class = "" 
-# player_class should only be grabbed during character creation. 
-# Afterwards, always use "player.combat_class".
-# We need this because we create a player class before we have a player object to hold its class.
-class_number = -1
 list_of_difficulties = [
-    "Extreme (Easy)", 
-    "Standard (Medium)", 
-    "Classic (Hard)" 
+    "Extreme (Easy)",
+    "Standard (Medium)",
+    "Classic (Hard)"
 ]
-difficulty = ""
-difficulty_number = -1
 
-# Controls
-# --------
\ No newline at end of file
+# The rows at the bottom of the screen used by the HP bar, the message log and the dungeon level.
+HUD_HEIGHT = 7
+
+class Config(NamedTuple):
+    """Everything a game session is started with.
+    A Config is immutable: use `config._replace(seed="abc")` for a changed copy."""
+    # The character
+    player_name: str = "Player"
+    player_class: str = "Fighter"
+    difficulty: str = "Standard (Medium)"
+    seed: str = ""
+
+    # The dungeon
+    map_width: int = 80
+    map_height: int = 43
+    max_rooms: int = 30
+    room_min_size: int = 6
+    room_max_size: int = 10
+    fov_radius: int = 8
+
+    # The window
+    screen_width: int = 80
+    screen_height: int = 50
+    tileset: str = "tileset.png" # Relative to the game directory, unless absolute.
+    vsync: bool = True
+    renderer: str = "auto" # An SDL render driver such as "opengl" or "software", or "auto" to let SDL choose.
+
+    @classmethod
+    def from_dict(cls, values: Dict[str, Any], base: Optional[Config] = None) -> Config:
+        """Return `base`, or the default config, with the fields in `values` replaced.
+        Raises ValueError for unknown fields and values of the wrong type."""
+        config = base or cls()
+        unknown = set(values) - set(cls._fields)
+        if unknown:
+            raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+        for name, value in values.items():
+            expected = type(getattr(config, name))
+            if type(value) is not expected:
+                raise ValueError(f"The setting {name} must be a {expected.__name__}, not {value!r}")
+        return config._replace(**values).validate()
+
+    def validate(self) -> Config:
+        if self.player_class not in list_of_classes:
+            raise ValueError(f"Unknown class: {self.player_class!r}")
+        if self.difficulty not in list_of_difficulties:
+            raise ValueError(f"Unknown difficulty: {self.difficulty!r}")
+        if not 0 < self.room_min_size <= self.room_max_size:
+            raise ValueError("Rooms need 0 < room_min_size <= room_max_size.")
+        if self.map_width <= self.room_max_size or self.map_height <= self.room_max_size:
+            raise ValueError("The map must be larger than the largest room.")
+        if self.screen_height <= HUD_HEIGHT:
+            raise ValueError(f"The screen must be more than {HUD_HEIGHT} rows high.")
+        return self
+
+    @property
+    def viewport_size(self) -> Tuple[int, int]:
+        """The size of the part of the screen the map is drawn on."""
+        return self.screen_width, self.screen_height - HUD_HEIGHT
+
+def parse_value(text: str, expected: type) -> Any:
+    """Parse a command line value for a setting of the `expected` type."""
+    if expected is bool:
+        if text.lower() in ("1", "true", "yes", "on"):
+            return True
+        if text.lower() in ("0", "false", "no", "off"):
+            return False
+        raise ValueError(f"Not a boolean: {text!r}")
+    return expected(text)
+
+def load_config(path: Optional[str] = None, overrides: Iterable[str] = ()) -> Config:
+    """Load a Config from the JSON file at `path`, if given, then apply "name=value" overrides."""
+    config = Config()
+    if path is not None:
+        with open(path, "r", encoding="utf-8") as f:
+            config = Config.from_dict(json.load(f))
+    values: Dict[str, Any] = {}
+    for override in overrides:
+        name, separator, text = override.partition("=")
+        if not separator or name not in Config._fields:
+            raise ValueError(f"Expected name=value with a known setting, got {override!r}")
+        values[name] = parse_value(text, type(getattr(config, name)))
+    return Config.from_dict(values, base=config)
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--config", metavar="FILE", help="A JSON file of settings.")
+    parser.add_argument(
+        "--set", dest="overrides", metavar="NAME=VALUE", action="append", default=[],
+        help=f"Override one setting, one of: {', '.join(Config._fields)}.",
+    )
+
+def config_from_args(args: argparse.Namespace) -> Config:
+    return load_config(args.config, args.overrides)
+
+def open_context(config: Config) -> tcod.context.Context:
+    """Load the tileset and open the game window."""
+    import tcod
+
+    if config.renderer != "auto":
+        # SDL reads its render driver from the environment when the window's renderer is created.
+        os.environ["SDL_RENDER_DRIVER"] = config.renderer
+    tileset = tcod.tileset.load_tilesheet(
+        os.path.join(GAME_DIRECTORY, config.tileset), # path
+        16, # the number of columns
+        16, # the number of rows
+        tcod.tileset.CHARMAP_CP437 # charmap
+    )
+    return tcod.context.new_terminal(
+        config.screen_width,
+        config.screen_height,
+        tileset=tileset,
+        title="GOLD",
+        vsync=config.vsync,
+    )
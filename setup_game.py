@@ -3,47 +3,63 @@ from __future__ import annotations
 
 import copy
 import lzma
+import os
 import pickle
 import random
+import time
 import traceback
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 
+import numpy as np # type: ignore
 import tcod
 
 import color
-from dice_roller import dice_roller
-from engine import Engine
-import entity_factories
-from game_map import GameWorld
 import input_handlers
 import render_functions
 import settings
+from settings import Config
 
-# Load the background image and remove the alpha channel.
-background_image = tcod.image.load("menu_background.png")[:, :, :3]
+if TYPE_CHECKING:
+    from engine import Engine
 
-def new_game() -> Engine:
-    """Return a brand new game session as an Engine instance."""
-    map_width = 80
-    map_height = 43
+# The engine, procgen and the entity templates are imported inside the functions that use them,
+# so that the main menu can be shown without loading the rest of the game.
+
+_background_image: Optional[np.ndarray] = None
+
+def get_background_image() -> np.ndarray:
+    """Return the main menu background, loading it on first use."""
+    global _background_image
+    if _background_image is None:
+        # Load the background image and remove the alpha channel.
+        _background_image = tcod.image.load(
+            os.path.join(settings.GAME_DIRECTORY, "menu_background.png")
+        )[:, :, :3]
+    return _background_image
+
+def new_game(config: Config) -> Engine:
+    """Return a brand new game session as an Engine instance.
+    The RNG is seeded from the config's seed, so the same config always starts the same game."""
+    from dice_roller import dice_roller
+    from engine import Engine
+    import entity_factories
+    from game_map import GameWorld
     
-    room_max_size = 10
-    room_min_size = 6
-    max_rooms = 30
+    random.seed(config.seed)
     
     player = copy.deepcopy(entity_factories.player)
-    player.name = settings.player_name
-    player.character_class = settings.player_class
+    player.name = config.player_name
+    player.character_class = config.player_class
     
-    engine = Engine(player=player)
+    engine = Engine(player=player, config=config)
     
     engine.game_world = GameWorld(
         engine=engine,
-        max_rooms=max_rooms,
-        room_min_size=room_min_size,
-        room_max_size=room_max_size,
-        map_width=map_width,
-        map_height=map_height,
+        max_rooms=config.max_rooms,
+        room_min_size=config.room_min_size,
+        room_max_size=config.room_max_size,
+        map_width=config.map_width,
+        map_height=config.map_height,
     )
     
     engine.game_world.generate_floor()
@@ -54,7 +70,7 @@ def new_game() -> Engine:
     )
     
     # Rolling for stats.
-    if settings.difficulty == "Extreme (Easy)":
+    if config.difficulty == "Extreme (Easy)":
         # Extreme generates stats via 3d20k1.
         engine.player.charisma = dice_roller(3,20,1)
         engine.player.constitution = dice_roller(3,20,1)
@@ -62,7 +78,7 @@ def new_game() -> Engine:
         engine.player.intelligence = dice_roller(3,20,1)
         engine.player.strength = dice_roller(3,20,1)
         engine.player.wisdom = dice_roller(3,20,1)
-    elif settings.difficulty == "Standard (Medium)":
+    elif config.difficulty == "Standard (Medium)":
         # Standard generates stats via 3d10k2.
         engine.player.charisma = dice_roller(3,10,2)
         engine.player.constitution = dice_roller(3,10,2)
@@ -70,7 +86,7 @@ def new_game() -> Engine:
         engine.player.intelligence = dice_roller(3,10,2)
         engine.player.strength = dice_roller(3,10,2)
         engine.player.wisdom = dice_roller(3,10,2)
-    elif settings.difficulty == "Classic (Hard)":
+    elif config.difficulty == "Classic (Hard)":
         # Classic generates stats via 3d6.
         engine.player.charisma = dice_roller(3,6,3)
         engine.player.constitution = dice_roller(3,6,3)
@@ -84,35 +100,92 @@ def new_game() -> Engine:
     starting_gold = dice_roller(3,6,3)*10
     gold = copy.deepcopy(entity_factories.gold)
     gold.stack = starting_gold
-    gold.parent = engine.player.inventory
-    engine.player.inventory.items.append(gold)
+    engine.player.inventory.add(gold)
     
     # Starting weapon:
     dagger = copy.deepcopy(entity_factories.dagger)
-    dagger.parent = engine.player.inventory
-    engine.player.inventory.items.append(dagger)
+    engine.player.inventory.add(dagger)
     engine.player.equipment.toggle_equip(dagger, add_message=False)
     
     # Starting armor:
     leather_armor = copy.deepcopy(entity_factories.leather_armor)
-    leather_armor.parent = engine.player.inventory
-    engine.player.inventory.items.append(leather_armor)
+    engine.player.inventory.add(leather_armor)
     engine.player.equipment.toggle_equip(leather_armor, add_message=False)
     return engine
 
 def load_game(filename: str) -> Engine:
     """Load an Engine instance from a file."""
+    from engine import Engine
+    
     with open(filename, "rb") as f:
         engine = pickle.loads(lzma.decompress(f.read()))
     assert isinstance(engine, Engine)
     random.setstate(engine.seed_state) # This loads the seed state of the RNG which was saved before quitting.
     return engine
 
+# Every game is journaled here, so it can be recovered if the game crashes without saving.
+JOURNAL_DIRECTORY = "journal"
+
+def start_journal(engine: Engine) -> Engine:
+    """Start recording `engine`'s events to the journal, replacing the previous game's journal."""
+    from events import EventJournal
+    
+    EventJournal(JOURNAL_DIRECTORY).attach(engine)
+    return engine
+
+def continue_game(filename: str) -> Engine:
+    """Load the saved game, or recover the journaled game if it is newer than the save.
+    The journal is only newer when the last session ended without saving, such as after a crash.
+    A journal is deleted when the player dies, and without a save there is no game to continue,
+    so a finished game is never recovered."""
+    from events import EventJournal, recover
+    
+    if not os.path.exists(filename):
+        raise FileNotFoundError(filename)
+    
+    engine: Optional[Engine] = None
+    journal = EventJournal(JOURNAL_DIRECTORY)
+    if journal.exists() and journal.last_modified() > os.path.getmtime(filename):
+        engine = recover(JOURNAL_DIRECTORY)
+        if engine.player.is_alive:
+            engine.message_log.add_message("Recovered the game from its journal.", color.welcome_text)
+        else:
+            engine = None
+    if engine is None:
+        engine = load_game(filename)
+    return start_recording(start_journal(engine), continued=True)
+
+# Every session is recorded here, for analytics. See replay.py.
+REPLAY_DIRECTORY = "replays"
+
+def start_recording(engine: Engine, continued: bool = False) -> Engine:
+    """Record the player's inputs to a new replay file.
+    A continued game can't be rebuilt from its seed, so its replay starts from a keyframe instead."""
+    from replay import SessionRecorder
+    
+    config = engine.config
+    metadata = {
+        "name": config.player_name,
+        "class": config.player_class,
+        "difficulty": config.difficulty,
+        "seed": config.seed,
+        "config": config._asdict(),
+    }
+    filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.rpl"
+    engine.recorder = SessionRecorder(
+        os.path.join(REPLAY_DIRECTORY, filename), engine, metadata, initial_keyframe=continued
+    )
+    return engine
+
 class MainMenu(input_handlers.BaseEventHandler):
     """Handle the main menu rendering and input."""
+    def __init__(self, config: Config, context: tcod.context.Context):
+        self.config = config # New games start from this config, with the character creator's choices filled in.
+        self.context = context
+    
     def on_render(self, console: tcod.Console) -> None:
         """Render the main menu on a background image."""
-        console.draw_semigraphics(background_image, 0, 0)
+        console.draw_semigraphics(get_background_image(), 0, 0)
         
         console.print(
             console.width // 2,
@@ -150,56 +223,68 @@ class MainMenu(input_handlers.BaseEventHandler):
             raise SystemExit()
         elif event.sym == tcod.event.K_c:
             try:
-                return input_handlers.MainGameEventHandler(load_game("savegame.sav"))
+                return input_handlers.MainGameEventHandler(continue_game("savegame.sav"))
             except FileNotFoundError:
                 return input_handlers.PopupMessage(self, "No saved game to load.")
             except Exception as exc:
                 traceback.print_exc() # Print to stderr.
                 return input_handlers.PopupMessage(self, f"Failed to load save:\n{exc}")
         elif event.sym == tcod.event.K_n:
-            return CharacterCreator()
+            return CharacterCreator(self.config, self.context)
         return None
 
 class CharacterCreator(input_handlers.BaseEventHandler):
-    """Handle the character creation (name, class, difficulty, world seed) rendering and input."""
+    """Handle the character creation (name, class, difficulty, world seed) rendering and input.
+    The choices are kept on this handler until they are confirmed, then become the new game's config."""
+    def __init__(self, config: Config, context: tcod.context.Context):
+        self.config = config
+        self.context = context
+        self.reset()
+    
+    def reset(self) -> None:
+        """Clear all the choices, so the player must select again."""
+        self.player_name = ""
+        self.class_number = -1
+        self.difficulty_number = -1
+        self.seed = ""
+    
+    @property
+    def player_class(self) -> str:
+        return settings.list_of_classes[self.class_number] if self.class_number >= 0 else ""
+    
+    @property
+    def difficulty(self) -> str:
+        return settings.list_of_difficulties[self.difficulty_number] if self.difficulty_number >= 0 else ""
+    
+    @property
+    def is_complete(self) -> bool:
+        return self.player_name != "" and self.player_class != "" and self.difficulty != "" and self.seed != ""
+    
     def ev_keydown(self, event: tcod.event.KeyDown) -> Optional[ActionOrHandler]:
         key = event.sym
         index = key - tcod.event.K_a
         
-        if 0 <= index < len(settings.list_of_classes) and settings.player_class == "":
+        if 0 <= index < len(settings.list_of_classes) and self.player_class == "":
             # Detecting the keypress that selects the player's class.
-            settings.class_number = index
-            settings.player_class = settings.list_of_classes[settings.class_number]
-        elif len(settings.list_of_classes) <= index < len(settings.list_of_classes)+len(settings.list_of_difficulties) and settings.difficulty == "":
+            self.class_number = index
+        elif len(settings.list_of_classes) <= index < len(settings.list_of_classes)+len(settings.list_of_difficulties) and self.difficulty == "":
             # Detecting the keypress that selects the player's difficulty level. 
             # Offset by the number of classes so that alphabetically it picks up where the last list left off.
-            settings.difficulty_number = index - len(settings.list_of_classes)
-            settings.difficulty = settings.list_of_difficulties[settings.difficulty_number]
-        elif(
-            key == tcod.event.K_n 
-            and settings.player_name != "" 
-            and settings.player_class != "" 
-            and settings.difficulty != ""
-            and settings.seed != ""
-        ):
+            self.difficulty_number = index - len(settings.list_of_classes)
+        elif key == tcod.event.K_n and self.is_complete:
             # The player has entered their details but then selected "[N]" when asked to confirm their choices.
             # This resets all the choices back to the default and the player must select again.
-            settings.player_name = ""
-            settings.player_class = ""
-            settings.class_number = -1
-            settings.difficulty = ""
-            settings.difficulty_number = -1
-            settings.seed = ""
-        elif(
-            key == tcod.event.K_y
-            and settings.player_name != "" 
-            and settings.player_class != "" 
-            and settings.difficulty != ""
-            and settings.seed != ""
-        ):
+            self.reset()
+        elif key == tcod.event.K_y and self.is_complete:
             # The player has entered their details and selected "[Y]" when asked to confirm their choices.
             # This generates the game.
-            return input_handlers.MainGameEventHandler(new_game()) 
+            config = self.config._replace(
+                player_name=self.player_name,
+                player_class=self.player_class,
+                difficulty=self.difficulty,
+                seed=self.seed,
+            )
+            return input_handlers.MainGameEventHandler(start_recording(start_journal(new_game(config))))
         return None
     
     def on_render(self, console: tcod.Console) -> None:
@@ -220,7 +305,7 @@ class CharacterCreator(input_handlers.BaseEventHandler):
             class_string = f"[{class_key}] {character_class}"
             
             console.print(3, 7+i, class_string, fg=color.menu_text)
-        console.print(7, 7+settings.class_number, settings.player_class, fg=color.gold) # When the class has been chosen, this highlights it gold.
+        console.print(7, 7+self.class_number, self.player_class, fg=color.gold) # When the class has been chosen, this highlights it gold.
         
         console.print(2, 19, "Rolling for stats:")
         for i, text in enumerate(settings.list_of_difficulties):
@@ -232,23 +317,21 @@ class CharacterCreator(input_handlers.BaseEventHandler):
             difficulty_string = f"[{difficulty_key}] {text}"
             
             console.print(3, 21+i, difficulty_string, fg=color.menu_text)
-        console.print(7, 21+settings.difficulty_number, settings.difficulty, fg=color.gold) # When the difficulty has been chosen, this highlights it gold.
+        console.print(7, 21+self.difficulty_number, self.difficulty, fg=color.gold) # When the difficulty has been chosen, this highlights it gold.
         
-        if settings.player_name == "":
-            settings.player_name = render_functions.ask_for_text(x=8, y=2, console=console)
+        if self.player_name == "":
+            self.player_name = render_functions.ask_for_text(x=8, y=2, console=console, context=self.context)
         else:
-            console.print(8, 2, settings.player_name, fg=color.gold) # When the name has been entered, this highlights it gold.
+            console.print(8, 2, self.player_name, fg=color.gold) # When the name has been entered, this highlights it gold.
         
-        if settings.player_class != "" and settings.difficulty != "":
+        if self.player_class != "" and self.difficulty != "":
             console.print(2, 26, "Seed:")
-            if settings.seed == "":
-                settings.seed = render_functions.ask_for_text(x=8, y=26, console=console)
+            if self.seed == "":
+                self.seed = render_functions.ask_for_text(x=8, y=26, console=console, context=self.context)
             else:
-                console.print(8, 26, settings.seed, fg=color.gold) # When the seed has been entered, this highlights it gold.
-        
-        random.seed(settings.seed) 
+                console.print(8, 26, self.seed, fg=color.gold) # When the seed has been entered, this highlights it gold.
         
-        if settings.player_name != "" and settings.player_class != "" and settings.difficulty != "":
+        if self.player_name != "" and self.player_class != "" and self.difficulty != "":
             console.print(2, 29, "Confirm the above? [Y] or [N]", fg=color.menu_text)
 
-        console.blit(console, 0, 0,)
\ No newline at end of file
+        console.blit(console, 0, 0,)
@@ -0,0 +1,99 @@
+"""Report how long the game takes to reach its first frame, and check it against a budget.
+
+The report has two parts:
+- an `-X importtime` breakdown of `import main`, listing the slowest top-level modules
+- the time until the main menu's first frame has been presented
+
+Usage: python startup_report.py --budget-ms 800
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Run in a fresh interpreter, so that nothing is imported before the clock starts.
+FIRST_FRAME_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import main
+import setup_game
+import settings
+import tcod
+imported = time.perf_counter()
+config = settings.Config()
+context = settings.open_context(config)
+handler = setup_game.MainMenu(config, context)
+console = tcod.console.Console(config.screen_width, config.screen_height, order="F")
+handler.on_render(console=console)
+context.present(console)
+presented = time.perf_counter()
+print(json.dumps({"import_ms": (imported - start) * 1000, "first_frame_ms": (presented - start) * 1000}))
+"""
+
+def import_times(env: Dict[str, str]) -> List[Tuple[str, int, int]]:
+    """Return (module, self_us, cumulative_us) for every module imported by `import main`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((module.rstrip(), int(self_us), int(cumulative_us)))
+    return rows
+
+def first_frame(env: Dict[str, str]) -> Dict[str, float]:
+    """Return the import and first-frame latencies measured in a fresh interpreter."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", FIRST_FRAME_SCRIPT],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["process_ms"] = (time.perf_counter() - start) * 1000
+    return timings
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail if the first frame takes longer.")
+    parser.add_argument("--top", type=int, default=15, help="How many modules to list.")
+    parser.add_argument("--headless", action="store_true", help="Use SDL's dummy video driver.")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    if args.headless:
+        env["SDL_VIDEODRIVER"] = "dummy"
+    env["PYTHONWARNINGS"] = "ignore"
+
+    rows = import_times(env)
+    # Only list modules imported directly by main or its first level of imports.
+    top_level = [row for row in rows if len(row[0]) - len(row[0].lstrip()) <= 4]
+    print(f"{'module':<40}{'self ms':>10}{'total ms':>10}")
+    for module, self_us, cumulative_us in sorted(top_level, key=lambda row: -row[2])[: args.top]:
+        print(f"{module:<40}{self_us / 1000:>10.1f}{cumulative_us / 1000:>10.1f}")
+
+    timings = first_frame(env)
+    print()
+    print(f"import main:      {timings['import_ms']:8.1f} ms")
+    print(f"first frame:      {timings['first_frame_ms']:8.1f} ms")
+    print(f"process to frame: {timings['process_ms']:8.1f} ms (includes interpreter startup and exit)")
+
+    if args.budget_ms is not None and timings["first_frame_ms"] > args.budget_ms:
+        print(f"Over budget: {timings['first_frame_ms']:.1f} ms > {args.budget_ms:.1f} ms")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""Play many headless games with a scripted policy, one per seed, across all cores.
+
+Each game starts from the same config with a different seed, and a policy picks the player's
+actions until the player dies, gets stuck, or runs out of turns. Results are appended to the
+output file as each game finishes, so a long sweep can be watched while it runs. Running the
+same command again resumes it: seeds already in the output file are skipped.
+
+A policy is "random", "greedy", or "module:function" naming any function that takes the Engine
+and returns the player's next Action.
+
+The output is CSV, or JSON Lines if the file name ends in ".jsonl".
+
+`--benchmark` instead times one long game on a floor packed with monsters, to measure turns per second.
+
+Usage: python sweep.py --seeds 0-9999 --policy greedy --output sweep.csv
+       python sweep.py --seeds 0-999 --policy my_bots:cautious --set map_width=120 --workers 8
+       python sweep.py --benchmark --max-turns 5000 --monsters 300
+"""
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import csv
+import importlib
+import json
+import os
+import random
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union, TYPE_CHECKING
+
+import actions
+from components.ai import BaseAI
+from components.consumable import HealingConsumable
+import exceptions
+import input_handlers
+import settings
+import setup_game
+
+if TYPE_CHECKING:
+    from engine import Engine
+
+Policy = Callable[["Engine"], actions.Action]
+
+COLUMNS = ["seed", "policy", "outcome", "depth", "turns", "kills", "level", "cause_of_death", "wall_time"]
+
+# A game ends as "stuck" after this many impossible actions in a row.
+MAX_STALLS = 100
+
+DIRECTIONS = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+
+def random_walk(engine: Engine) -> actions.Action:
+    """Step or attack in a random direction, and take the stairs whenever standing on them."""
+    player = engine.player
+    if (player.x, player.y) == engine.game_map.downstairs_location:
+        return actions.TakeStairsAction(player)
+    return actions.BumpAction(player, *random.choice(DIRECTIONS))
+
+def greedy(engine: Engine) -> actions.Action:
+    """Drink a potion when badly hurt, fight the nearest monster in sight, and otherwise head for the stairs."""
+    player = engine.player
+    game_map = engine.game_map
+    if player.fighter.hp <= player.fighter.max_hp // 3:
+        for item in player.inventory.items:
+            if isinstance(item.consumable, HealingConsumable):
+                return actions.ItemAction(player, item)
+
+    enemies = [
+        actor for actor in game_map.actors
+        if actor is not player and game_map.visible[actor.x, actor.y]
+    ]
+    if enemies:
+        # Ties are broken by position, as the order of the actor set changes from run to run.
+        target = min(enemies, key=lambda actor: (player.distance(actor.x, actor.y), actor.y, actor.x))
+        if max(abs(target.x - player.x), abs(target.y - player.y)) <= 1:
+            return actions.MeleeAction(player, target.x - player.x, target.y - player.y)
+        destination = target.x, target.y
+    elif (player.x, player.y) == game_map.downstairs_location:
+        return actions.TakeStairsAction(player)
+    else:
+        destination = game_map.downstairs_location
+
+    path = BaseAI(player).get_path_to(*destination)
+    if not path:
+        return random_walk(engine)
+    x, y = path[0]
+    return actions.BumpAction(player, x - player.x, y - player.y)
+
+POLICIES: Dict[str, Policy] = {
+    "random": random_walk,
+    "greedy": greedy,
+}
+
+def load_policy(name: str) -> Policy:
+    """Return the policy called `name`, importing it if it is given as "module:function"."""
+    if name in POLICIES:
+        return POLICIES[name]
+    module_name, separator, function_name = name.partition(":")
+    if not separator:
+        raise ValueError(f"Unknown policy {name!r}, expected one of {', '.join(POLICIES)} or module:function.")
+    return getattr(importlib.import_module(module_name), function_name)
+
+def play(config: settings.Config, policy: Union[str, Policy], max_turns: int = 5000) -> Dict[str, Any]:
+    """Play one game with `policy` and return one row of results."""
+    from events import Attacked, Died
+
+    start = time.perf_counter()
+    policy_name = policy if isinstance(policy, str) else f"{policy.__module__}:{policy.__qualname__}"
+    row: Dict[str, Any] = {"seed": config.seed, "policy": policy_name, "cause_of_death": ""}
+    try:
+        choose = load_policy(policy) if isinstance(policy, str) else policy
+        engine = setup_game.new_game(config)
+        handler = input_handlers.EventHandler(engine)
+        player_id = engine.player.entity_id
+        kills = 0
+        last_attacker = ""
+
+        def track(event: Any) -> None:
+            nonlocal kills, last_attacker
+            if isinstance(event, Died) and event.entity != player_id:
+                kills += 1
+            elif isinstance(event, Attacked) and event.target == player_id:
+                last_attacker = next(
+                    (entity.name for entity in engine.game_map.entities if entity.entity_id == event.attacker), ""
+                )
+
+        engine.events.subscribe(track, Died, Attacked)
+
+        stalls = 0
+        while engine.player.is_alive and engine.turn < max_turns and stalls < MAX_STALLS:
+            if engine.player.level.requires_level_up:
+                engine.player.level.increase_stat("hp")
+            if handler.handle_action(choose(engine)):
+                stalls = 0
+            else:
+                stalls += 1
+
+        if not engine.player.is_alive:
+            row["outcome"] = "died"
+            row["cause_of_death"] = last_attacker or "unknown"
+        else:
+            row["outcome"] = "stuck" if stalls >= MAX_STALLS else "survived"
+        row.update(
+            depth=engine.game_world.current_floor,
+            turns=engine.turn,
+            kills=kills,
+            level=engine.player.level.current_level,
+        )
+    except Exception as exc:
+        # One broken game shouldn't end a sweep of thousands. It is recorded, so it can be replayed.
+        row.update(outcome="error", depth=0, turns=0, kills=0, level=0, cause_of_death=f"{type(exc).__name__}: {exc}")
+    row["wall_time"] = round(time.perf_counter() - start, 4)
+    return row
+
+class ResultWriter:
+    """Appends result rows to a CSV or JSON Lines file, flushing each one, so a sweep can be stopped at any time."""
+    def __init__(self, path: str):
+        self.path = path
+        self.json_lines = path.endswith(".jsonl")
+        self.completed = self._recover()
+        self.file = open(path, "a", encoding="utf-8", newline="")
+        self.csv_writer = csv.DictWriter(self.file, fieldnames=COLUMNS)
+        if not self.json_lines and self.file.tell() == 0:
+            self.csv_writer.writeheader()
+
+    def _recover(self) -> Set[str]:
+        """Return the seeds already written, after dropping a row left half written by a crash."""
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+        with open(self.path, "r", encoding="utf-8", newline="") as f:
+            if self.json_lines:
+                return {json.loads(line)["seed"] for line in f if line.strip()}
+            return {row["seed"] for row in csv.DictReader(f)}
+
+    def write(self, row: Dict[str, Any]) -> None:
+        if self.json_lines:
+            self.file.write(json.dumps({column: row[column] for column in COLUMNS}) + "\n")
+        else:
+            self.csv_writer.writerow(row)
+        self.file.flush()
+        self.completed.add(row["seed"])
+
+    def close(self) -> None:
+        self.file.close()
+
+def sweep(
+    config: settings.Config,
+    seeds: Iterable[str],
+    policy: Union[str, Policy],
+    max_turns: int = 5000,
+    workers: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Play a game for every seed in parallel across processes, yielding each row as its game finishes.
+    Only a few games per worker are queued at a time, so idle workers pick up the next seed as soon as
+    they finish, and a sweep of millions of seeds doesn't queue millions of tasks up front."""
+    seeds = iter(seeds)
+    queue_size = 4 * (workers or os.cpu_count() or 1)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: Set[concurrent.futures.Future] = set()
+        while True:
+            for seed in seeds:
+                pending.add(executor.submit(play, config._replace(seed=seed), policy, max_turns))
+                if len(pending) >= queue_size:
+                    break
+            if not pending:
+                return
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+def benchmark(config: settings.Config, turns: int, monsters: int) -> None:
+    """Play the same long game twice, with the player's random moves given as Action objects and then as
+    opcodes, and report turns per second. The player can't die, so the game lasts the whole run."""
+    import entity_factories
+    import numpy as np # type: ignore
+
+    moves = [(actions.Op.BUMP, dx, dy) for dx, dy in DIRECTIONS]
+
+    def run(use_ops: bool) -> Tuple[float, float, Tuple[Any, ...]]:
+        engine = setup_game.new_game(config)
+        game_map = engine.game_map
+        free = [
+            (int(x), int(y)) for x, y in np.argwhere(game_map.walkable)
+            if not game_map.get_blocking_entity_at_location(x, y)
+        ]
+        for x, y in random.sample(free, min(monsters, len(free))):
+            entity_factories.orc.spawn(game_map, x, y)
+        player = engine.player
+        player.fighter.max_hp = player.fighter._hp = 10 ** 9
+
+        acting = 0.0
+        start = time.perf_counter()
+        while engine.turn < turns:
+            op, dx, dy = random.choice(moves)
+            action_start = time.perf_counter()
+            try:
+                if use_ops:
+                    actions.perform_op(engine, player, op, dx, dy)
+                else:
+                    actions.BumpAction(player, dx, dy).perform()
+            except exceptions.Impossible:
+                continue
+            finally:
+                acting += time.perf_counter() - action_start
+            engine.handle_enemy_turns()
+            engine.update_fov()
+            engine.end_turn()
+        elapsed = time.perf_counter() - start
+        outcome = (player.x, player.y, player.fighter.hp, len(game_map.entities), len(engine.message_log.messages))
+        return turns / elapsed, acting / turns, outcome
+
+    objects_rate, objects_acting, objects_outcome = run(use_ops=False)
+    ops_rate, ops_acting, ops_outcome = run(use_ops=True)
+    if objects_outcome != ops_outcome:
+        raise AssertionError("Opcodes and Action objects played different games.")
+    print(f"turns:                   {turns}, with {monsters} extra monsters")
+    print(f"Action objects:          {objects_rate:.0f} turns/s, {objects_acting * 1e6:.1f} us per player action")
+    print(f"opcodes:                 {ops_rate:.0f} turns/s, {ops_acting * 1e6:.1f} us per player action")
+
+def parse_seeds(text: str) -> List[str]:
+    """Parse "7", "0-9999" or "a,b,c" into a list of seeds."""
+    seeds: List[str] = []
+    for part in text.split(","):
+        first, dash, last = part.partition("-")
+        if dash and first.isdigit() and last.isdigit():
+            seeds.extend(str(seed) for seed in range(int(first), int(last) + 1))
+        else:
+            seeds.append(part)
+    return seeds
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seeds", default="0-999", help="Seeds to play, such as 0-9999 or a,b,c.")
+    parser.add_argument("--policy", default="greedy", help=f"One of {', '.join(POLICIES)}, or module:function.")
+    parser.add_argument("--output", default="sweep.csv", help="The results file, CSV or .jsonl.")
+    parser.add_argument("--max-turns", type=int, default=5000, help="End each game after this many turns.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores).")
+    parser.add_argument("--benchmark", action="store_true", help="Time one long game instead of sweeping.")
+    parser.add_argument("--monsters", type=int, default=200, help="Extra monsters for --benchmark.")
+    settings.add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        config = settings.config_from_args(args)
+        benchmark(config._replace(seed=config.seed or "benchmark"), args.max_turns, args.monsters)
+        return
+
+    try:
+        load_policy(args.policy) # Fail now, rather than once per game in the workers.
+    except (ImportError, AttributeError, ValueError) as exc:
+        parser.error(str(exc))
+    config = settings.config_from_args(args)
+    writer = ResultWriter(args.output)
+    seeds = [seed for seed in parse_seeds(args.seeds) if seed not in writer.completed]
+    if len(writer.completed):
+        print(f"Resuming: {len(writer.completed)} games already in {args.output}, {len(seeds)} to go.")
+
+    start = time.perf_counter()
+    try:
+        for finished, row in enumerate(sweep(config, seeds, args.policy, args.max_turns, args.workers), 1):
+            writer.write(row)
+            if finished % 100 == 0 or finished == len(seeds):
+                elapsed = time.perf_counter() - start
+                print(f"{finished}/{len(seeds)} games, {finished / elapsed:.1f} games/s")
+    finally:
+        writer.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import numpy as np # type: ignore
+import pytest
+
+from chunked_grid import ChunkedGrid, PackedBoolGrid
+
+SHAPE = (37, 29) # Not a multiple of the chunk size, so the last chunks are partial.
+FILL = {"chunked": 3, "packed": False}
+
+def make_dense(kind, seed=0):
+    """A dense array with a blank corner, so some chunks are never allocated."""
+    rng = np.random.default_rng(seed)
+    if kind == "packed":
+        dense = rng.random(SHAPE) < 0.3
+    else:
+        dense = rng.integers(0, 6, SHAPE).astype(np.uint8)
+    dense[:16, :16] = FILL[kind]
+    return dense
+
+def make_grid(kind, dense):
+    if kind == "packed":
+        grid = PackedBoolGrid(dense.shape, chunk_size=8)
+    else:
+        grid = ChunkedGrid(dense.shape, dense.dtype, fill=FILL[kind], chunk_size=8)
+    grid[:] = dense
+    return grid
+
+@pytest.fixture(params=["chunked", "packed"])
+def kind(request):
+    return request.param
+
+def test_dense_copy(kind):
+    dense = make_dense(kind)
+    grid = make_grid(kind, dense)
+    np.testing.assert_array_equal(np.asarray(grid), dense)
+    np.testing.assert_array_equal(grid[...], dense)
+    assert (0, 0) not in grid.chunks
+
+@pytest.mark.parametrize("key", [
+    (slice(3, 20), slice(5, 28)),
+    (slice(None), slice(7, 8)),
+    (slice(-10, None), slice(None, -3)),
+    (slice(30, 80), slice(20, 40)), # Clipped like numpy.
+    (slice(10, 5), slice(None)), # Empty.
+])
+def test_get_slices(kind, key):
+    dense = make_dense(kind)
+    np.testing.assert_array_equal(make_grid(kind, dense)[key], dense[key])
+
+def test_get_cells_and_arrays(kind):
+    dense = make_dense(kind)
+    grid = make_grid(kind, dense)
+    for x in range(SHAPE[0]):
+        for y in range(SHAPE[1]):
+            assert grid[x, y] == dense[x, y]
+    rng = np.random.default_rng(1)
+    xs, ys = rng.integers(0, SHAPE[0], (5, 7)), rng.integers(0, SHAPE[1], (5, 7))
+    np.testing.assert_array_equal(grid[xs, ys], dense[xs, ys])
+    np.testing.assert_array_equal(grid[xs[:, :1], ys[:1, :]], dense[xs[:, :1], ys[:1, :]]) # Broadcast.
+    mask = rng.random(SHAPE) < 0.2
+    np.testing.assert_array_equal(grid[mask], dense[mask])
+
+def test_set_matches_numpy(kind):
+    dense = make_dense(kind)
+    grid = make_grid(kind, dense)
+    other = make_dense(kind, seed=2)
+    rng = np.random.default_rng(3)
+    xs, ys = rng.integers(0, SHAPE[0], 40), rng.integers(0, SHAPE[1], 40)
+    mask = rng.random(SHAPE) < 0.2
+    for key, value in [
+        ((4, 1), other[0, 0]),
+        ((slice(5, 22), slice(1, 17)), other[5:22, 1:17]),
+        ((slice(20, None), slice(None)), other[0, 1]), # A scalar fills the slice.
+        ((xs, ys), other[xs, ys]),
+        (mask, other[mask]),
+    ]:
+        grid[key] = value
+        dense[key] = value
+        np.testing.assert_array_equal(np.asarray(grid), dense)
+
+def test_fork_is_copy_on_write(kind):
+    dense = make_dense(kind)
+    grid = make_grid(kind, dense)
+    fork = grid.fork()
+    fork[20, 20] = not dense[20, 20] if kind == "packed" else dense[20, 20] + 1
+    fork[:8, :8] = make_dense(kind, seed=4)[:8, :8]
+    np.testing.assert_array_equal(np.asarray(grid), dense)
+    assert fork[20, 20] != grid[20, 20]
+
+def test_page_out(kind, tmp_path):
+    dense = make_dense(kind)
+    grid = make_grid(kind, dense)
+    assert grid.page_out(str(tmp_path)) == len(grid.chunks)
+    np.testing.assert_array_equal(np.asarray(grid), dense)
+    grid[1:30, 2:9] = dense[1:30, 2:9][::-1]
+    dense[1:30, 2:9] = dense[1:30, 2:9][::-1].copy()
+    np.testing.assert_array_equal(np.asarray(grid), dense)
+
+def test_bad_keys(kind):
+    grid = make_grid(kind, make_dense(kind))
+    with pytest.raises(IndexError):
+        grid[SHAPE[0], 0]
+    with pytest.raises(IndexError):
+        grid[np.array([0, -1]), np.array([0, 0])]
+    with pytest.raises(IndexError):
+        grid[np.zeros((3, 3), dtype=bool)]
+    with pytest.raises(IndexError):
+        grid[::2, :]
+    with pytest.raises(IndexError):
+        grid[:, np.arange(3)]
+    with pytest.raises(TypeError):
+        grid["walkable"]
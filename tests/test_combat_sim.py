@@ -0,0 +1,32 @@
+import pytest
+
+import combat_sim
+
+@pytest.mark.parametrize("floor", [1, 3, 6])
+def test_simulator_matches_arena_fights(floor):
+    """The vectorized model agrees with the same fights played by the game's own code."""
+    (row,) = combat_sim.calibrate([floor], trials=120)
+    assert row["win_rate_sim"] == pytest.approx(row["win_rate_arena"], abs=0.12)
+    assert row["hp_lost_mean_sim"] == pytest.approx(row["hp_lost_mean_arena"], abs=3)
+    assert row["turns_mean_sim"] == pytest.approx(row["turns_mean_arena"], rel=0.15)
+
+def test_parameters_are_written_into_the_templates():
+    parameters = combat_sim.default_parameters()
+    assert parameters["health_potion_amount"] == combat_sim.entity_factories.health_potion.consumable.amount
+    parameters.update(health_potion_amount=9, fireball_scroll_radius=1, player_power=7, orc_hp=3)
+    templates = combat_sim.build_templates(parameters)
+    assert templates.items["health_potion"].consumable.amount == 9
+    assert templates.items["fireball_scroll"].consumable.radius == 1
+    assert templates.player.fighter.power == 7
+    assert templates.monsters["orc"].fighter.max_hp == 3
+    assert combat_sim.entity_factories.health_potion.consumable.amount != 9 # The real templates are untouched.
+
+def test_harmless_monsters_never_win():
+    result = combat_sim.simulate_floor(5, 1000, {"orc_power": 0, "troll_power": 0}, seed=0)
+    assert result.win_rate == 1
+    assert not result.hp_lost.any()
+
+def test_better_potions_help():
+    weak = combat_sim.simulate_floor(3, 5000, {"health_potion_amount": 1}, seed=0)
+    strong = combat_sim.simulate_floor(3, 5000, {"health_potion_amount": 20}, seed=0)
+    assert strong.win_rate > weak.win_rate
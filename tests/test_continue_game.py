@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+import exceptions
+import input_handlers
+import setup_game
+from actions import MovementAction
+from events import EventJournal
+from settings import Config
+
+SAVE = "savegame.sav"
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    """A journaled and recorded game, saved before it takes a step."""
+    monkeypatch.chdir(tmp_path)
+    engine = setup_game.start_recording(setup_game.start_journal(setup_game.new_game(Config(seed="0"))))
+    engine.save_as(SAVE)
+    os.utime(SAVE, (0, 0)) # Older than anything the journal writes.
+    yield engine
+    engine.recorder.close()
+
+def step(engine):
+    """Move the player to a free neighbouring tile, and return where it went."""
+    player = engine.player
+    for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, -1), (1, -1), (-1, 1)):
+        x, y = player.x + dx, player.y + dy
+        if engine.game_map.walkable[x, y] and not engine.game_map.get_blocking_entity_at_location(x, y):
+            input_handlers.EventHandler(engine).handle_action(MovementAction(player, dx, dy))
+            return x, y
+    pytest.fail("The player is boxed in.")
+
+def test_newer_live_journal_is_recovered(engine):
+    position = step(engine)
+    recovered = setup_game.continue_game(SAVE)
+    assert (recovered.player.x, recovered.player.y) == position
+    assert "Recovered the game from its journal." in [m.plain_text for m in recovered.message_log.messages]
+    recovered.recorder.close()
+
+def test_death_discards_the_journal(engine):
+    step(engine)
+    engine.player.fighter.hp = 0
+    assert not engine.player.is_alive
+    assert not EventJournal(setup_game.JOURNAL_DIRECTORY).exists()
+    
+    # The older save is loaded, not the finished game.
+    loaded = setup_game.continue_game(SAVE)
+    assert loaded.player.is_alive
+    assert "Recovered the game from its journal." not in [m.plain_text for m in loaded.message_log.messages]
+    loaded.recorder.close()
+
+def test_finished_game_is_not_continued(engine):
+    step(engine)
+    engine.player.fighter.hp = 0
+    with pytest.raises(exceptions.QuitWithoutSaving):
+        input_handlers.GameOverEventHandler(engine).on_quit()
+    with pytest.raises(FileNotFoundError):
+        setup_game.continue_game(SAVE)
+
+def test_journal_without_save_is_not_continued(engine):
+    step(engine)
+    os.remove(SAVE)
+    with pytest.raises(FileNotFoundError):
+        setup_game.continue_game(SAVE)
@@ -0,0 +1,73 @@
+import numpy as np # type: ignore
+import pytest
+
+from frame_codec import CELL_DTYPE, FLAG_KEYFRAME, FLAG_WIDE, HEADER, FrameDecoder, FrameEncoder
+
+def random_frames(shape, count, seed=0):
+    """A sequence of frames, each changing a few cells and a horizontal run of the one before."""
+    rng = np.random.default_rng(seed)
+    frame = np.zeros(shape, dtype=CELL_DTYPE)
+    frame["ch"] = ord(" ")
+    frames = []
+    for _ in range(count):
+        frame = frame.copy()
+        for _ in range(rng.integers(0, 20)):
+            y, x = rng.integers(shape[0]), rng.integers(shape[1])
+            frame[y, x]["ch"] = rng.integers(32, 127)
+            frame[y, x]["fg"] = rng.integers(0, 256, 3)
+        y, x = rng.integers(shape[0]), rng.integers(shape[1])
+        frame[y, x : x + 10]["bg"] = rng.integers(0, 256, 3) # A run of identical cells.
+        frames.append(frame)
+    return frames
+
+def flags(data):
+    return HEADER.unpack_from(data)[4]
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_round_trip(compress):
+    encoder, decoder = FrameEncoder(compress=compress), FrameDecoder()
+    for frame in random_frames((50, 80), 30):
+        np.testing.assert_array_equal(decoder.decode(encoder.encode(frame)), frame)
+
+def test_unchanged_frame_has_no_runs():
+    encoder = FrameEncoder()
+    frame = random_frames((10, 10), 1)[0]
+    encoder.encode(frame)
+    assert HEADER.unpack_from(encoder.encode(frame))[3] == 0
+
+def test_keyframe_interval():
+    encoder = FrameEncoder(keyframe_interval=4)
+    encoded = [encoder.encode(frame) for frame in random_frames((20, 30), 10)]
+    assert [bool(flags(data) & FLAG_KEYFRAME) for data in encoded] == [i % 4 == 0 for i in range(10)]
+
+def test_decoder_joins_at_a_keyframe():
+    frames = random_frames((20, 30), 10)
+    encoder = FrameEncoder(keyframe_interval=4)
+    encoded = [encoder.encode(frame) for frame in frames]
+    decoder = FrameDecoder()
+    with pytest.raises(ValueError):
+        decoder.decode(encoded[1])
+    for frame, data in zip(frames[4:], encoded[4:]):
+        np.testing.assert_array_equal(decoder.decode(data), frame)
+
+def test_forced_keyframe_and_resize():
+    encoder, decoder = FrameEncoder(), FrameDecoder()
+    small, large = random_frames((10, 10), 2), random_frames((12, 15), 1)
+    decoder.decode(encoder.encode(small[0]))
+    forced = encoder.encode(small[1], keyframe=True)
+    assert flags(forced) & FLAG_KEYFRAME
+    np.testing.assert_array_equal(decoder.decode(forced), small[1])
+    resized = encoder.encode(large[0]) # A new size always starts a keyframe.
+    assert flags(resized) & FLAG_KEYFRAME
+    np.testing.assert_array_equal(decoder.decode(resized), large[0])
+
+def test_wide_frames():
+    encoder, decoder = FrameEncoder(), FrameDecoder()
+    for frame in random_frames((300, 300), 3):
+        data = encoder.encode(frame)
+        assert flags(data) & FLAG_WIDE
+        np.testing.assert_array_equal(decoder.decode(data), frame)
+
+def test_rejects_other_data():
+    with pytest.raises(ValueError):
+        FrameDecoder().decode(HEADER.pack(b"XXXX", 1, 1, 0, FLAG_KEYFRAME))
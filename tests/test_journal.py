@@ -0,0 +1,73 @@
+import json
+import os
+
+import pytest
+
+import input_handlers
+import setup_game
+from events import EventJournal, recover
+from settings import Config
+from sweep import greedy
+
+def digest(engine):
+    return (
+        engine.turn,
+        engine.player.x,
+        engine.player.y,
+        engine.player.fighter.hp,
+        sorted(
+            (entity.name, entity.x, entity.y, getattr(getattr(entity, "fighter", None), "hp", None))
+            for entity in engine.game_map.entities
+        ),
+    )
+
+@pytest.fixture
+def journaled(tmp_path):
+    """A journaled game, and its digest when the journal started."""
+    engine = setup_game.new_game(Config(seed="journal"))
+    journal = EventJournal(str(tmp_path))
+    journal.attach(engine)
+    yield engine, journal, digest(engine)
+    journal.detach()
+
+def play(engine, turns):
+    handler = input_handlers.EventHandler(engine)
+    floor = engine.game_world.current_floor
+    for _ in range(turns):
+        handler.handle_action(greedy(engine))
+        assert engine.player.is_alive and engine.game_world.current_floor == floor
+
+def test_recover_matches_the_game(journaled):
+    engine, journal, _ = journaled
+    play(engine, 20)
+    assert digest(recover(journal.directory)) == digest(engine)
+
+def test_recover_ignores_a_torn_last_line(journaled):
+    engine, journal, _ = journaled
+    play(engine, 10)
+    expected = digest(engine)
+    complete = os.path.getsize(journal.log_path)
+    play(engine, 1)
+    assert os.path.getsize(journal.log_path) > complete + 5
+    with open(journal.log_path, "r+") as f:
+        f.truncate(complete + 5) # The next turn's first event was cut off.
+    assert digest(recover(journal.directory)) == expected
+
+def test_recover_ignores_a_log_of_another_generation(journaled):
+    engine, journal, started = journaled
+    play(engine, 10)
+    with open(journal.log_path) as f:
+        lines = f.readlines()
+    assert json.loads(lines[0]) == {"generation": journal.generation}
+    lines[0] = json.dumps({"generation": "older"}) + "\n"
+    with open(journal.log_path, "w") as f:
+        f.writelines(lines)
+    assert len(lines) > 1
+    assert digest(recover(journal.directory)) == started # Only the snapshot is used.
+
+def test_recover_without_a_log(journaled):
+    engine, journal, started = journaled
+    play(engine, 5)
+    journal.detach()
+    os.remove(journal.log_path)
+    assert digest(recover(journal.directory)) == started
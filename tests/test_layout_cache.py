@@ -0,0 +1,41 @@
+import os
+import random
+
+import numpy as np # type: ignore
+
+import procgen
+from layout_cache import LayoutCache
+
+PARAMS = {"max_rooms": 10, "room_min_size": 6, "room_max_size": 10, "map_width": 60, "map_height": 40}
+
+def other_generator(rng, **params):
+    return procgen.generate_rooms_and_corridors(random.Random(1), **params)
+
+def test_key_depends_on_generator_source():
+    generate = procgen.map_generators["rooms_and_corridors"]
+    key = LayoutCache.key("rooms_and_corridors", generate, PARAMS, "seed", 1)
+    assert key == LayoutCache.key("rooms_and_corridors", generate, PARAMS, "seed", 1)
+    assert key != LayoutCache.key("rooms_and_corridors", other_generator, PARAMS, "seed", 1)
+    assert key != LayoutCache.key("rooms_and_corridors", generate, PARAMS, "seed", 2)
+
+def test_cache_is_off_by_default():
+    assert procgen.layout_cache is None
+
+def test_cached_layout_matches_generated(tmp_path, monkeypatch):
+    generated = procgen.get_layout("rooms_and_corridors", PARAMS, "seed", 1)
+    monkeypatch.setattr(procgen, "layout_cache", LayoutCache(str(tmp_path)))
+    stored = procgen.get_layout("rooms_and_corridors", PARAMS, "seed", 1)
+    loaded = procgen.get_layout("rooms_and_corridors", PARAMS, "seed", 1)
+    for layout in (stored, loaded):
+        np.testing.assert_array_equal(layout.tiles, generated.tiles)
+        assert layout.player_start == generated.player_start
+        assert layout.downstairs_location == generated.downstairs_location
+
+def test_store_evicts_least_recently_used(tmp_path):
+    cache = LayoutCache(str(tmp_path), max_entries=3)
+    keys = [f"{i:02x}" * 32 for i in range(5)]
+    for age, key in enumerate(keys):
+        cache.store(key, {"a": np.arange(3)})
+        os.utime(cache.path(key), (age, age))
+    assert cache.load(keys[0]) is None and cache.load(keys[1]) is None
+    assert all(cache.load(key) is not None for key in keys[2:])
@@ -0,0 +1,47 @@
+import numpy as np # type: ignore
+import pytest
+
+import setup_game
+from settings import Config
+
+RADIUS = 8
+
+@pytest.fixture(params=["0", "1", "2", "3", "4"])
+def game_map(request):
+    return setup_game.new_game(Config(seed=request.param)).game_map
+
+def cells_around(x, y, radius):
+    """Every cell in the square around (x, y), including ones off the map."""
+    xs, ys = np.mgrid[x - radius - 1 : x + radius + 2, y - radius - 1 : y + radius + 2]
+    return np.stack([xs.ravel(), ys.ravel()], axis=1)
+
+def test_can_see_matches_the_fov(game_map):
+    los = game_map.line_of_sight
+    origins = np.argwhere(game_map.walkable)[::97]
+    for x, y in origins.tolist():
+        targets = cells_around(x, y, RADIUS)
+        expected = los.visible_from((x, y), RADIUS).visible(targets[:, 0], targets[:, 1])
+        seen = los.can_see(np.tile([x, y], (len(targets), 1)), targets, RADIUS)
+        np.testing.assert_array_equal(seen, expected)
+        assert seen.any() # An origin always sees itself.
+
+def test_can_see_groups_mixed_origins(game_map):
+    los = game_map.line_of_sight
+    rng = np.random.default_rng(0)
+    floor = np.argwhere(game_map.walkable)
+    origins = floor[rng.integers(len(floor), size=500)]
+    targets = origins + rng.integers(-RADIUS - 1, RADIUS + 2, size=origins.shape)
+    expected = [
+        bool(los.visible_from((ox, oy), RADIUS).visible(tx, ty))
+        for (ox, oy), (tx, ty) in zip(origins.tolist(), targets.tolist())
+    ]
+    assert los.can_see(origins, targets, RADIUS).tolist() == expected
+
+def test_can_see_stops_at_the_radius(game_map):
+    los = game_map.line_of_sight
+    x, y = map(int, np.argwhere(game_map.walkable)[0])
+    targets = np.array([[x + RADIUS + 1, y], [x, y + RADIUS + 1], [x - RADIUS - 1, y - RADIUS - 1]])
+    assert not los.can_see(np.tile([x, y], (3, 1)), targets, RADIUS).any()
+
+def test_can_see_nothing(game_map):
+    assert game_map.line_of_sight.can_see(np.empty((0, 2)), np.empty((0, 2)), RADIUS).shape == (0,)
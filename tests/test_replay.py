@@ -0,0 +1,102 @@
+import random
+
+import pytest
+
+import actions
+import input_handlers
+import replay
+import setup_game
+from settings import Config
+
+CHUNK_SIZE = 16
+KEYFRAME_INTERVAL = 64
+STEPS = 300
+
+def digest(engine):
+    """Enough of a game's state to tell two games apart."""
+    return (
+        engine.game_world.current_floor,
+        engine.turn,
+        engine.player.x,
+        engine.player.y,
+        engine.player.fighter.hp,
+        len(engine.message_log.messages),
+        sorted((entity.name, entity.x, entity.y) for entity in engine.game_map.entities),
+        hash(random.getstate()),
+    )
+
+def record(path, steps, immortal):
+    """Record a game of random inputs, and return the live game's digest before every step.
+    An immortal player lives long enough to cross keyframes, but its game has to start from one."""
+    config = Config(seed="replay")
+    engine = setup_game.new_game(config)
+    if immortal:
+        engine.player.fighter.max_hp = engine.player.fighter._hp = 10 ** 6
+    engine.recorder = replay.SessionRecorder(
+        path,
+        engine,
+        {"config": config._asdict()},
+        chunk_size=CHUNK_SIZE,
+        keyframe_interval=KEYFRAME_INTERVAL,
+        initial_keyframe=immortal,
+    )
+    handler = input_handlers.EventHandler(engine)
+    rng = random.Random(0)
+    digests = {}
+    while engine.recorder.step < steps and engine.player.is_alive:
+        digests[engine.recorder.step] = digest(engine)
+        player = engine.player
+        if player.level.requires_level_up:
+            stat = rng.choice(["hp", "power", "defense"])
+            engine.record({"type": "level_up", "stat": stat})
+            player.level.increase_stat(stat)
+        elif (player.x, player.y) == engine.game_map.downstairs_location:
+            handler.handle_action(actions.TakeStairsAction(player))
+        elif rng.random() < 0.05:
+            handler.handle_action(actions.PickupAction(player))
+        else:
+            handler.handle_action(actions.BumpAction(player, rng.choice([-1, 0, 1]), rng.choice([-1, 0, 1])))
+    digests[engine.recorder.step] = digest(engine)
+    engine.recorder.close()
+    return digests
+
+@pytest.fixture(scope="module")
+def recording(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("replays") / "session.rpl")
+    return path, record(path, STEPS, immortal=True)
+
+def test_index(recording):
+    path, _ = recording
+    reader = replay.ReplayReader(path)
+    assert reader.steps == STEPS
+    assert [block.first_step for block in reader.keyframes] == list(range(0, STEPS, KEYFRAME_INTERVAL))
+    assert sum(block.count for block in reader.actions) == STEPS
+
+@pytest.mark.parametrize("step", [0, 1, 37, KEYFRAME_INTERVAL, KEYFRAME_INTERVAL + 1, 2 * KEYFRAME_INTERVAL, 250, STEPS])
+def test_seek_matches_the_live_game(recording, step):
+    path, digests = recording
+    assert digest(replay.ReplayReader(path).seek(step)) == digests[step]
+
+def test_seek_replays_from_the_seed(tmp_path):
+    path = str(tmp_path / "session.rpl")
+    digests = record(path, 40, immortal=False)
+    reader = replay.ReplayReader(path)
+    assert not reader.keyframes
+    for step in (0, 17, reader.steps):
+        assert digest(reader.seek(step)) == digests[step]
+
+def test_index_is_rebuilt_after_truncation(recording, tmp_path):
+    path, digests = recording
+    reader = replay.ReplayReader(path)
+    cut_block = reader.actions[10]
+    truncated = str(tmp_path / "truncated.rpl")
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(truncated, "wb") as f:
+        f.write(data[: cut_block.offset + cut_block.length // 2]) # Cut in the middle of a block.
+    
+    rebuilt = replay.ReplayReader(truncated)
+    assert rebuilt.blocks == [block for block in reader.blocks if block.offset < cut_block.offset]
+    assert rebuilt.steps == cut_block.first_step
+    assert digest(rebuilt.seek(rebuilt.steps)) == digests[rebuilt.steps]
+    assert digest(rebuilt.seek(rebuilt.steps + 100)) == digests[rebuilt.steps] # Seeking stops at the end.
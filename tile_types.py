@@ -1,4 +1,4 @@
-from typing import Tuple
+from typing import List, Tuple
 
 import numpy as np # type: ignore
 
@@ -11,7 +11,7 @@ graphic_dt = np.dtype(
     ]
 )
 
-# Tile struct used for statically defined tile data.
+# Tile struct used for the palette of tile types.
 tile_dt = np.dtype(
     [
         ("walkable", np.bool), # True if this tile can be walked over.
@@ -22,36 +22,74 @@ tile_dt = np.dtype(
 )
 
 
+# Every tile type, indexed by tile id. Maps store a uint8 tile id per cell, and everything
+# else (walkability, transparency, graphics) is looked up from this table.
+tile_definitions: List[Tuple[int, int, Tuple, Tuple]] = []
+
 def new_tile(
     *, # Enforce the use of keywords, so that parameter order doesn't matter.
     walkable: int,
     transparent: int,
     dark: Tuple[int, Tuple[int, int, int], Tuple[int, int, int]],
     light: Tuple[int, Tuple[int, int, int], Tuple[int, int, int]],
-) -> np.ndarray:
-    """Helper function for defining individual tile types """
-    return np.array((walkable, transparent, dark, light), dtype=tile_dt)
+) -> int:
+    """Helper function for defining individual tile types.
+    Returns the id of the new tile type."""
+    tile_definitions.append((walkable, transparent, dark, light))
+    return len(tile_definitions) - 1
     
 # SHROUD represents unexplored, unseen tiles
 SHROUD = np.array((ord(" "), (255, 255, 255), (0, 0, 0)), dtype=graphic_dt)
 
 
-floor = new_tile(
-    walkable=True,
-    transparent=True,
-    dark=(ord("."), (110, 110, 110), (0, 0, 0)),
-    light=(ord("."), (255, 255, 255), (0, 0, 0)),
-)
 wall = new_tile(
     walkable=False,
     transparent=False,
     dark=(ord(" "), (110, 110, 110), (0, 0, 0)),
     light=(ord(" "), (255, 255, 255), (0, 0, 0)),
 )
+floor = new_tile(
+    walkable=True,
+    transparent=True,
+    dark=(ord("."), (110, 110, 110), (0, 0, 0)),
+    light=(ord("."), (255, 255, 255), (0, 0, 0)),
+)
 
 down_stairs = new_tile(
     walkable=True,
     transparent=True,
     dark=(ord(">"), (110, 110, 110), (0, 0, 0)),
     light=(ord(">"), (255, 255, 255), (0, 0, 0)),
-)
\ No newline at end of file
+)
+
+up_stairs = new_tile(
+    walkable=True,
+    transparent=True,
+    dark=(ord("<"), (110, 110, 110), (0, 0, 0)),
+    light=(ord("<"), (255, 255, 255), (0, 0, 0)),
+)
+
+palette = np.array(tile_definitions, dtype=tile_dt)
+
+def ids_from_tiles(tiles: np.ndarray) -> np.ndarray:
+    """Return the tile id of every tile in an array of tile_dt structs, as a uint8 array.
+    Maps were stored that way before tile ids. Tiles missing from the palette become walls."""
+    ids = np.full(tiles.shape, wall, dtype=np.uint8, order="F")
+    for tile_id, tile in enumerate(palette.astype(tiles.dtype)):
+        ids[tiles == tile] = tile_id
+    return ids
+
+# Lookup tables derived from the palette, indexed by tile id.
+walkable = palette["walkable"]
+transparent = palette["transparent"]
+
+# Graphics indexed by [light_level, tile id], where the light level is
+# `visible << 1 | explored`: 0 is unexplored, 1 is explored and 2 or 3 is visible.
+graphics = np.stack(
+    [
+        np.full(len(palette), SHROUD, dtype=graphic_dt),
+        palette["dark"],
+        palette["light"],
+        palette["light"],
+    ]
+)